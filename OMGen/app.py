@@ -1,20 +1,47 @@
-from flask import Flask, render_template, request, send_file, jsonify
+import time
+_import_started = time.perf_counter()
+
+from flask import Flask, render_template, request, send_file, jsonify, make_response, Response, abort, url_for
+import io
 import os
+import json
+import shutil
 import tempfile
 import zipfile
-from io import BytesIO
+import mimetypes
+from urllib.parse import quote
 from utils.pdf_utils import (
-    generate_cover_page,
-    extract_items_from_sales_order,
+    load_cover_template,
+    render_cover_page,
     match_templates,
-    merge_pdfs,
     find_warranty_documents,
-    fill_gutter_maintenance_doc,
+    plan_section_layout,
+    get_pdf_metadata,
+    toc_page_count,
+    FLATTEN_FORMS,
+)
+from utils.manual_builder import (
+    build_manual,
+    parse_filters_data,
+    parse_template_mappings,
+    parse_gutter_data,
+    parse_flatten_option,
+    extract_keywords,
+    add_required_documents,
+    filter_job_files,
 )
 from utils.excel_utils import extract_job_metadata
+from utils import metrics
+from utils import doc_library
+from utils import shared_library
+from utils import housekeeping
+from utils import previews
+from utils import startup
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 import logging
-import fitz  # PyMuPDF for thumbnails
+
+fitz = startup.lazy_module('fitz')  # PyMuPDF for thumbnails, imported on first use
 
 # Configure logging
 logging.basicConfig(level=logging.INFO,
@@ -31,388 +58,460 @@ MAINTENANCE_DOCS = os.path.join(BASE_DIR, 'maintenance_docs')
 WARRANTY_DOCS = os.path.join(BASE_DIR, 'warranty_docs')
 OUTPUT_FOLDER = os.path.join(BASE_DIR, 'output')
 
-# Create necessary directories
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(TEMPLATE_FOLDER, exist_ok=True)
-os.makedirs(MAINTENANCE_DOCS, exist_ok=True)
-os.makedirs(WARRANTY_DOCS, exist_ok=True)
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+# Hand file downloads to the front-end server instead of streaming them from Python:
+# OMGEN_USE_X_SENDFILE=1 sends X-Sendfile (Apache/lighttpd); OMGEN_ACCEL_REDIRECT_PREFIX
+# names an nginx internal location aliased to the output folder (X-Accel-Redirect).
+app.config['USE_X_SENDFILE'] = os.environ.get('OMGEN_USE_X_SENDFILE', '0') == '1'
+ACCEL_REDIRECT_PREFIX = os.environ.get('OMGEN_ACCEL_REDIRECT_PREFIX', '')
+# Chunk size used when streaming zip archives
+ZIP_CHUNK_SIZE = 1024 * 1024
+METRICS_FOLDER = os.path.join(OUTPUT_FOLDER, 'metrics')
+
 THUMBNAIL_FOLDER = os.path.join(TEMPLATE_FOLDER, '.thumbnails')
-os.makedirs(THUMBNAIL_FOLDER, exist_ok=True)
 
-logger.info(f"Template folder: {TEMPLATE_FOLDER}")
-logger.info(f"Maintenance docs folder: {MAINTENANCE_DOCS}")
+# Modules imported up front by warm_up(); everything else heavy stays lazy
+WARM_UP_MODULES = ('fitz', 'PyPDF2', 'reportlab.pdfgen.canvas', 'reportlab.lib.pagesizes')
 
-def clear_upload_folder():
+def warm_up():
     """
-    Clear all files from the upload folder to prevent bloating and overlapping documents.
+    Do the startup work builds depend on, once per process. gunicorn.conf.py runs it in
+    the master before workers fork, otherwise the first request does. Timings are
+    served at /metrics/startup.
     """
-    logger.info("Clearing upload folder...")
-    for filename in os.listdir(UPLOAD_FOLDER):
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
+    startup.run_once(_warm_up)
+
+def _warm_up():
+    with startup.step('imports'):
+        startup.import_modules(WARM_UP_MODULES)
+
+    with startup.step('directories'):
+        for folder in (UPLOAD_FOLDER, TEMPLATE_FOLDER, MAINTENANCE_DOCS, WARRANTY_DOCS, OUTPUT_FOLDER, THUMBNAIL_FOLDER):
+            os.makedirs(folder, exist_ok=True)
+
+    # Normalize the static document library in the background (OMGEN_INGEST_LIBRARY=0 to skip);
+    # merges fall back to the original files until it has finished. In preload mode the
+    # library is ingested and memory-mapped up front so forked workers share the mappings.
+    with startup.step('document_library'):
+        if shared_library.PRELOAD_LIBRARY:
+            doc_library.ingest()
+            shared_library.preload()
+        else:
+            # Load the catalog of the last ingestion so warm builds use it straight away
+            catalogued = sum(1 for _ in doc_library.documents())
+            logger.info(f"Document catalog has {catalogued} current documents")
+            if os.environ.get('OMGEN_INGEST_LIBRARY', '1') == '1':
+                doc_library.start_background_ingest()
+
+    # Read the cover template and resolve its fonts once, before workers fork
+    with startup.step('cover_template'):
         try:
-            if os.path.isfile(file_path):
-                os.unlink(file_path)
-            elif os.path.isdir(file_path):
-                import shutil
-                shutil.rmtree(file_path)
-            logger.info(f"Removed {file_path}")
-        except Exception as e:
-            logger.error(f"Error while deleting {file_path}: {e}")
+            load_cover_template()
+        except FileNotFoundError:
+            logger.error("Cover Sheet Template.pdf is missing; builds will fail until it is restored")
 
-@app.route('/', methods=['GET', 'POST'])
-def index():
-    if request.method == 'POST':
-        # Clear upload folder before processing new files
-        clear_upload_folder()
-        customer = request.form['customer']
-        job_name = request.form['job_name']
-        phone = request.form['phone']
+    # Keep output, filled and temp folders within their size/age budgets (OMGEN_HOUSEKEEPING=0 to disable)
+    with startup.step('housekeeping'):
+        housekeeping.configure(housekeeping.default_budgets(BASE_DIR))
+        if os.environ.get('OMGEN_HOUSEKEEPING', '1') == '1':
+            housekeeping.start()
 
-        # Get flow rate information from multiple filters
-        filter_count = int(request.form.get('filter_count', '1'))
-        
-        # Create a list to store flow data for each filter
-        filters_data = []
-        
-        for i in range(1, filter_count + 1):
-            filter_data = {
-                'filter_name': request.form.get(f'filter_name_{i}', f'Filter {i}'),
-                'primary_flow_rate': request.form.get(f'primary_flow_rate_{i}', ''),
-                'backwash_rate': request.form.get(f'backwash_rate_{i}', ''),
-                'total_dynamic_head': request.form.get(f'total_dynamic_head_{i}', ''),
-                'filter_id': str(i)  # Store the filter ID for mapping
-            }
-            # Only add filters that have at least one value filled
-            if any(value for key, value in filter_data.items() if key not in ['filter_name', 'filter_id']):
-                filters_data.append(filter_data)
-                logger.info(f"Added flow data for {filter_data['filter_name']}")
-        
-        # Process template-filter mappings
-        template_mappings = {}
-        template_count = int(request.form.get('template_count', '0'))
-        
-        for i in range(template_count):
-            template_name = request.form.get(f'template_name_{i}', '')
-            filter_id = request.form.get(f'template_filter_map_{i}', '')
+@app.before_request
+def _warm_up_before_first_request():
+    warm_up()
+
+logger.info(f"Template folder: {TEMPLATE_FOLDER}")
+logger.info(f"Maintenance docs folder: {MAINTENANCE_DOCS}")
+
+def _save_job_folder(job_folder, dest_dir):
+    """Save the PDFs of an uploaded job folder into dest_dir, skipping VOID folders."""
+    job_folder_paths = []
+    for f in job_folder:
+
+        if '/void/' in f.filename.lower() or '\\void\\' in f.filename.lower():
+            logger.info(f"Skipping files in VOID folder: {f.filename}")
+            continue
+
+        if f.filename.lower().endswith('.pdf'):
+            logger.info(f"Processing job folder PDF: {f.filename}")
+            # Extract the relative path to maintain folder structure
+            relative_path = secure_filename(f.filename)
+            full_path = os.path.join(dest_dir, relative_path)
             
-            if template_name and filter_id:
-                template_mappings[template_name] = filter_id
-                logger.info(f"Mapped template '{template_name}' to filter ID {filter_id}")
-        
-        logger.info(f"Template mappings: {template_mappings}")
-        
-        # For backward compatibility, use the first filter's data as the main flow_data
-        flow_data = filters_data[0] if filters_data else {
-            'filter_name': 'Filter 1',
-            'primary_flow_rate': '',
-            'backwash_rate': '',
-            'total_dynamic_head': '',
-        }
-
-        # Collect gutter information (optional)
-        gutter_features = request.form.getlist('gutter_features') or []
-        raw_has_grating = request.form.get('has_grating')
-        # Only record a value when the checkbox is actually checked; otherwise treat as blank
-        has_grating = 'Yes' if raw_has_grating == 'yes' else ''
-
-        gutter_data = {
-            'inlet_count': request.form.get('inlet_count', ''),
-            'inlet_size': request.form.get('inlet_size', ''),
-            'drawing_number': request.form.get('drawing_number', ''),
-            'gutter_option': request.form.get('gutter_option', ''),
-            'has_grating': has_grating,
-            'gutter_features': gutter_features,
-            'gutter_features_text': ", ".join(gutter_features) if gutter_features else ''
-        }
-
-        # If all gutter fields are effectively empty, disable gutter_data entirely
-        if not any(gutter_data.get(k) for k in [
-            'inlet_count',
-            'inlet_size',
-            'drawing_number',
-            'gutter_option',
-            'has_grating',
-            'gutter_features_text',
-        ]):
-            gutter_data = None
-
-        sales_order = request.files['sales_order']
-        ot_file = request.files.get('ot_file')
-        job_folder = request.files.getlist('job_folder')
+            # Create necessary subdirectories
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            
+            f.save(full_path)
+            job_folder_paths.append(full_path)
+        else:
+            logger.warning(f"Skipping non-PDF file in job folder: {f.filename}")
+    return job_folder_paths
 
-        # Log the files being processed
-        logger.info(f"Processing sales order: {sales_order.filename}")
-        if ot_file:
-            logger.info(f"Processing OT file: {ot_file.filename}")
-        
-        logger.info(f"Number of files in job folder: {len(job_folder)}")
-        
-        so_path = os.path.join(UPLOAD_FOLDER, secure_filename(sales_order.filename))
+@app.route('/', methods=['GET', 'POST'])
+def index():
+    if request.method == 'POST':
+        with metrics.build(output_dir=METRICS_FOLDER, job_name=request.form.get('job_name', '')) as record:
+            # Each build saves its uploads in its own folder so concurrent builds
+            # cannot clear or overwrite each other's files.
+            upload_dir = os.path.join(UPLOAD_FOLDER, record.build_id)
+            os.makedirs(upload_dir, exist_ok=True)
+            try:
+                response = make_response(_build_manual(upload_dir))
+            finally:
+                shutil.rmtree(upload_dir, ignore_errors=True)
+            if response.status_code >= 400:
+                record.status = 'error'
+        response.headers['X-Build-Id'] = record.build_id
+        return response
+
+    return render_template('index.html', flatten_forms_default=FLATTEN_FORMS)
+
+def _build_manual(upload_dir):
+    """Run a full build from the submitted form and return the response for index()."""
+    customer = request.form['customer']
+    job_name = request.form['job_name']
+    phone = request.form['phone']
+
+    # Get flow rate information from multiple filters
+    filters_data = parse_filters_data(request.form)
+
+    # Process template-filter mappings
+    template_mappings, template_count = parse_template_mappings(request.form)
+    logger.info(f"Template mappings: {template_mappings}")
+    
+    # Collect gutter information (optional)
+    gutter_data = parse_gutter_data(request.form)
+    flatten = parse_flatten_option(request.form)
+
+    sales_order = request.files['sales_order']
+    ot_file = request.files.get('ot_file')
+    job_folder = request.files.getlist('job_folder')
+
+    # Log the files being processed
+    logger.info(f"Processing sales order: {sales_order.filename}")
+    if ot_file:
+        logger.info(f"Processing OT file: {ot_file.filename}")
+    
+    logger.info(f"Number of files in job folder: {len(job_folder)}")
+    
+    with metrics.span('upload_save', files=1 + len(job_folder)):
+        so_path = os.path.join(upload_dir, secure_filename(sales_order.filename))
         sales_order.save(so_path)
 
         if ot_file:
-            ot_path = os.path.join(UPLOAD_FOLDER, secure_filename(ot_file.filename))
+            ot_path = os.path.join(upload_dir, secure_filename(ot_file.filename))
             ot_file.save(ot_path)
         else:
             ot_path = None
 
-        job_folder_paths = []
-        for f in job_folder:
+        job_folder_paths = _save_job_folder(job_folder, upload_dir)
 
-            if '/void/' in f.filename.lower() or '\\void\\' in f.filename.lower():
-                logger.info(f"Skipping files in VOID folder: {f.filename}")
-                continue
+    result = build_manual(
+        customer, job_name, phone, so_path, job_folder_paths,
+        filters_data=filters_data,
+        template_mappings=template_mappings,
+        use_only_selected=template_count > 0,
+        gutter_data=gutter_data,
+        flatten=flatten,
+        output_dir=OUTPUT_FOLDER,
+    )
+    if not result['success']:
+        return f"Error creating manual: {result['message']}", 500
 
-            if f.filename.lower().endswith('.pdf'):
-                logger.info(f"Processing job folder PDF: {f.filename}")
-                # Extract the relative path to maintain folder structure
-                relative_path = secure_filename(f.filename)
-                full_path = os.path.join(UPLOAD_FOLDER, relative_path)
-                
-                # Create necessary subdirectories
-                os.makedirs(os.path.dirname(full_path), exist_ok=True)
-                
-                f.save(full_path)
-                job_folder_paths.append(full_path)
-            else:
-                logger.warning(f"Skipping non-PDF file in job folder: {f.filename}")
-
-        # Extract items from sales order
-        logger.info("Extracting keywords from sales order...")
-        item_keywords = extract_items_from_sales_order(so_path)
-        logger.info(f"Keywords from sales order: {item_keywords}")
-        
-        # Also look for keywords in the uploaded job folder PDFs
-        logger.info("Processing job folder PDFs for additional keywords...")
-        for pdf_path in job_folder_paths:
-            try:
-                additional_keywords = extract_items_from_sales_order(pdf_path)
-                logger.info(f"Keywords from {os.path.basename(pdf_path)}: {additional_keywords}")
-                item_keywords.extend(additional_keywords)
-            except Exception as e:
-                logger.error(f"Error processing {pdf_path}: {str(e)}")
-        
-        # Remove duplicates and normalize keywords
-        item_keywords = list(set(item_keywords))
-        logger.info(f"Final deduplicated keywords: {item_keywords}")
-
-        # Match templates and maintenance docs
-        logger.info(f"Looking for templates and maintenance docs in {TEMPLATE_FOLDER}")
-        logger.info(f"Maintenance docs directory: {os.path.join(TEMPLATE_FOLDER, 'maintenance_docs')}")
-        logger.info(f"Maintenance docs exist: {os.path.exists(os.path.join(TEMPLATE_FOLDER, 'maintenance_docs'))}")
-        logger.info(f"Processing with {len(filters_data) if filters_data else 0} filters")
-        
-        use_only_selected = template_count > 0
-        templates, maintenance_docs = match_templates(
-            item_keywords,
-            TEMPLATE_FOLDER,
-            flow_data=flow_data,
-            filters_data=filters_data,
-            template_mappings=template_mappings,
-            gutter_data=gutter_data,
-            use_only_selected=use_only_selected
-        )
-        logger.info(f"Matched templates: {[os.path.basename(t) for t in templates]}")
-        logger.info(f"Total templates returned: {len(templates)}")
-        logger.info(f"Matched maintenance docs: {[os.path.basename(d) for d in maintenance_docs]}")
-
-        # If any gutter data provided, ensure gutter_care.pdf is filled with those fields
-        if gutter_data and any(gutter_data.get(k) for k in [
-            'inlet_count',
-            'inlet_size',
-            'drawing_number',
-            'gutter_option',
-            'has_grating',
-            'gutter_features_text',
-        ]):
-            try:
-                gutter_care_path = os.path.join(MAINTENANCE_DOCS, 'gutter_care.pdf')
-                if os.path.exists(gutter_care_path):
-                    filled_gutter_care = fill_gutter_maintenance_doc(gutter_care_path, gutter_data)
-                    # Replace existing occurrence or append
-                    replaced = False
-                    for i, p in enumerate(maintenance_docs):
-                        if os.path.basename(p).lower() == 'gutter_care.pdf':
-                            maintenance_docs[i] = filled_gutter_care
-                            replaced = True
+    output_pdf_path = result['output_path']
+    if result['warning_path']:
+        # Return both files in a zip, streamed as it is written
+        response = _stream_zip([output_pdf_path, result['warning_path']], f'{job_name}_Manual.zip')
+    else:
+        response = _send_output_file(output_pdf_path)
+    # The manual stays downloadable (with Range support) from /download
+    response.headers['Content-Location'] = url_for('download_output', filename=os.path.basename(output_pdf_path))
+    return response
+
+
+class _ZipStreamBuffer:
+    """Unseekable sink for zipfile; the written bytes are drained by the response generator."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _stream_zip(paths, download_name):
+    """
+    Stream a zip of the given files without building it in memory or on disk. Entries are
+    stored uncompressed (PDF streams are already compressed), so the archive is produced
+    as fast as the files can be read.
+    """
+    def generate():
+        buffer = _ZipStreamBuffer()
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as zf:
+            for path in paths:
+                info = zipfile.ZipInfo.from_file(path, os.path.basename(path))
+                info.compress_type = zipfile.ZIP_STORED
+                with open(path, 'rb') as src, zf.open(info, 'w', force_zip64=info.file_size >= zipfile.ZIP64_LIMIT) as dest:
+                    while True:
+                        chunk = src.read(ZIP_CHUNK_SIZE)
+                        if not chunk:
                             break
-                    if not replaced:
-                        maintenance_docs.append(filled_gutter_care)
-                    logger.info("Processed gutter_care.pdf with gutter data")
-                else:
-                    logger.warning(f"gutter_care.pdf not found in maintenance docs folder: {gutter_care_path}")
-            except Exception as e:
-                logger.error(f"Error preparing gutter_care.pdf: {e}")
-
-        # Find warranty docs based on keywords and append as last section
-        warranty_docs = find_warranty_documents(item_keywords)
-        logger.info(f"Matched warranty docs: {[os.path.basename(d) for d in warranty_docs]}")
-
-        # Always-include documents
-        def _append_unique(seq, item):
-            if item and item not in seq:
-                seq.append(item)
-
-        # 1) Always append Prevent-p-poster.pdf to end of Maintenance section
-        prevent_p_path = os.path.join(MAINTENANCE_DOCS, "Prevent-p-poster.pdf")
-        if os.path.exists(prevent_p_path):
-            _append_unique(maintenance_docs, prevent_p_path)
-            logger.info("Appended required maintenance doc: Prevent-p-poster.pdf")
-        else:
-            logger.warning(f"Required maintenance doc missing: {prevent_p_path}")
-
-        # Determine if project contains a filter
-        keywords_lower = [k.lower() for k in item_keywords]
-        has_filter = any(any(term in k for term in ["filter", "regenerator"]) for k in keywords_lower)
-        if not has_filter:
-            has_filter = bool(filters_data)  # flow data implies filters present
-        if not has_filter:
-            try:
-                has_filter = any("filter" in os.path.basename(t).lower() for t in templates)
-            except Exception:
-                has_filter = has_filter
-        logger.info(f"Project contains filter: {has_filter}")
-
-        # 2) If project contains a filter, append Valve Series 30/31 PDF to Maintenance
-        valve_doc_path = os.path.join(MAINTENANCE_DOCS, "Valve Series 30 Wafer and Series 31-416 standard.pdf")
-        if has_filter:
-            if os.path.exists(valve_doc_path):
-                _append_unique(maintenance_docs, valve_doc_path)
-                logger.info("Appended valve document for filter projects: Valve Series 30 Wafer and Series 31-416 standard.pdf")
-            else:
-                logger.warning(f"Valve document missing (expected for filter projects): {valve_doc_path}")
-
-        # 3) Always append Sales Bulletin to end of Warranty section
-        sales_bulletin_path = os.path.join(WARRANTY_DOCS, "SALES BULLETIN 84-4-R W-LOGO revformat7-2021.pdf")
-        if os.path.exists(sales_bulletin_path):
-            _append_unique(warranty_docs, sales_bulletin_path)
-            logger.info("Appended required warranty doc: SALES BULLETIN 84-4-R W-LOGO revformat7-2021.pdf")
-        else:
-            logger.warning(f"Required warranty doc missing: {sales_bulletin_path}")
+                        dest.write(chunk)
+                        yield buffer.drain()
+                yield buffer.drain()
+        # Central directory
+        yield buffer.drain()
 
-        # After maintenance_docs list is finalized, replace any items with their
-        # filled counterparts from MAINTENANCE_DOCS/filled when present.
-        try:
-            filled_dir = os.path.join(MAINTENANCE_DOCS, 'filled')
-            if os.path.isdir(filled_dir):
-                # Build mapping from original basename -> filled path
-                filled_map = {}
-                for fname in os.listdir(filled_dir):
-                    if not fname.lower().endswith('.pdf'):
-                        continue
-                    # For files like filled_gutter_care.pdf, infer original name
-                    lower = fname.lower()
-                    if lower.startswith('filled_') and len(fname) > len('filled_'):
-                        orig = fname[len('filled_'):]
-                        filled_map[orig.lower()] = os.path.join(filled_dir, fname)
-                if filled_map:
-                    new_maintenance = []
-                    for p in maintenance_docs:
-                        base = os.path.basename(p).lower()
-                        if base in filled_map:
-                            logger.info(f"Using filled maintenance doc for {base}: {os.path.basename(filled_map[base])}")
-                            new_maintenance.append(filled_map[base])
-                        else:
-                            new_maintenance.append(p)
-                    maintenance_docs = new_maintenance
-        except Exception as e:
-            logger.error(f"Error swapping in filled maintenance docs: {e}")
-
-        # Create cover page with flow data from all filters
-        cover_pdf_path = generate_cover_page(customer, job_name, phone, filters_data=filters_data)
-        logger.info(f"Generated cover page: {cover_pdf_path}")
-
-        # Organize files into sections
-        output_pdf_path = os.path.join(OUTPUT_FOLDER, f'{job_name}_Manual.pdf')
-        logger.info(f"Merging PDFs into: {output_pdf_path}")
-        
-        # Log organization of files
-        logger.info("Files organized by section:")
-        logger.info(f"1. Cover page: {cover_pdf_path}")
-        logger.info("2. Equipment Templates:")
-        for i, template in enumerate(templates, 1):
-            logger.info(f"   {i}. {os.path.basename(template)}")
-        logger.info("3. Maintenance & Operation Guides:")
-        for i, doc in enumerate(maintenance_docs, 1):
-            logger.info(f"   {i}. {os.path.basename(doc)}")
-        logger.info("4. Project Documentation:")
-        for i, pdf in enumerate(job_folder_paths, 1):
-            logger.info(f"   {i}. {os.path.basename(pdf)}")
-        
-        # Create sections dictionary for organized merging
-        sections = {
-            'cover': cover_pdf_path,
-            'templates': templates,
-            'maintenance': maintenance_docs,
-            # job_files will be set after filtering
-            'job_files': [],
-            'warranty': warranty_docs,
-        }
-        
-        # Log detailed information about templates
-        logger.info("Templates to be included in the manual:")
-        for i, template in enumerate(templates):
-            logger.info(f"  {i+1}. {os.path.basename(template)}")
-        
-        # When users upload their Job Folder, it may contain extra template PDFs.
-        # To ensure ONLY explicitly selected templates are included, exclude any
-        # job folder PDFs that appear to be templates (e.g., filename contains 'template').
-        filtered_job_files = []
-        for p in job_folder_paths:
-            base = os.path.basename(p).lower()
-            if 'template' in base:
-                logger.info(f"Excluding job folder file that looks like a template: {base}")
-                continue
-            filtered_job_files.append(p)
-
-        # Update sections with filtered job files
-        sections['job_files'] = filtered_job_files
-
-        # For backward compatibility, keep a list of all PDFs
-        all_pdfs = [cover_pdf_path] + templates + maintenance_docs + filtered_job_files + warranty_docs
-        logger.info(f"Total PDFs to merge: {len(all_pdfs)}")
-        logger.info(f"Templates count: {len(templates)}")
-        logger.info(f"Maintenance docs count: {len(maintenance_docs)}")
-        logger.info(f"Warranty docs count: {len(warranty_docs)}")
-        logger.info(f"Job files count: {len(filtered_job_files)} (filtered out {len(job_folder_paths) - len(filtered_job_files)} template-like files)")
-        
-        success, message, skipped_files = merge_pdfs(all_pdfs, output_pdf_path, organized=True, sections=sections)
-        
-        if not success:
-            logger.error("Failed to create output PDF")
-            return f"Error creating manual: {message}", 500
-        
-        # If we have skipped files but still created a PDF, show a warning to the user
-        if skipped_files:
-            skipped_msg = "Warning: Some documents were skipped:\n"
-            for file, reason in skipped_files:
-                skipped_msg += f"- {os.path.basename(file)}: {reason}\n"
-            logger.warning(skipped_msg)
-            
-            # Create a warning file next to the PDF
-            warning_path = os.path.splitext(output_pdf_path)[0] + "_warnings.txt"
-            with open(warning_path, "w") as f:
-                f.write(skipped_msg)
-            
-            # Return both files in a zip
-            memory_file = BytesIO()
-            with zipfile.ZipFile(memory_file, 'w') as zf:
-                zf.write(output_pdf_path, os.path.basename(output_pdf_path))
-                zf.write(warning_path, os.path.basename(warning_path))
-            
-            memory_file.seek(0)
-            return send_file(
-                memory_file,
-                mimetype='application/zip',
-                as_attachment=True,
-                download_name=f'{job_name}_Manual.zip'
+    response = Response(generate(), mimetype='application/zip')
+    response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    return response
+
+
+def _send_output_file(path):
+    """
+    Send a file from the output folder as an attachment. Werkzeug answers conditional and
+    Range requests from the ETag and modification time; when offload is configured the
+    front-end server sends the body instead.
+    """
+    if ACCEL_REDIRECT_PREFIX:
+        name = os.path.basename(path)
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = f"{ACCEL_REDIRECT_PREFIX.rstrip('/')}/{quote(name)}"
+        response.headers['Content-Type'] = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        response.headers.set('Content-Disposition', 'attachment', filename=name)
+        return response
+    return send_file(path, as_attachment=True, conditional=True, etag=True, max_age=0)
+
+
+@app.get('/download/<filename>')
+def download_output(filename):
+    """Resumable download of a generated manual (or its warnings file) from the output folder."""
+    path = safe_join(OUTPUT_FOLDER, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    return _send_output_file(path)
+
+
+# Rough size of a generated section header page, used for output size estimates
+SECTION_HEADER_SIZE_ESTIMATE = 1600
+
+@app.post('/api/plan')
+def api_plan():
+    """
+    Dry run of a build: extract keywords and select templates, maintenance docs and
+    warranty docs without filling, cover generation or merging. Returns the ordered
+    section layout with page counts and an estimated output size.
+    """
+    try:
+        job_name = request.form.get('job_name', '')
+        filters_data = parse_filters_data(request.form)
+        template_mappings, template_count = parse_template_mappings(request.form)
+        gutter_data = parse_gutter_data(request.form)
+
+        sales_order = request.files.get('sales_order')
+        if not sales_order or not sales_order.filename:
+            return jsonify({'error': 'sales_order is required'}), 400
+        job_folder = request.files.getlist('job_folder')
+
+        # Work in a private temp dir so a plan never disturbs an in-progress build's uploads
+        with tempfile.TemporaryDirectory(dir=UPLOAD_FOLDER) as plan_dir:
+            so_path = os.path.join(plan_dir, secure_filename(sales_order.filename))
+            sales_order.save(so_path)
+            job_folder_paths = _save_job_folder(job_folder, plan_dir)
+
+            item_keywords = extract_keywords(so_path, job_folder_paths)
+            templates, maintenance_docs = match_templates(
+                item_keywords,
+                TEMPLATE_FOLDER,
+                filters_data=filters_data,
+                template_mappings=template_mappings,
+                gutter_data=gutter_data,
+                use_only_selected=template_count > 0,
+                fill=False,
             )
-        
-        logger.info(f"Successfully created manual at: {output_pdf_path}")
-        return send_file(output_pdf_path, as_attachment=True)
 
-    return render_template('index.html')
+            # A build fills gutter_care.pdf in place of the original; the page count is the same
+            gutter_care_path = os.path.join(MAINTENANCE_DOCS, 'gutter_care.pdf')
+            if gutter_data and os.path.exists(gutter_care_path):
+                if not any(os.path.basename(p).lower() == 'gutter_care.pdf' for p in maintenance_docs):
+                    maintenance_docs.append(gutter_care_path)
+
+            warranty_docs = find_warranty_documents(item_keywords)
+            maintenance_docs, warranty_docs = add_required_documents(
+                item_keywords, templates, maintenance_docs, warranty_docs, filters_data
+            )
+
+            # The cover is rendered from the cover template, so plan with its metadata
+            cover_template = os.path.join(BASE_DIR, 'Cover Sheet Template.pdf')
+            layout = plan_section_layout(
+                cover_template,
+                templates,
+                maintenance_docs,
+                filter_job_files(job_folder_paths),
+                warranty_docs,
+            )
+
+            entries = []
+            total_pages = 0
+            estimated_size = 0
+            for entry in layout:
+                item = {'section': entry['section'], 'kind': entry['kind']}
+                if entry['kind'] == 'header':
+                    item.update({'title': entry['title'], 'pages': 1, 'size': SECTION_HEADER_SIZE_ESTIMATE})
+                elif entry['kind'] == 'toc':
+                    # One line per entry other than the cover and the TOC itself
+                    lines = sum(1 for e in layout if e['kind'] != 'toc' and e['section'] != 'cover')
+                    pages = toc_page_count(lines)
+                    item.update({'title': entry['title'], 'pages': pages, 'size': pages * SECTION_HEADER_SIZE_ESTIMATE})
+                else:
+                    metadata = get_pdf_metadata(entry['path'])
+                    item['name'] = os.path.basename(entry['path'])
+                    if metadata is None:
+                        item.update({'pages': None, 'size': None, 'error': 'Unreadable or missing PDF'})
+                    else:
+                        item.update(metadata)
+                total_pages += item['pages'] or 0
+                estimated_size += item['size'] or 0
+                entries.append(item)
+
+        return jsonify({
+            'job_name': job_name,
+            'keywords': sorted(item_keywords),
+            'layout': entries,
+            'total_pages': total_pages,
+            'estimated_size': estimated_size,
+        })
+    except Exception as e:
+        logger.error(f"Error planning build: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# Main form field -> workbook metadata keys used to prefill it, in order of preference
+METADATA_FORM_FIELDS = {
+    'customer': ['customer'],
+    'job_name': ['project', 'job_number'],
+    'phone': ['phone'],
+}
+
+@app.post('/api/job-metadata')
+def api_job_metadata():
+    """Read job metadata from an uploaded project workbook so the form can prefill its fields."""
+    workbook = request.files.get('ot_file')
+    if not workbook or not workbook.filename:
+        return jsonify({'error': 'No workbook uploaded'}), 400
+    if not workbook.filename.lower().endswith(('.xlsx', '.xlsm', '.xls')):
+        return jsonify({'error': 'Expected an .xlsx, .xlsm or .xls file'}), 400
+
+    metadata = extract_job_metadata(workbook.stream, filename=workbook.filename)
+    fields = {}
+    for field, keys in METADATA_FORM_FIELDS.items():
+        value = next((metadata[k] for k in keys if metadata.get(k) not in (None, '')), None)
+        if value is not None:
+            fields[field] = str(value)
+    return jsonify({'metadata': metadata, 'fields': fields})
+
+@app.get('/metrics')
+def metrics_endpoint():
+    """Aggregated per-stage timing histograms for builds served by this worker process."""
+    snapshot = metrics.snapshot()
+    snapshot['shared_library'] = shared_library.stats()
+    snapshot['housekeeping'] = housekeeping.stats()
+    return jsonify(snapshot)
+
+def _load_build_record(build_id):
+    """Record of a finished build from memory or the metrics folder, or None."""
+    record = metrics.get_build(build_id)
+    if record is None:
+        path = os.path.join(METRICS_FOLDER, f'{secure_filename(build_id)}.json')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            record = json.load(f)
+    return record
+
+@app.get('/metrics/startup')
+def startup_metrics():
+    """Import and warm-up timings of this worker process."""
+    return jsonify(startup.report(APP_IMPORT_SECONDS))
+
+@app.get('/metrics/builds/<build_id>')
+def build_metrics(build_id):
+    """Return the timing record of one build by the id sent in the X-Build-Id header."""
+    record = _load_build_record(build_id)
+    if record is None:
+        return jsonify({'error': 'Build not found'}), 404
+    return jsonify(record)
+
+def _build_manual_index(build_id):
+    """
+    Return (pdf_path, section index) of a build's manual, or a (response, status) error
+    if the build is unknown or its manual has since been replaced or evicted.
+    """
+    record = _load_build_record(build_id)
+    pdf_path = record.get('output_path') if record else None
+    if not pdf_path:
+        return None, (jsonify({'error': 'Build not found or produced no manual'}), 404)
+    index = previews.load_section_index(pdf_path) if os.path.exists(pdf_path) else None
+    if index is None or index.get('build_id') != build_id:
+        # A later build with the same job name overwrote the manual
+        return None, (jsonify({'error': 'Manual for this build is no longer available'}), 410)
+    return (pdf_path, index), None
+
+@app.get('/api/builds/<build_id>/preview')
+def api_build_preview(build_id):
+    """
+    Section structure of a build's manual with a preview tile URL for the first page of
+    each section. Other pages are available from the page endpoint.
+    """
+    found, error = _build_manual_index(build_id)
+    if error:
+        return error
+    pdf_path, index = found
+    dpi = previews.clamp_dpi(request.args.get('dpi', type=int))
+    sections = previews.group_sections(index)
+    try:
+        previews.ensure_tiles(build_id, pdf_path, [s['start_page'] for s in sections], dpi)
+    except Exception as e:
+        logger.error(f"Preview rendering failed for build {build_id}: {e}")
+        return jsonify({'error': 'Preview rendering failed'}), 500
+
+    def _page_url(page):
+        return url_for('api_build_page', build_id=build_id, page=page, dpi=dpi)
+
+    for section in sections:
+        section['preview'] = _page_url(section['start_page'])
+    return jsonify({
+        'build_id': build_id,
+        'output': index['output'],
+        'size': os.path.getsize(pdf_path),
+        'pages': index['pages'],
+        'dpi': dpi,
+        'download': url_for('download_output', filename=index['output']),
+        'sections': sections,
+    })
+
+@app.get('/api/builds/<build_id>/pages/<int:page>.png')
+def api_build_page(build_id, page):
+    """Preview tile of one 1-based page of a build's manual (?dpi= up to the configured maximum)."""
+    found, error = _build_manual_index(build_id)
+    if error:
+        return error
+    pdf_path, index = found
+    if not 1 <= page <= index['pages']:
+        return jsonify({'error': f"Page out of range (1-{index['pages']})"}), 404
+    try:
+        tiles = previews.ensure_tiles(build_id, pdf_path, [page], request.args.get('dpi', type=int))
+    except Exception as e:
+        logger.error(f"Preview rendering failed for build {build_id} page {page}: {e}")
+        return jsonify({'error': 'Preview rendering failed'}), 500
+    return send_file(tiles[page], mimetype='image/png', conditional=True, max_age=3600)
 
 @app.get('/api/templates')
 def api_list_templates():
@@ -485,34 +584,11 @@ def regenerate_cover():
         
         logger.info(f"Regenerating cover page for job: {job_name}")
         
-        # Get flow rate information for multiple filters
-        filter_count = int(request.form.get('filter_count', '1'))
-        logger.info(f"Processing {filter_count} filters for cover page")
-        
-        # Create a list to store flow data for each filter
-        filters_data = []
-        
-        for i in range(1, filter_count + 1):
-            filter_data = {
-                'filter_name': request.form.get(f'filter_name_{i}', f'Filter {i}'),
-                'primary_flow_rate': request.form.get(f'primary_flow_rate_{i}', ''),
-                'backwash_rate': request.form.get(f'backwash_rate_{i}', ''),
-                'total_dynamic_head': request.form.get(f'total_dynamic_head_{i}', ''),
-            }
-            # Only add filters that have at least one value filled
-            if any(value for key, value in filter_data.items() if key != 'filter_name'):
-                filters_data.append(filter_data)
-                logger.info(f"Added flow data for {filter_data['filter_name']}")
-        
-        # Generate new cover page with flow data from all filters
-        cover_path = generate_cover_page(customer, job_name, phone, filters_data=filters_data)
-        
-        if not os.path.exists(cover_path):
-            return "Failed to generate cover page", 500
-            
-        # Return the cover page
+        # Render the cover in memory; nothing is written to the output folder
+        cover_pdf = render_cover_page(customer, job_name, phone)
         return send_file(
-            cover_path,
+            io.BytesIO(cover_pdf),
+            mimetype='application/pdf',
             as_attachment=True,
             download_name=f"cover_{job_name}.pdf"
         )
@@ -521,6 +597,8 @@ def regenerate_cover():
         logger.error(f"Error regenerating cover page: {str(e)}")
         return f"Error: {str(e)}", 500
 
+APP_IMPORT_SECONDS = round(time.perf_counter() - _import_started, 4)
+
 if __name__ == '__main__':
     # Only use debug mode when running directly
     is_debug = os.environ.get('FLASK_ENV') == 'development'
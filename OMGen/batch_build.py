@@ -0,0 +1,279 @@
+"""
+Build manuals for many jobs without the web form.
+
+The manifest is a CSV or JSON file with one job per row/object. Fields use the same
+names as the web form:
+
+    job_name, customer, phone          required (job_name names the output file)
+    sales_order                        path to the sales order PDF
+    job_folder                         folder of job PDFs (VOID subfolders skipped), or a
+                                       list of PDF paths in JSON / ';'-separated in CSV
+    filter_count, filter_name_1, primary_flow_rate_1, backwash_rate_1, total_dynamic_head_1, ...
+    inlet_count, inlet_size, drawing_number, gutter_option, has_grating (yes),
+    gutter_features                    list in JSON / ';'-separated in CSV
+    flatten_forms                      yes / no
+    template_mappings                  {"Regen Template.pdf": "1"} in JSON /
+                                       "Regen Template.pdf=1;..." in CSV; when given,
+                                       only these templates are used
+
+Relative paths are resolved against the manifest's folder. Jobs run across a process
+pool. Finished jobs are appended to a state file, so a rerun after an interruption
+skips them (use --restart to rebuild everything). A JSON summary with per-job
+timings, per-stage times and skipped files is written when the batch ends.
+
+Usage (from the OMGen directory):
+    python batch_build.py jobs.csv --workers 4 --output-dir output/batch
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+
+logger = logging.getLogger('batch_build')
+
+LIST_FIELDS = ('job_folder', 'gutter_features')
+
+
+def load_manifest(path):
+    """Return the list of job dicts in a CSV or JSON manifest."""
+    if path.lower().endswith('.json'):
+        with open(path) as f:
+            data = json.load(f)
+        jobs = data['jobs'] if isinstance(data, dict) else data
+    else:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            jobs = []
+            for row in csv.DictReader(f):
+                job = {k.strip(): (v or '').strip() for k, v in row.items() if k}
+                for key in LIST_FIELDS:
+                    if ';' in job.get(key, ''):
+                        job[key] = [p.strip() for p in job[key].split(';') if p.strip()]
+                if job.get('template_mappings'):
+                    pairs = [p.split('=', 1) for p in job['template_mappings'].split(';') if '=' in p]
+                    job['template_mappings'] = {name.strip(): fid.strip() for name, fid in pairs}
+                jobs.append(job)
+    for i, job in enumerate(jobs, 1):
+        missing = [k for k in ('job_name', 'customer', 'phone', 'sales_order') if not job.get(k)]
+        if missing:
+            raise ValueError(f"Manifest job {i} is missing {', '.join(missing)}")
+    return jobs
+
+
+def resolve_job_folder(value, manifest_dir):
+    """Expand the job_folder field into a sorted list of PDF paths."""
+    if not value:
+        return []
+    entries = value if isinstance(value, list) else [value]
+    paths = []
+    for entry in entries:
+        entry = os.path.join(manifest_dir, entry)
+        if os.path.isdir(entry):
+            for root, dirs, files in os.walk(entry):
+                # Same rule as the upload form: skip anything in a VOID folder
+                dirs[:] = sorted(d for d in dirs if d.lower() != 'void')
+                paths.extend(os.path.join(root, f) for f in sorted(files) if f.lower().endswith('.pdf'))
+        else:
+            paths.append(entry)
+    return paths
+
+
+def form_fields(job):
+    """Flatten a manifest job into the web form's field names as a MultiDict."""
+    from werkzeug.datastructures import MultiDict
+
+    fields = MultiDict()
+    for key, value in job.items():
+        if key in ('job_folder', 'sales_order', 'template_mappings'):
+            continue
+        for item in (value if isinstance(value, list) else [value]):
+            fields.add(key, '' if item is None else str(item))
+    mappings = job.get('template_mappings') or {}
+    fields['template_count'] = str(len(mappings))
+    for i, (name, filter_id) in enumerate(mappings.items()):
+        fields[f'template_name_{i}'] = name
+        fields[f'template_filter_map_{i}'] = str(filter_id)
+    return fields
+
+
+def run_job(job, manifest_dir, output_dir):
+    """Build one manual; runs in a pool worker. Returns the job's report entry."""
+    from utils import metrics
+    from utils.manual_builder import (
+        build_manual,
+        parse_filters_data,
+        parse_template_mappings,
+        parse_gutter_data,
+        parse_flatten_option,
+    )
+
+    fields = form_fields(job)
+    template_mappings, template_count = parse_template_mappings(fields)
+    report = {'job_name': job['job_name'], 'pid': os.getpid()}
+    start = time.perf_counter()
+    try:
+        with metrics.build(job_name=job['job_name']) as record:
+            result = build_manual(
+                job['customer'], job['job_name'], job['phone'],
+                os.path.join(manifest_dir, job['sales_order']),
+                resolve_job_folder(job.get('job_folder'), manifest_dir),
+                filters_data=parse_filters_data(fields),
+                template_mappings=template_mappings,
+                use_only_selected=template_count > 0,
+                gutter_data=parse_gutter_data(fields),
+                flatten=parse_flatten_option(fields),
+                output_dir=output_dir,
+            )
+            if not result['success']:
+                record.status = 'error'
+        report.update(
+            status='ok' if result['success'] else 'error',
+            message=result['message'],
+            output_path=result['output_path'],
+            output_size=os.path.getsize(result['output_path']) if result['output_path'] else None,
+            skipped_files=[[os.path.basename(p), reason] for p, reason in result['skipped_files']],
+            fill_failures=[list(f) for f in result['fill_failures']],
+            stages={stage: round(t['wall_seconds'], 3) for stage, t in record.stage_totals().items()},
+        )
+    except Exception as e:
+        report.update(status='error', message=f"{type(e).__name__}: {e}")
+    report['seconds'] = round(time.perf_counter() - start, 3)
+    return report
+
+
+def load_state(state_path):
+    """Return {job_name: report} of jobs that finished successfully in earlier runs."""
+    done = {}
+    if not os.path.exists(state_path):
+        return done
+    with open(state_path) as f:
+        for line in f:
+            try:
+                report = json.loads(line)
+            except ValueError:
+                continue  # Partial line from an interrupted write
+            if report.get('status') == 'ok' and report.get('output_path') and os.path.exists(report['output_path']):
+                done[report['job_name']] = report
+            else:
+                done.pop(report.get('job_name'), None)
+    return done
+
+
+def warm_caches():
+    """
+    Bring the document library up to date once, before the pool starts, so every job
+    uses the same normalized copies. Forked workers also inherit the catalog, the cover
+    template and, with OMGEN_PRELOAD_LIBRARY=1, the memory-mapped library.
+    """
+    from utils import doc_library, shared_library
+    from utils.pdf_utils import load_cover_template
+
+    load_cover_template()
+
+    summary = doc_library.ingest()
+    logger.info(f"Document library: {summary}")
+    if shared_library.PRELOAD_LIBRARY:
+        shared_library.preload()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('manifest', help='CSV or JSON manifest of jobs')
+    parser.add_argument('--output-dir', default=os.path.join(BASE_DIR, 'output', 'batch'), help='Folder for the manuals and reports')
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1), help='Jobs built in parallel')
+    parser.add_argument('--state', help='Resume state file (default: <output-dir>/batch_state.jsonl)')
+    parser.add_argument('--restart', action='store_true', help='Ignore the state file and rebuild every job')
+    parser.add_argument('--report', help='Summary report path (default: <output-dir>/batch_summary_<time>.json)')
+    parser.add_argument('--verbose', action='store_true', help='Show build logging')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    logger.setLevel(logging.INFO)
+    # Jobs are already spread across processes; don't nest a template fill pool in each
+    if args.workers > 1:
+        os.environ.setdefault('OMGEN_FILL_WORKERS', '1')
+
+    manifest_path = os.path.abspath(args.manifest)
+    manifest_dir = os.path.dirname(manifest_path)
+    output_dir = os.path.abspath(args.output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    state_path = args.state or os.path.join(output_dir, 'batch_state.jsonl')
+
+    jobs = load_manifest(manifest_path)
+    names = [job['job_name'] for job in jobs]
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates:
+        parser.error(f"Duplicate job names in manifest: {', '.join(duplicates)}")
+
+    if args.restart and os.path.exists(state_path):
+        os.remove(state_path)
+    done = load_state(state_path)
+    pending = [job for job in jobs if job['job_name'] not in done]
+    logger.info(f"{len(jobs)} jobs in manifest, {len(done)} already built, {len(pending)} to build")
+
+    warm_caches()
+
+    reports = {name: dict(report, resumed=True) for name, report in done.items() if name in names}
+    start = time.perf_counter()
+    interrupted = False
+    with open(state_path, 'a') as state, ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(run_job, job, manifest_dir, output_dir): job['job_name'] for job in pending}
+        try:
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    report = future.result()
+                except Exception as e:  # Worker died
+                    report = {'job_name': name, 'status': 'error', 'message': f"{type(e).__name__}: {e}"}
+                reports[name] = report
+                state.write(json.dumps(report) + '\n')
+                state.flush()
+                skipped = len(report.get('skipped_files') or [])
+                logger.info(f"[{len(reports)}/{len(jobs)}] {name}: {report['status']} in {report.get('seconds', 0):.1f}s"
+                            + (f", {skipped} files skipped" if skipped else '')
+                            + ('' if report['status'] == 'ok' else f" - {report.get('message')}"))
+        except KeyboardInterrupt:
+            interrupted = True
+            logger.warning("Interrupted; finished jobs are recorded and will be skipped on the next run")
+            pool.shutdown(wait=False, cancel_futures=True)
+    elapsed = time.perf_counter() - start
+
+    ordered = [reports[name] for name in names if name in reports]
+    built = [r for r in ordered if r['status'] == 'ok' and not r.get('resumed')]
+    summary = {
+        'manifest': manifest_path,
+        'output_dir': output_dir,
+        'workers': args.workers,
+        'interrupted': interrupted,
+        'elapsed_seconds': round(elapsed, 3),
+        'jobs': len(jobs),
+        'built': len(built),
+        'resumed': sum(1 for r in ordered if r.get('resumed')),
+        'failed': sum(1 for r in ordered if r['status'] != 'ok'),
+        'not_run': len(jobs) - len(ordered),
+        'jobs_with_skipped_files': sum(1 for r in ordered if r.get('skipped_files')),
+        'results': ordered,
+    }
+    report_path = args.report or os.path.join(output_dir, f"batch_summary_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(report_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"{'job':<32}{'status':>8}{'seconds':>10}{'size (KB)':>12}{'skipped':>9}")
+    for r in ordered:
+        size = f"{r['output_size'] / 1024:.0f}" if r.get('output_size') else '-'
+        status = 'resumed' if r.get('resumed') else r['status']
+        print(f"{r['job_name'][:31]:<32}{status:>8}{r.get('seconds', 0):>10.1f}{size:>12}{len(r.get('skipped_files') or []):>9}")
+    print(f"{summary['built']} built, {summary['resumed']} resumed, {summary['failed']} failed, "
+          f"{summary['not_run']} not run in {elapsed:.1f}s. Report: {report_path}")
+    return 1 if summary['failed'] or summary['not_run'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
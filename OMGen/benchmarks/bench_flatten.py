@@ -0,0 +1,89 @@
+"""
+Compare merge time and output size of filled templates with and without form flattening.
+
+Usage (from the OMGen directory):
+    python benchmarks/bench_flatten.py --copies 5
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyPDF2 import PdfMerger
+from utils.pdf_utils import fill_pdf_form_fields
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'template_cache')
+
+FLOW_DATA = {
+    'primary_flow_rate': '1500',
+    'backwash_rate': '750',
+    'total_dynamic_head': '45 feet',
+}
+
+
+def fill_templates(work_dir, copies, flatten):
+    """Fill every template `copies` times and return the list of filled paths."""
+    filled = []
+    templates = sorted(f for f in os.listdir(work_dir) if f.lower().endswith('.pdf'))
+    for i in range(copies):
+        for name in templates:
+            path = fill_pdf_form_fields(os.path.join(work_dir, name), FLOW_DATA, filter_name=f'copy{i}', flatten=flatten)
+            filled.append(path or os.path.join(work_dir, name))
+    return filled
+
+
+def merge(paths, output_path):
+    merger = PdfMerger()
+    try:
+        for path in paths:
+            merger.append(path)
+        merger.write(output_path)
+    finally:
+        merger.close()
+
+
+def run(copies, repeat):
+    results = {}
+    for flatten in (False, True):
+        with tempfile.TemporaryDirectory() as work_dir:
+            for name in os.listdir(TEMPLATE_DIR):
+                if name.lower().endswith('.pdf'):
+                    shutil.copy(os.path.join(TEMPLATE_DIR, name), work_dir)
+
+            start = time.perf_counter()
+            filled = fill_templates(work_dir, copies, flatten)
+            fill_time = time.perf_counter() - start
+
+            merge_times = []
+            output_path = os.path.join(work_dir, 'merged.pdf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                merge(filled, output_path)
+                merge_times.append(time.perf_counter() - start)
+
+            results[flatten] = {
+                'forms': len(filled),
+                'fill_s': fill_time,
+                'merge_s': min(merge_times),
+                'size': os.path.getsize(output_path),
+            }
+
+    print(f"{'mode':<12}{'forms':>8}{'fill (s)':>12}{'merge (s)':>12}{'size (KB)':>12}")
+    for flatten, r in results.items():
+        mode = 'flattened' if flatten else 'interactive'
+        print(f"{mode:<12}{r['forms']:>8}{r['fill_s']:>12.3f}{r['merge_s']:>12.3f}{r['size'] / 1024:>12.1f}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--copies', type=int, default=5, help='How many filled copies of each template to merge')
+    parser.add_argument('--repeat', type=int, default=3, help='Merge repetitions; the fastest is reported')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    run(args.copies, args.repeat)
@@ -0,0 +1,295 @@
+"""
+End-to-end benchmark of manual generation through the Flask test client.
+
+Generates a synthetic sales order and job folder, posts full builds to the index
+route (sales order extraction, template matching and filling, cover page, merge)
+with N builds in flight at once, and reports per-stage latency percentiles taken
+from the build metrics records, throughput and output size. Results are written
+as JSON so runs can be compared across commits.
+
+Usage (from the OMGen directory):
+    python benchmarks/bench_pipeline.py --builds 8 --concurrency 2
+    python benchmarks/bench_pipeline.py --job-docs 20 --job-pages 10 --compare benchmarks/results/<previous>.json
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+import fitz
+
+from app import app, OUTPUT_FOLDER
+from utils import metrics
+from utils.pdf_utils import FILL_WORKERS
+
+RESULTS_DIR = os.path.join(BASE_DIR, 'benchmarks', 'results')
+
+# Sales order lines that hit the keyword categories used for template matching
+SALES_ORDER_LINES = [
+    'Qty 2 Horizontal Filter PPEC1400S',
+    'Regenerative filter PPEC900S',
+    'Gutter grating 300 ft',
+    'Main drain grate 24 x 24',
+    'Bulkhead 1 ea',
+    'Strainer basket',
+    'Starting platform 8 ea',
+    'Butterfly valve series 30',
+    'Flow meter 6 in',
+]
+
+PERCENTILES = (50, 90, 99)
+
+
+def make_pdf(path, lines, pages):
+    doc = fitz.open()
+    for page_no in range(pages):
+        page = doc.new_page()
+        y = 72
+        for line in lines:
+            page.insert_text((72, y), line, fontsize=10)
+            y += 14
+        page.insert_text((72, 760), f'Page {page_no + 1} of {pages}', fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+def generate_inputs(work_dir, so_pages, so_items, job_docs, job_pages):
+    """Create the synthetic sales order and job folder PDFs and return their paths."""
+    so_lines = [SALES_ORDER_LINES[i % len(SALES_ORDER_LINES)] for i in range(so_items)]
+    so_path = os.path.join(work_dir, 'sales_order.pdf')
+    make_pdf(so_path, so_lines, so_pages)
+
+    job_paths = []
+    for i in range(job_docs):
+        path = os.path.join(work_dir, f'job_doc_{i + 1}.pdf')
+        make_pdf(path, [f'Project document {i + 1}', 'Pump schedule', 'Drawing notes'] * 10, job_pages)
+        job_paths.append(path)
+    return so_path, job_paths
+
+
+def build_form(job_name, filters, so_path, job_paths):
+    data = {
+        'customer': 'Benchmark Customer',
+        'job_name': job_name,
+        'phone': '555-0100',
+        'filter_count': str(filters),
+        'inlet_count': '4',
+        'inlet_size': '2"',
+        'sales_order': (open(so_path, 'rb'), os.path.basename(so_path)),
+        'job_folder': [(open(p, 'rb'), f'job/{os.path.basename(p)}') for p in job_paths],
+    }
+    for i in range(1, filters + 1):
+        data[f'filter_name_{i}'] = f'Filter {i}'
+        data[f'primary_flow_rate_{i}'] = str(1000 + 100 * i)
+        data[f'backwash_rate_{i}'] = str(500 + 50 * i)
+        data[f'total_dynamic_head_{i}'] = f'{40 + i} feet'
+    return data
+
+
+def run_build(index, args, so_path, job_paths):
+    job_name = f'bench_{os.getpid()}_{index}'
+    data = build_form(job_name, args.filters, so_path, job_paths)
+    client = app.test_client()
+    start = time.perf_counter()
+    try:
+        response = client.post('/', data=data, content_type='multipart/form-data')
+        elapsed = time.perf_counter() - start
+        build_id = response.headers.get('X-Build-Id')
+        record = metrics.get_build(build_id) if build_id else None
+        return {
+            'job_name': job_name,
+            'status_code': response.status_code,
+            'content_type': response.headers.get('Content-Type'),
+            'response_bytes': len(response.data),
+            'latency_seconds': elapsed,
+            'build_id': build_id,
+            'record': record,
+        }
+    finally:
+        for value in data.values():
+            files = value if isinstance(value, list) else [value]
+            for f in files:
+                if isinstance(f, tuple):
+                    f[0].close()
+
+
+def percentiles(values):
+    """Linear-interpolated percentiles plus min/max/mean of a list of numbers."""
+    if not values:
+        return {}
+    ordered = sorted(values)
+    result = {'min': ordered[0], 'max': ordered[-1], 'mean': sum(ordered) / len(ordered)}
+    for p in PERCENTILES:
+        k = (len(ordered) - 1) * p / 100
+        lo = int(k)
+        hi = min(lo + 1, len(ordered) - 1)
+        result[f'p{p}'] = ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+    return {key: round(value, 6) for key, value in result.items()}
+
+
+def summarize(builds, elapsed):
+    stage_walls = {}
+    stage_cpus = {}
+    peak_memory = {}
+    output_sizes = []
+    files_skipped = 0
+    for b in builds:
+        record = b['record']
+        if not record:
+            continue
+        for stage, totals in record['stages'].items():
+            stage_walls.setdefault(stage, []).append(totals['wall_seconds'])
+            stage_cpus.setdefault(stage, []).append(totals['cpu_seconds'])
+        for s in record['spans']:
+            if s.get('peak_memory_bytes') is not None:
+                peak_memory[s['stage']] = max(peak_memory.get(s['stage'], 0), s['peak_memory_bytes'])
+        if record.get('output_size'):
+            output_sizes.append(record['output_size'])
+        files_skipped += record.get('files_skipped') or 0
+
+    ok = [b for b in builds if b['status_code'] == 200]
+    return {
+        'builds': len(builds),
+        'succeeded': len(ok),
+        'elapsed_seconds': round(elapsed, 6),
+        'throughput_builds_per_minute': round(len(ok) / elapsed * 60, 3) if elapsed else None,
+        'latency_seconds': percentiles([b['latency_seconds'] for b in builds]),
+        'stages': {
+            stage: {
+                'wall_seconds': percentiles(stage_walls[stage]),
+                'cpu_seconds': percentiles(stage_cpus[stage]),
+                'peak_memory_bytes': peak_memory.get(stage),
+            }
+            for stage in stage_walls
+        },
+        'output_size_bytes': percentiles(output_sizes),
+        'response_bytes': percentiles([b['response_bytes'] for b in ok]),
+        'zip_responses': sum(1 for b in ok if b['content_type'] == 'application/zip'),
+        'files_skipped': files_skipped,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def remove_outputs(job_names):
+    """Delete the manuals, cover pages and warning files written by the benchmark builds."""
+    for job_name in job_names:
+        for path in glob.glob(os.path.join(OUTPUT_FOLDER, f'*{job_name}*')):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def print_report(summary, baseline=None):
+    print(f"{summary['succeeded']}/{summary['builds']} builds in {summary['elapsed_seconds']:.2f}s "
+          f"({summary['throughput_builds_per_minute']} builds/min, {summary['files_skipped']} files skipped)")
+    lat = summary['latency_seconds']
+    print(f"latency p50 {lat['p50']:.3f}s  p90 {lat['p90']:.3f}s  p99 {lat['p99']:.3f}s  max {lat['max']:.3f}s")
+    if summary['output_size_bytes']:
+        print(f"output size p50 {summary['output_size_bytes']['p50'] / 1024:.1f} KB")
+
+    header = f"{'stage':<24}{'p50 (s)':>10}{'p90 (s)':>10}{'p99 (s)':>10}{'cpu p50':>10}"
+    if baseline:
+        header += f"{'base p50':>10}{'change':>9}"
+    print(header)
+    for stage, s in sorted(summary['stages'].items(), key=lambda kv: -kv[1]['wall_seconds']['p50']):
+        wall = s['wall_seconds']
+        line = f"{stage:<24}{wall['p50']:>10.3f}{wall['p90']:>10.3f}{wall['p99']:>10.3f}{s['cpu_seconds']['p50']:>10.3f}"
+        if baseline:
+            base = baseline['stages'].get(stage, {}).get('wall_seconds', {}).get('p50')
+            if base:
+                line += f"{base:>10.3f}{(wall['p50'] - base) / base:>+9.1%}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--builds', type=int, default=4, help='Total number of builds to run')
+    parser.add_argument('--concurrency', type=int, default=1, help='Builds in flight at once')
+    parser.add_argument('--warmup', type=int, default=1, help='Builds run first and left out of the results')
+    parser.add_argument('--so-pages', type=int, default=2, help='Pages in the synthetic sales order')
+    parser.add_argument('--so-items', type=int, default=len(SALES_ORDER_LINES), help='Item lines per sales order page')
+    parser.add_argument('--job-docs', type=int, default=5, help='Documents in the synthetic job folder')
+    parser.add_argument('--job-pages', type=int, default=4, help='Pages per job folder document')
+    parser.add_argument('--filters', type=int, default=2, help='Number of filters entered on the form')
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/pipeline_<time>_<rev>.json)')
+    parser.add_argument('--compare', help='Earlier results file to compare stage p50s against')
+    parser.add_argument('--keep-output', action='store_true', help='Keep the generated manuals in the output folder')
+    parser.add_argument('--verbose', action='store_true', help='Show build logging')
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        so_path, job_paths = generate_inputs(work_dir, args.so_pages, args.so_items, args.job_docs, args.job_pages)
+
+        job_names = []
+        try:
+            for i in range(args.warmup):
+                job_names.append(run_build(f'warmup{i}', args, so_path, job_paths)['job_name'])
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                builds = list(pool.map(lambda i: run_build(i, args, so_path, job_paths), range(args.builds)))
+            elapsed = time.perf_counter() - start
+            job_names.extend(b['job_name'] for b in builds)
+        finally:
+            if not args.keep_output:
+                remove_outputs(job_names)
+
+    summary = summarize(builds, elapsed)
+    revision = git_revision()
+    results = {
+        'benchmark': 'pipeline',
+        'git_revision': revision,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'fill_workers': FILL_WORKERS,
+            'memory_source': 'tracemalloc' if metrics.TRACE_MEMORY else 'rss',
+        },
+        'parameters': {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'keep_output')},
+        'summary': summary,
+        'builds': [
+            {k: v for k, v in b.items() if k != 'record'} | {'stages': b['record']['stages'] if b['record'] else None}
+            for b in builds
+        ],
+    }
+
+    output_path = args.output
+    if not output_path:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output_path = os.path.join(RESULTS_DIR, f"pipeline_{time.strftime('%Y%m%d_%H%M%S')}_{revision or 'norev'}.json")
+    with open(output_path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['summary']
+    print_report(summary, baseline)
+    print(f"Results written to {output_path}")
+
+
+if __name__ == '__main__':
+    main()
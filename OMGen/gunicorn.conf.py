@@ -0,0 +1,28 @@
+# gunicorn.conf.py
+# Usage (from the OMGen directory): gunicorn -c gunicorn.conf.py wsgi:app
+import os
+
+# Load the app once in the master so the memory-mapped document library
+# (utils/shared_library.py) is inherited by every forked worker.
+os.environ.setdefault('OMGEN_PRELOAD_LIBRARY', '1')
+preload_app = True
+
+bind = os.environ.get('OMGEN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('OMGEN_WORKERS', 2))
+# Large manuals can take minutes to build
+timeout = int(os.environ.get('OMGEN_TIMEOUT', 300))
+
+
+def when_ready(server):
+    # With preload_app the app is already imported here; warm it up once in the master
+    # so every (re)forked worker starts with the libraries and caches loaded.
+    if preload_app:
+        from app import warm_up
+        warm_up()
+
+
+def post_worker_init(worker):
+    # Without preload_app each worker imports the app itself; warm it before it serves
+    if not preload_app:
+        from app import warm_up
+        warm_up()
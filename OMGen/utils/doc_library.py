@@ -0,0 +1,246 @@
+# utils/doc_library.py
+"""
+Normalized, pre-validated copies of the static document library.
+
+The maintenance docs, warranty docs and templates are repaired, garbage-collected
+and compressed once with PyMuPDF into a cache folder, and a catalog records each
+file's page count, size and validity. merge_pdfs reads the normalized copies and
+skips validation for catalogued files whose source has not changed since ingestion.
+
+Run an ingestion by hand (from the OMGen directory) with:
+    python -m utils.doc_library [--force]
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from utils.startup import lazy_module
+
+# Imported on first use (see utils/startup.py)
+fitz = lazy_module('fitz')  # PyMuPDF
+PyPDF2 = lazy_module('PyPDF2')
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Source folders ingested into the library; only their top-level PDFs are included
+# (generated files such as template_cache/filled are left alone).
+LIBRARY_DIRS = ('maintenance_docs', 'warranty_docs', 'template_cache')
+
+CACHE_DIR = os.environ.get('OMGEN_LIBRARY_CACHE', os.path.join(PROJECT_DIR, 'library_cache'))
+CATALOG_PATH = os.path.join(CACHE_DIR, 'catalog.json')
+
+_lock = threading.Lock()
+_catalog = {}
+_catalog_stamp = None
+_ingest_thread = None
+
+
+def _library_key(path):
+    """Catalog key of a library file (path relative to the project), or None if it isn't one."""
+    try:
+        rel = os.path.relpath(os.path.abspath(path), PROJECT_DIR)
+    except ValueError:  # Different drive on Windows
+        return None
+    folder, _, name = rel.replace(os.sep, '/').partition('/')
+    if folder not in LIBRARY_DIRS or not name or '/' in name:
+        return None
+    return f'{folder}/{name}'
+
+
+def _source_files():
+    for folder in LIBRARY_DIRS:
+        source_dir = os.path.join(PROJECT_DIR, folder)
+        if not os.path.isdir(source_dir):
+            continue
+        for name in sorted(os.listdir(source_dir)):
+            path = os.path.join(source_dir, name)
+            if name.lower().endswith('.pdf') and os.path.isfile(path):
+                yield f'{folder}/{name}', path
+
+
+def _load_catalog():
+    """Reload the catalog from disk if another process (or an earlier run) rewrote it."""
+    global _catalog, _catalog_stamp
+    try:
+        stat = os.stat(CATALOG_PATH)
+    except OSError:
+        return
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    if stamp == _catalog_stamp:
+        return
+    try:
+        with open(CATALOG_PATH) as f:
+            _catalog = json.load(f)
+        _catalog_stamp = stamp
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read document catalog {CATALOG_PATH}: {e}")
+
+
+def _save_catalog():
+    global _catalog_stamp
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='catalog.', suffix='.tmp', dir=CACHE_DIR)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(_catalog, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, CATALOG_PATH)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    stat = os.stat(CATALOG_PATH)
+    _catalog_stamp = (stat.st_mtime_ns, stat.st_size)
+
+
+def _normalize(key, source_path, stat):
+    """Write the normalized copy of one library file and return its catalog entry."""
+    entry = {
+        'source_mtime_ns': stat.st_mtime_ns,
+        'source_size': stat.st_size,
+        'normalized': None,
+        'valid': False,
+        'repaired': False,
+        'pages': None,
+        'size': None,
+        'error': None,
+        'ingested_at': time.time(),
+    }
+    dest_path = os.path.join(CACHE_DIR, *key.split('/'))
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(dest_path) + '.', suffix='.tmp',
+                                   dir=os.path.dirname(dest_path))
+    os.close(fd)
+    try:
+        with fitz.open(source_path, filetype='pdf') as doc:
+            if doc.page_count == 0:
+                raise ValueError("PDF has no pages")
+            entry['repaired'] = bool(doc.is_repaired)
+            doc.save(tmp_path, garbage=4, deflate=True, clean=True)
+        # The merge itself uses PyPDF2, so the normalized copy must parse there too
+        with open(tmp_path, 'rb') as f:
+            entry['pages'] = len(PyPDF2.PdfReader(f).pages)
+        os.replace(tmp_path, dest_path)
+        entry.update(normalized=key, valid=True, size=os.path.getsize(dest_path))
+    except Exception as e:
+        entry['error'] = str(e) or type(e).__name__
+        logger.warning(f"Library document {key} could not be normalized: {entry['error']}")
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    return entry
+
+
+def ingest(force=False):
+    """
+    Normalize new or changed library files and drop entries whose source is gone.
+
+    Args:
+        force: Re-normalize every file even if its catalog entry is current
+    Returns:
+        Dict with counts of 'normalized', 'unchanged', 'invalid' and 'removed' files
+    """
+    summary = {'normalized': 0, 'unchanged': 0, 'invalid': 0, 'removed': 0}
+    with _lock:
+        _load_catalog()
+        catalog = dict(_catalog)
+
+    seen = set()
+    for key, source_path in _source_files():
+        seen.add(key)
+        stat = os.stat(source_path)
+        current = catalog.get(key)
+        if (not force and current
+                and current['source_mtime_ns'] == stat.st_mtime_ns
+                and current['source_size'] == stat.st_size
+                and (not current['valid'] or os.path.exists(os.path.join(CACHE_DIR, current['normalized'])))):
+            summary['unchanged'] += 1
+            continue
+        entry = _normalize(key, source_path, stat)
+        catalog[key] = entry
+        if entry['valid']:
+            summary['normalized'] += 1
+            logger.info(f"Normalized {key}: {entry['source_size']} -> {entry['size']} bytes, {entry['pages']} pages")
+        else:
+            summary['invalid'] += 1
+
+    for key in set(catalog) - seen:
+        entry = catalog.pop(key)
+        summary['removed'] += 1
+        if entry.get('normalized'):
+            try:
+                os.unlink(os.path.join(CACHE_DIR, entry['normalized']))
+            except OSError:
+                pass
+
+    with _lock:
+        _catalog.clear()
+        _catalog.update(catalog)
+        _save_catalog()
+    logger.info(f"Document library ingestion finished: {summary}")
+    return summary
+
+
+def start_background_ingest():
+    """Run ingest() in a daemon thread so startup isn't blocked; lookups miss until it's done."""
+    global _ingest_thread
+    if _ingest_thread is not None and _ingest_thread.is_alive():
+        return _ingest_thread
+
+    def _run():
+        try:
+            ingest()
+        except Exception as e:
+            logger.error(f"Document library ingestion failed: {e}")
+
+    _ingest_thread = threading.Thread(target=_run, name='doc-library-ingest', daemon=True)
+    _ingest_thread.start()
+    return _ingest_thread
+
+
+def lookup(path):
+    """
+    Return the catalog entry for a library file, or None if the file isn't catalogued
+    or has changed since it was ingested. Valid entries carry the absolute
+    'normalized_path' of the normalized copy.
+    """
+    key = _library_key(path)
+    if key is None:
+        return None
+    with _lock:
+        _load_catalog()
+        entry = _catalog.get(key)
+    if entry is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if (stat.st_mtime_ns, stat.st_size) != (entry['source_mtime_ns'], entry['source_size']):
+        return None
+    if not entry['valid']:
+        return dict(entry, normalized_path=None)
+    normalized_path = os.path.join(CACHE_DIR, *entry['normalized'].split('/'))
+    if not os.path.exists(normalized_path):
+        return None
+    return dict(entry, normalized_path=normalized_path)
+
+
+def documents():
+    """Yield (key, entry) for every current, valid library document (entries as from lookup())."""
+    for key, path in _source_files():
+        entry = lookup(path)
+        if entry is not None and entry['valid']:
+            yield key, entry
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Normalize the OMGen document library into the cache folder.")
+    parser.add_argument('--force', action='store_true', help='Re-normalize files even if they are unchanged')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    print(json.dumps(ingest(force=args.force), indent=2))
@@ -1,23 +1,152 @@
 # utils/excel_utils.py
-import pandas as pd
+"""
+Job metadata from project workbooks (OT sheets).
 
-def extract_job_metadata(excel_path):
+Only the header row and the first few data rows of the first sheet are read. .xlsx/.xlsm
+files are streamed with openpyxl in read-only mode; legacy .xls files fall back to
+pandas (xlrd) limited to the same rows. Both libraries are imported on first use.
+"""
+import datetime
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# Metadata key -> header words (case-insensitive) that identify its column. A synonym
+# matches whole words only, so 'tel' finds "Tel." but not "Hotel". Keys are checked in
+# order for each header, so a "Job Name" column is job_number, not project.
+COLUMN_SYNONYMS = {
+    'project': ['project'],
+    'customer': ['customer', 'client', 'sold to'],
+    'ship_date': ['ship', 'shipping', 'shipped', 'shipment'],
+    'job_number': ['job'],
+    'phone': ['phone', 'telephone', 'tel'],
+}
+
+# JSON file ({"key": ["synonym", ...]}) that extends or overrides COLUMN_SYNONYMS
+SYNONYMS_FILE = os.environ.get('OMGEN_METADATA_SYNONYMS')
+
+# Rows searched for the header row, and data rows below it searched for each value
+HEADER_SCAN_ROWS = 10
+DATA_SCAN_ROWS = 5
+
+
+def load_synonyms(path=SYNONYMS_FILE):
+    """COLUMN_SYNONYMS updated from the optional synonyms JSON file."""
+    synonyms = {key: list(values) for key, values in COLUMN_SYNONYMS.items()}
+    if path:
+        try:
+            with open(path) as f:
+                for key, values in json.load(f).items():
+                    synonyms[key] = [values] if isinstance(values, str) else list(values)
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning(f"Could not load metadata synonyms from {path}: {e}")
+    return synonyms
+
+
+def _word_pattern(word):
+    return re.compile(r'(?<!\w)' + re.escape(word.strip().lower()) + r'(?!\w)')
+
+
+def _match_column(header, synonyms):
+    text = str(header).strip().lower()
+    if not text:
+        return None
+    for key, words in synonyms.items():
+        if any(word.strip() and _word_pattern(word).search(text) for word in words):
+            return key
+    return None
+
+
+def _clean_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.date().isoformat() if isinstance(value, datetime.datetime) else value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return value.strip()
+    if hasattr(value, 'item'):  # numpy scalar from the pandas fallback
+        return _clean_value(value.item())
+    return value
+
+
+def _is_blank(value):
+    return value is None or value == '' or value != value  # NaN from pandas
+
+
+def metadata_from_rows(rows, synonyms=None):
+    """
+    Pick the metadata out of the leading rows of a sheet. The header row is the first
+    row (within HEADER_SCAN_ROWS) with a recognised column, else the first non-empty
+    row. Each value is the first non-blank cell below its header within DATA_SCAN_ROWS.
+    """
+    synonyms = synonyms or load_synonyms()
+    rows = list(rows)
+    header_index = None
+    for i, row in enumerate(rows[:HEADER_SCAN_ROWS]):
+        if any(not _is_blank(c) and _match_column(c, synonyms) for c in row):
+            header_index = i
+            break
+    if header_index is None:
+        header_index = next((i for i, row in enumerate(rows) if any(not _is_blank(c) for c in row)), None)
+    if header_index is None:
+        return {}
+
+    columns = {}
+    for col, header in enumerate(rows[header_index]):
+        key = None if _is_blank(header) else _match_column(header, synonyms)
+        if key and key not in columns:  # First matching column wins
+            columns[key] = col
+
+    metadata = {}
+    data_rows = rows[header_index + 1:header_index + 1 + DATA_SCAN_ROWS]
+    for key, col in columns.items():
+        for row in data_rows:
+            if col < len(row) and not _is_blank(row[col]):
+                metadata[key] = _clean_value(row[col])
+                break
+    return metadata
+
+
+def _leading_rows_openpyxl(source):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        return list(ws.iter_rows(max_row=HEADER_SCAN_ROWS + DATA_SCAN_ROWS, values_only=True))
+    finally:
+        wb.close()
+
+
+def _leading_rows_pandas(source):
+    import pandas as pd
+
+    df = pd.read_excel(source, header=None, nrows=HEADER_SCAN_ROWS + DATA_SCAN_ROWS)
+    return [tuple(row) for row in df.itertuples(index=False)]
+
+
+def extract_job_metadata(excel_path, filename=None, synonyms=None):
+    """
+    Return the job metadata ('project', 'customer', 'ship_date', 'job_number', 'phone',
+    plus any extra synonym keys) found in the first sheet of a workbook.
+
+    Args:
+        excel_path: Path or binary file object of the workbook
+        filename: Original filename, used to pick the reader when excel_path is a stream
+        synonyms: Column synonym map (default: load_synonyms())
+    Returns:
+        Dict of the values found; empty if the workbook can't be read
+    """
+    name = (filename or (excel_path if isinstance(excel_path, str) else '')).lower()
     try:
-        df = pd.read_excel(excel_path)
-        metadata = {}
-
-        # Example logic: look for known columns
-        for col in df.columns:
-            if 'project' in col.lower():
-                metadata['project'] = df[col].iloc[0]
-            elif 'customer' in col.lower():
-                metadata['customer'] = df[col].iloc[0]
-            elif 'ship' in col.lower():
-                metadata['ship_date'] = df[col].iloc[0]
-            elif 'job' in col.lower():
-                metadata['job_number'] = df[col].iloc[0]
-
-        return metadata
+        if name.endswith('.xls'):
+            rows = _leading_rows_pandas(excel_path)
+        else:
+            rows = _leading_rows_openpyxl(excel_path)
+        return metadata_from_rows(rows, synonyms)
     except Exception as e:
-        print(f"Error reading Excel file: {e}")
-        return {}
\ No newline at end of file
+        logger.error(f"Error reading Excel file {filename or excel_path}: {e}")
+        return {}
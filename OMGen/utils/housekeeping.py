@@ -0,0 +1,358 @@
+# utils/housekeeping.py
+"""
+Retention and eviction for OMGen's working directories.
+
+Each managed directory has a budget: a maximum total size and/or a maximum age.
+A sweep deletes files older than the age limit. It then evicts the least recently
+used files (by the later of access and modification time) until the directory fits
+its size limit.
+
+Files that a build has registered with in_use() are never evicted. Each in_use() block
+also writes a marker file listing its paths under STATE_DIR, so the sweeper sees files
+in use by builds in other processes too. No file younger than the grace period is
+evicted either, which covers downloads still streaming out.
+
+start() runs sweeps in a daemon thread. Under gunicorn with preload_app that thread
+lives in the master only, so there is a single sweeper per host. After each sweep it
+publishes its counters to STATE_DIR, and stats() in the workers reports those.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+DAY = 24 * 60 * 60
+
+# Seconds between background sweeps
+SWEEP_INTERVAL = int(os.environ.get('OMGEN_HOUSEKEEPING_INTERVAL', 300))
+
+# Files younger than this are never evicted
+GRACE_SECONDS = int(os.environ.get('OMGEN_HOUSEKEEPING_GRACE', 15 * 60))
+
+# Prefix of the section header pages written to the system temp directory
+SECTION_HEADER_PREFIX = 'omgen_header_'
+
+# In-use markers and published sweep stats, shared by all processes on the host
+STATE_DIR = os.environ.get('OMGEN_HOUSEKEEPING_STATE_DIR',
+                           os.path.join(tempfile.gettempdir(), 'omgen_housekeeping'))
+IN_USE_DIR = os.path.join(STATE_DIR, 'in_use')
+STATS_PATH = os.path.join(STATE_DIR, 'stats.json')
+
+# Markers older than this were left by a process that died mid-build (where its pid
+# can't be checked, i.e. on Windows)
+MARKER_MAX_AGE = 6 * 60 * 60
+
+
+class Budget:
+    """Retention limits for the files directly inside one directory."""
+
+    def __init__(self, name, path, max_bytes=None, max_age=None, prefix='', suffixes=None):
+        self.name = name
+        self.path = path
+        # Per-directory overrides, e.g. OMGEN_RETENTION_OUTPUT_MB=4096, OMGEN_RETENTION_OUTPUT_DAYS=60
+        env = f'OMGEN_RETENTION_{name.upper()}'
+        if os.environ.get(f'{env}_MB'):
+            max_bytes = int(float(os.environ[f'{env}_MB']) * MB)
+        if os.environ.get(f'{env}_DAYS'):
+            max_age = float(os.environ[f'{env}_DAYS']) * DAY
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.prefix = prefix
+        self.suffixes = tuple(suffixes) if suffixes else None
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        self.last_usage = None
+
+    def matches(self, name):
+        if self.prefix and not name.startswith(self.prefix):
+            return False
+        return self.suffixes is None or name.lower().endswith(self.suffixes)
+
+    def to_dict(self):
+        return {
+            'path': self.path,
+            'max_bytes': self.max_bytes,
+            'max_age_seconds': self.max_age,
+            'evicted_files': self.evicted_files,
+            'evicted_bytes': self.evicted_bytes,
+            **(self.last_usage or {}),
+        }
+
+
+def default_budgets(base_dir):
+    """Budgets for the directories the app writes to, relative to the OMGen folder."""
+    output_dir = os.path.join(base_dir, 'output')
+    return [
+        Budget('output', output_dir, max_bytes=2048 * MB, max_age=30 * DAY, suffixes=('.pdf', '.txt', '.zip', '.sections.json')),
+        Budget('metrics', os.path.join(output_dir, 'metrics'), max_bytes=50 * MB, max_age=30 * DAY, suffixes=('.json',)),
+        Budget('previews', os.path.join(output_dir, 'previews'), max_bytes=256 * MB, max_age=7 * DAY, suffixes=('.png',)),
+        Budget('filled_templates', os.path.join(base_dir, 'template_cache', 'filled'), max_bytes=512 * MB, max_age=DAY, suffixes=('.pdf',)),
+        Budget('filled_maintenance', os.path.join(base_dir, 'maintenance_docs', 'filled'), max_bytes=256 * MB, max_age=DAY, suffixes=('.pdf',)),
+        Budget('thumbnails', os.path.join(base_dir, 'template_cache', '.thumbnails'), max_bytes=100 * MB, suffixes=('.png',)),
+        Budget('section_headers', tempfile.gettempdir(), max_age=DAY, prefix=SECTION_HEADER_PREFIX, suffixes=('.pdf',)),
+    ]
+
+
+_lock = threading.Lock()
+_in_use = {}
+_budgets = []
+_sweeps = 0
+_last_sweep = None
+_thread = None
+_stop = threading.Event()
+
+
+def _write_json(path, data):
+    """Write data to path atomically, so readers never see a partial file."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def _write_marker(keys):
+    path = os.path.join(IN_USE_DIR, f'{os.getpid()}-{uuid.uuid4().hex}.json')
+    try:
+        _write_json(path, keys)
+    except OSError as e:
+        # The grace period still covers the build, just not past GRACE_SECONDS
+        logger.warning(f"Could not write in-use marker {path}: {e}")
+        return None
+    return path
+
+
+def _pid_alive(pid):
+    if os.name == 'nt':
+        return True  # os.kill(pid, 0) would terminate it; rely on MARKER_MAX_AGE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _shared_in_use(now=None):
+    """Paths listed by the in-use markers of all processes. Stale markers are removed."""
+    now = now or time.time()
+    paths = set()
+    try:
+        entries = list(os.scandir(IN_USE_DIR))
+    except FileNotFoundError:
+        return paths
+    for entry in entries:
+        if not entry.name.endswith('.json'):
+            continue
+        try:
+            pid = int(entry.name.split('-', 1)[0])
+            if now - entry.stat().st_mtime > MARKER_MAX_AGE or not _pid_alive(pid):
+                os.remove(entry.path)
+                continue
+            with open(entry.path) as f:
+                paths.update(json.load(f))
+        except FileNotFoundError:
+            continue  # Its build finished while it was being read
+        except (OSError, ValueError) as e:
+            logger.debug(f"Skipping in-use marker {entry.path}: {e}")
+    return paths
+
+
+@contextmanager
+def in_use(paths):
+    """Protect the given files from eviction for the duration of the block."""
+    keys = [os.path.abspath(p) for p in paths if p]
+    marker = _write_marker(keys) if keys else None
+    with _lock:
+        for key in keys:
+            _in_use[key] = _in_use.get(key, 0) + 1
+    try:
+        yield
+    finally:
+        with _lock:
+            for key in keys:
+                if _in_use[key] <= 1:
+                    del _in_use[key]
+                else:
+                    _in_use[key] -= 1
+        if marker:
+            try:
+                os.remove(marker)
+            except OSError as e:
+                logger.warning(f"Could not remove in-use marker {marker}: {e}")
+
+
+def configure(budgets):
+    """Replace the set of managed directories."""
+    global _budgets
+    with _lock:
+        _budgets = list(budgets)
+
+
+def _scan(budget):
+    files = []
+    try:
+        with os.scandir(budget.path) as it:
+            for entry in it:
+                if not budget.matches(entry.name):
+                    continue
+                try:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                last_used = max(stat.st_atime, stat.st_mtime)
+                files.append((last_used, stat.st_mtime, stat.st_size, entry.path))
+    except FileNotFoundError:
+        pass
+    return files
+
+
+def _evict(budget, path, size, reason):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        # Files still open elsewhere can't be removed on Windows; try again next sweep
+        logger.warning(f"Could not evict {path}: {e}")
+        return False
+    budget.evicted_files += 1
+    budget.evicted_bytes += size
+    logger.info(f"Evicted {path} ({size} bytes, {reason})")
+    return True
+
+
+def sweep_budget(budget, now=None):
+    """Apply one budget; returns (files_evicted, bytes_evicted)."""
+    now = now or time.time()
+    files = sorted(_scan(budget))  # least recently used first
+    with _lock:
+        protected = set(_in_use)
+    protected |= _shared_in_use(now)
+
+    def _evictable(mtime, path):
+        return path not in protected and now - mtime >= GRACE_SECONDS
+
+    evicted_files = evicted_bytes = 0
+    kept = []
+    for last_used, mtime, size, path in files:
+        if (budget.max_age is not None and now - last_used > budget.max_age
+                and _evictable(mtime, path) and _evict(budget, path, size, 'expired')):
+            evicted_files += 1
+            evicted_bytes += size
+        else:
+            kept.append((last_used, mtime, size, path))
+
+    total = sum(f[2] for f in kept)
+    if budget.max_bytes is not None and total > budget.max_bytes:
+        for last_used, mtime, size, path in list(kept):
+            if total <= budget.max_bytes:
+                break
+            if _evictable(mtime, path) and _evict(budget, path, size, 'over size budget'):
+                kept.remove((last_used, mtime, size, path))
+                total -= size
+                evicted_files += 1
+                evicted_bytes += size
+
+    budget.last_usage = {
+        'files': len(kept),
+        'bytes': total,
+        'oldest_age_seconds': round(now - kept[0][0], 1) if kept else None,
+        'over_budget': budget.max_bytes is not None and total > budget.max_bytes,
+    }
+    return evicted_files, evicted_bytes
+
+
+def sweep():
+    """Run every configured budget once. Returns the total files and bytes evicted."""
+    global _sweeps, _last_sweep
+    with _lock:
+        budgets = list(_budgets)
+    evicted_files = evicted_bytes = 0
+    for budget in budgets:
+        try:
+            files, size = sweep_budget(budget)
+        except Exception as e:
+            logger.error(f"Housekeeping of {budget.path} failed: {e}")
+            continue
+        evicted_files += files
+        evicted_bytes += size
+    _sweeps += 1
+    _last_sweep = time.time()
+    if evicted_files:
+        logger.info(f"Housekeeping evicted {evicted_files} files ({evicted_bytes / MB:.1f} MB)")
+    try:
+        _write_json(STATS_PATH, _local_stats())
+    except OSError as e:
+        logger.warning(f"Could not publish housekeeping stats to {STATS_PATH}: {e}")
+    return evicted_files, evicted_bytes
+
+
+def start(interval=SWEEP_INTERVAL):
+    """Sweep now and then every `interval` seconds in a daemon thread."""
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return _thread
+
+    def _run():
+        while True:
+            try:
+                sweep()
+            except Exception as e:
+                logger.error(f"Housekeeping sweep failed: {e}")
+            if _stop.wait(interval):
+                break
+
+    _stop.clear()
+    _thread = threading.Thread(target=_run, name='housekeeping', daemon=True)
+    _thread.start()
+    return _thread
+
+
+def stop():
+    _stop.set()
+
+
+def _local_stats():
+    with _lock:
+        budgets = list(_budgets)
+    return {
+        'pid': os.getpid(),
+        'sweeps': _sweeps,
+        'last_sweep': _last_sweep,
+        'interval_seconds': SWEEP_INTERVAL,
+        'grace_seconds': GRACE_SECONDS,
+        'files_in_use': len(_shared_in_use()),
+        'directories': {b.name: b.to_dict() for b in budgets},
+    }
+
+
+def stats():
+    """
+    Per-directory usage and eviction counters as of the last sweep. A process that
+    hasn't swept itself (a gunicorn worker) reports the stats the sweeper published.
+    """
+    if _sweeps == 0:
+        try:
+            with open(STATS_PATH) as f:
+                published = json.load(f)
+            published['files_in_use'] = len(_shared_in_use())
+            return published
+        except (OSError, ValueError):
+            pass
+    return _local_stats()
@@ -0,0 +1,390 @@
+# utils/manual_builder.py
+"""
+The manual build pipeline without the web layer, shared by the Flask app and the
+batch CLI (batch_build.py): keyword extraction, template matching and filling,
+required and warranty documents, cover page and the sectioned merge.
+"""
+import logging
+import os
+
+from utils.pdf_utils import (
+    generate_cover_page,
+    extract_items_from_sales_order,
+    match_templates,
+    merge_pdfs,
+    find_warranty_documents,
+    fill_gutter_maintenance_doc,
+)
+from utils import metrics
+from utils import housekeeping
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_FOLDER = os.path.join(PROJECT_DIR, 'template_cache')
+MAINTENANCE_DOCS = os.path.join(PROJECT_DIR, 'maintenance_docs')
+WARRANTY_DOCS = os.path.join(PROJECT_DIR, 'warranty_docs')
+OUTPUT_FOLDER = os.path.join(PROJECT_DIR, 'output')
+
+GUTTER_FIELD_KEYS = [
+    'inlet_count',
+    'inlet_size',
+    'drawing_number',
+    'gutter_option',
+    'has_grating',
+    'gutter_features_text',
+]
+
+def parse_filters_data(form):
+    """Collect flow data for each filter on the form, skipping filters with no values."""
+    filter_count = int(form.get('filter_count', '1'))
+    filters_data = []
+    for i in range(1, filter_count + 1):
+        filter_data = {
+            'filter_name': form.get(f'filter_name_{i}', f'Filter {i}'),
+            'primary_flow_rate': form.get(f'primary_flow_rate_{i}', ''),
+            'backwash_rate': form.get(f'backwash_rate_{i}', ''),
+            'total_dynamic_head': form.get(f'total_dynamic_head_{i}', ''),
+            'filter_id': str(i)  # Store the filter ID for mapping
+        }
+        # Only add filters that have at least one value filled
+        if any(value for key, value in filter_data.items() if key not in ['filter_name', 'filter_id']):
+            filters_data.append(filter_data)
+            logger.info(f"Added flow data for {filter_data['filter_name']}")
+    return filters_data
+
+def parse_template_mappings(form):
+    """Return (template_mappings, template_count) from the template browser's hidden inputs."""
+    template_mappings = {}
+    template_count = int(form.get('template_count', '0'))
+    for i in range(template_count):
+        template_name = form.get(f'template_name_{i}', '')
+        filter_id = form.get(f'template_filter_map_{i}', '')
+        if template_name and filter_id:
+            template_mappings[template_name] = filter_id
+            logger.info(f"Mapped template '{template_name}' to filter ID {filter_id}")
+    return template_mappings, template_count
+
+def parse_gutter_data(form):
+    """Collect the optional gutter fields; returns None when all of them are blank."""
+    gutter_features = form.getlist('gutter_features') or []
+    raw_has_grating = form.get('has_grating')
+    # Only record a value when the checkbox is actually checked; otherwise treat as blank
+    has_grating = 'Yes' if raw_has_grating == 'yes' else ''
+
+    gutter_data = {
+        'inlet_count': form.get('inlet_count', ''),
+        'inlet_size': form.get('inlet_size', ''),
+        'drawing_number': form.get('drawing_number', ''),
+        'gutter_option': form.get('gutter_option', ''),
+        'has_grating': has_grating,
+        'gutter_features': gutter_features,
+        'gutter_features_text': ", ".join(gutter_features) if gutter_features else ''
+    }
+
+    # If all gutter fields are effectively empty, disable gutter_data entirely
+    if not any(gutter_data.get(k) for k in GUTTER_FIELD_KEYS):
+        return None
+    return gutter_data
+
+def parse_flatten_option(form):
+    """Return True/False when the form chooses form flattening, or None to use the server default."""
+    value = form.get('flatten_forms', '').lower()
+    if value in ('yes', 'no'):
+        return value == 'yes'
+    return None
+
+def extract_keywords(so_path, job_folder_paths):
+    """Extract deduplicated item keywords from the sales order and job folder PDFs."""
+    logger.info("Extracting keywords from sales order...")
+    with metrics.span('keyword_extraction', file=os.path.basename(so_path)):
+        item_keywords = extract_items_from_sales_order(so_path)
+    logger.info(f"Keywords from sales order: {item_keywords}")
+
+    # Also look for keywords in the uploaded job folder PDFs
+    logger.info("Processing job folder PDFs for additional keywords...")
+    for pdf_path in job_folder_paths:
+        try:
+            with metrics.span('keyword_extraction', file=os.path.basename(pdf_path)):
+                additional_keywords = extract_items_from_sales_order(pdf_path)
+            logger.info(f"Keywords from {os.path.basename(pdf_path)}: {additional_keywords}")
+            item_keywords.extend(additional_keywords)
+        except Exception as e:
+            logger.error(f"Error processing {pdf_path}: {str(e)}")
+
+    # Remove duplicates and normalize keywords
+    item_keywords = list(set(item_keywords))
+    logger.info(f"Final deduplicated keywords: {item_keywords}")
+    return item_keywords
+
+def add_required_documents(item_keywords, templates, maintenance_docs, warranty_docs, filters_data):
+    """
+    Append the always-include maintenance/warranty documents and swap in any filled
+    maintenance docs. Returns the updated (maintenance_docs, warranty_docs).
+    """
+    def _append_unique(seq, item):
+        if item and item not in seq:
+            seq.append(item)
+
+    # 1) Always append Prevent-p-poster.pdf to end of Maintenance section
+    prevent_p_path = os.path.join(MAINTENANCE_DOCS, "Prevent-p-poster.pdf")
+    if os.path.exists(prevent_p_path):
+        _append_unique(maintenance_docs, prevent_p_path)
+        logger.info("Appended required maintenance doc: Prevent-p-poster.pdf")
+    else:
+        logger.warning(f"Required maintenance doc missing: {prevent_p_path}")
+
+    # Determine if project contains a filter
+    keywords_lower = [k.lower() for k in item_keywords]
+    has_filter = any(any(term in k for term in ["filter", "regenerator"]) for k in keywords_lower)
+    if not has_filter:
+        has_filter = bool(filters_data)  # flow data implies filters present
+    if not has_filter:
+        try:
+            has_filter = any("filter" in os.path.basename(t).lower() for t in templates)
+        except Exception:
+            has_filter = has_filter
+    logger.info(f"Project contains filter: {has_filter}")
+
+    # 2) If project contains a filter, append Valve Series 30/31 PDF to Maintenance
+    valve_doc_path = os.path.join(MAINTENANCE_DOCS, "Valve Series 30 Wafer and Series 31-416 standard.pdf")
+    if has_filter:
+        if os.path.exists(valve_doc_path):
+            _append_unique(maintenance_docs, valve_doc_path)
+            logger.info("Appended valve document for filter projects: Valve Series 30 Wafer and Series 31-416 standard.pdf")
+        else:
+            logger.warning(f"Valve document missing (expected for filter projects): {valve_doc_path}")
+
+    # 3) Always append Sales Bulletin to end of Warranty section
+    sales_bulletin_path = os.path.join(WARRANTY_DOCS, "SALES BULLETIN 84-4-R W-LOGO revformat7-2021.pdf")
+    if os.path.exists(sales_bulletin_path):
+        _append_unique(warranty_docs, sales_bulletin_path)
+        logger.info("Appended required warranty doc: SALES BULLETIN 84-4-R W-LOGO revformat7-2021.pdf")
+    else:
+        logger.warning(f"Required warranty doc missing: {sales_bulletin_path}")
+
+    # After maintenance_docs list is finalized, replace any items with their
+    # filled counterparts from MAINTENANCE_DOCS/filled when present.
+    try:
+        filled_dir = os.path.join(MAINTENANCE_DOCS, 'filled')
+        if os.path.isdir(filled_dir):
+            # Build mapping from original basename -> filled path
+            filled_map = {}
+            for fname in os.listdir(filled_dir):
+                if not fname.lower().endswith('.pdf'):
+                    continue
+                # For files like filled_gutter_care.pdf, infer original name
+                lower = fname.lower()
+                if lower.startswith('filled_') and len(fname) > len('filled_'):
+                    orig = fname[len('filled_'):]
+                    filled_map[orig.lower()] = os.path.join(filled_dir, fname)
+            if filled_map:
+                new_maintenance = []
+                for p in maintenance_docs:
+                    base = os.path.basename(p).lower()
+                    if base in filled_map:
+                        logger.info(f"Using filled maintenance doc for {base}: {os.path.basename(filled_map[base])}")
+                        new_maintenance.append(filled_map[base])
+                    else:
+                        new_maintenance.append(p)
+                maintenance_docs = new_maintenance
+    except Exception as e:
+        logger.error(f"Error swapping in filled maintenance docs: {e}")
+
+    return maintenance_docs, warranty_docs
+
+def filter_job_files(job_folder_paths):
+    """Drop job folder PDFs that look like templates so only selected templates are used."""
+    filtered_job_files = []
+    for p in job_folder_paths:
+        base = os.path.basename(p).lower()
+        if 'template' in base:
+            logger.info(f"Excluding job folder file that looks like a template: {base}")
+            continue
+        filtered_job_files.append(p)
+    return filtered_job_files
+
+def build_manual(customer, job_name, phone, so_path, job_folder_paths=None, filters_data=None,
+                 template_mappings=None, use_only_selected=False, gutter_data=None, flatten=None,
+                 output_dir=OUTPUT_FOLDER):
+    """
+    Build the manual for one job from files already on disk.
+
+    Args:
+        customer, job_name, phone: Cover page fields; job_name also names the output
+        so_path: Path to the sales order PDF
+        job_folder_paths: Paths of the job folder PDFs
+        filters_data: Flow data per filter, as collected from the form
+        template_mappings: Template filename -> filter ID mapping
+        use_only_selected: Only use the templates in template_mappings
+        gutter_data: Optional gutter fields
+        flatten: Flatten filled forms (None uses the server default)
+        output_dir: Folder the manual (and any warnings file) is written to
+    Returns:
+        Dict with 'success', 'message', 'output_path', 'warning_path' (None unless files
+        were skipped), 'skipped_files', 'fill_failures' and 'files_merged'
+    """
+    job_folder_paths = list(job_folder_paths or [])
+    template_mappings = template_mappings or {}
+
+    # For backward compatibility, use the first filter's data as the main flow_data
+    flow_data = filters_data[0] if filters_data else {
+        'filter_name': 'Filter 1',
+        'primary_flow_rate': '',
+        'backwash_rate': '',
+        'total_dynamic_head': '',
+    }
+
+    # Extract items from sales order and the uploaded job folder PDFs
+    item_keywords = extract_keywords(so_path, job_folder_paths)
+
+    # Match templates and maintenance docs
+    logger.info(f"Looking for templates and maintenance docs in {TEMPLATE_FOLDER}")
+    logger.info(f"Maintenance docs directory: {os.path.join(TEMPLATE_FOLDER, 'maintenance_docs')}")
+    logger.info(f"Maintenance docs exist: {os.path.exists(os.path.join(TEMPLATE_FOLDER, 'maintenance_docs'))}")
+    logger.info(f"Processing with {len(filters_data) if filters_data else 0} filters")
+    
+    fill_failures = []
+    with metrics.span('template_matching'):
+        templates, maintenance_docs = match_templates(
+            item_keywords,
+            TEMPLATE_FOLDER,
+            flow_data=flow_data,
+            filters_data=filters_data,
+            template_mappings=template_mappings,
+            gutter_data=gutter_data,
+            use_only_selected=use_only_selected,
+            fill_failures=fill_failures,
+            flatten=flatten
+        )
+    for template_name, reason in fill_failures:
+        logger.warning(f"Using unfilled template {template_name}: {reason}")
+    logger.info(f"Matched templates: {[os.path.basename(t) for t in templates]}")
+    logger.info(f"Total templates returned: {len(templates)}")
+    logger.info(f"Matched maintenance docs: {[os.path.basename(d) for d in maintenance_docs]}")
+
+    # If any gutter data provided, ensure gutter_care.pdf is filled with those fields
+    if gutter_data and any(gutter_data.get(k) for k in GUTTER_FIELD_KEYS):
+        try:
+            gutter_care_path = os.path.join(MAINTENANCE_DOCS, 'gutter_care.pdf')
+            if os.path.exists(gutter_care_path):
+                filled_gutter_care = fill_gutter_maintenance_doc(gutter_care_path, gutter_data, flatten=flatten)
+                # Replace existing occurrence or append
+                replaced = False
+                for i, p in enumerate(maintenance_docs):
+                    if os.path.basename(p).lower() == 'gutter_care.pdf':
+                        maintenance_docs[i] = filled_gutter_care
+                        replaced = True
+                        break
+                if not replaced:
+                    maintenance_docs.append(filled_gutter_care)
+                logger.info("Processed gutter_care.pdf with gutter data")
+            else:
+                logger.warning(f"gutter_care.pdf not found in maintenance docs folder: {gutter_care_path}")
+        except Exception as e:
+            logger.error(f"Error preparing gutter_care.pdf: {e}")
+
+    # Find warranty docs based on keywords and append as last section
+    warranty_docs = find_warranty_documents(item_keywords)
+    logger.info(f"Matched warranty docs: {[os.path.basename(d) for d in warranty_docs]}")
+
+    # Always-include documents, then swap in filled maintenance docs
+    maintenance_docs, warranty_docs = add_required_documents(
+        item_keywords, templates, maintenance_docs, warranty_docs, filters_data
+    )
+
+    # Create cover page with flow data from all filters
+    with metrics.span('cover_generation'):
+        cover_pdf_path = generate_cover_page(customer, job_name, phone, filters_data=filters_data)
+    logger.info(f"Generated cover page: {cover_pdf_path}")
+
+    # Organize files into sections
+    output_pdf_path = os.path.join(output_dir, f'{job_name}_Manual.pdf')
+    logger.info(f"Merging PDFs into: {output_pdf_path}")
+    
+    # Log organization of files
+    logger.info("Files organized by section:")
+    logger.info(f"1. Cover page: {cover_pdf_path}")
+    logger.info("2. Equipment Templates:")
+    for i, template in enumerate(templates, 1):
+        logger.info(f"   {i}. {os.path.basename(template)}")
+    logger.info("3. Maintenance & Operation Guides:")
+    for i, doc in enumerate(maintenance_docs, 1):
+        logger.info(f"   {i}. {os.path.basename(doc)}")
+    logger.info("4. Project Documentation:")
+    for i, pdf in enumerate(job_folder_paths, 1):
+        logger.info(f"   {i}. {os.path.basename(pdf)}")
+    
+    # Create sections dictionary for organized merging
+    sections = {
+        'cover': cover_pdf_path,
+        'templates': templates,
+        'maintenance': maintenance_docs,
+        # job_files will be set after filtering
+        'job_files': [],
+        'warranty': warranty_docs,
+    }
+    
+    # Log detailed information about templates
+    logger.info("Templates to be included in the manual:")
+    for i, template in enumerate(templates):
+        logger.info(f"  {i+1}. {os.path.basename(template)}")
+    
+    # When users upload their Job Folder, it may contain extra template PDFs.
+    # To ensure ONLY explicitly selected templates are included, exclude any
+    # job folder PDFs that appear to be templates (e.g., filename contains 'template').
+    filtered_job_files = filter_job_files(job_folder_paths)
+
+    # Update sections with filtered job files
+    sections['job_files'] = filtered_job_files
+
+    # For backward compatibility, keep a list of all PDFs
+    all_pdfs = [cover_pdf_path] + templates + maintenance_docs + filtered_job_files + warranty_docs
+    logger.info(f"Total PDFs to merge: {len(all_pdfs)}")
+    logger.info(f"Templates count: {len(templates)}")
+    logger.info(f"Maintenance docs count: {len(maintenance_docs)}")
+    logger.info(f"Warranty docs count: {len(warranty_docs)}")
+    logger.info(f"Job files count: {len(filtered_job_files)} (filtered out {len(job_folder_paths) - len(filtered_job_files)} template-like files)")
+    
+    with housekeeping.in_use(all_pdfs + [output_pdf_path]):
+        success, message, skipped_files = merge_pdfs(all_pdfs, output_pdf_path, organized=True, sections=sections)
+
+    record = metrics.current_build()
+    if record is not None:
+        record.info.update({
+            'files_merged': len(all_pdfs),
+            'files_skipped': len(skipped_files),
+            'fill_failures': fill_failures,
+            'output_size': os.path.getsize(output_pdf_path) if success and os.path.exists(output_pdf_path) else None,
+            'output_path': output_pdf_path if success else None,
+        })
+    
+    result = {
+        'success': success,
+        'message': message,
+        'output_path': output_pdf_path if success else None,
+        'warning_path': None,
+        'skipped_files': skipped_files,
+        'fill_failures': fill_failures,
+        'files_merged': len(all_pdfs),
+    }
+    if not success:
+        logger.error("Failed to create output PDF")
+        return result
+    
+    # If we have skipped files but still created a PDF, write a warning file for the user
+    if skipped_files:
+        skipped_msg = "Warning: Some documents were skipped:\n"
+        for file, reason in skipped_files:
+            skipped_msg += f"- {os.path.basename(file)}: {reason}\n"
+        logger.warning(skipped_msg)
+        
+        # Create a warning file next to the PDF
+        warning_path = os.path.splitext(output_pdf_path)[0] + "_warnings.txt"
+        with open(warning_path, "w") as f:
+            f.write(skipped_msg)
+        
+        result['warning_path'] = warning_path
+
+    logger.info(f"Successfully created manual at: {output_pdf_path}")
+    return result
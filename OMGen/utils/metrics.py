@@ -0,0 +1,277 @@
+# utils/metrics.py
+"""
+Lightweight stage timing and memory instrumentation for the manual build pipeline.
+
+A build is wrapped in ``build()``; stages inside it are wrapped in ``span()``. Each
+span records wall time, CPU time of the calling thread and memory. With
+OMGEN_TRACE_MEMORY=1 that is the tracemalloc peak above the span's starting level;
+otherwise it is the growth of the process' current RSS (read from /proc, so only on
+Linux) between the start and end of the span. Both are process-wide, so builds running
+at the same time in one process show up in each other's figures. Finished builds are
+written as JSON records and folded into per-stage histograms that ``snapshot()``
+returns for the /metrics endpoint.
+
+Histograms live in process memory, so under gunicorn each worker reports its own;
+the per-build JSON files are the durable record.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+TRACE_MEMORY = os.environ.get('OMGEN_TRACE_MEMORY', '0') == '1'
+
+# Upper bounds (seconds) of the wall/CPU time histogram buckets
+HISTOGRAM_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float('inf'))
+
+# Number of finished build records kept in memory for lookup by build id
+RECENT_BUILDS = 50
+
+_local = threading.local()
+_lock = threading.Lock()
+# Builds currently relying on tracemalloc; tracing started here stops when the last
+# of them finishes
+_tracing_builds = 0
+_started_tracing = False
+_histograms = {}
+_recent_builds = deque(maxlen=RECENT_BUILDS)
+
+
+class BuildRecord:
+    """Spans and metadata collected for a single build."""
+
+    def __init__(self, build_id=None, **info):
+        self.build_id = build_id or uuid.uuid4().hex
+        self.info = info
+        self.started_at = time.time()
+        self.status = 'running'
+        self.spans = []
+
+    def add_span(self, stage, wall, cpu, peak_memory=None, **labels):
+        self.spans.append({
+            'stage': stage,
+            'wall_seconds': round(wall, 6),
+            'cpu_seconds': round(cpu, 6),
+            'peak_memory_bytes': peak_memory,
+            **labels,
+        })
+
+    def stage_totals(self):
+        """Sum wall and CPU time per stage (stages like 'fill' occur once per template)."""
+        totals = {}
+        for s in self.spans:
+            t = totals.setdefault(s['stage'], {'count': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+            t['count'] += 1
+            t['wall_seconds'] += s['wall_seconds']
+            t['cpu_seconds'] += s['cpu_seconds']
+        return totals
+
+    def to_dict(self):
+        return {
+            'build_id': self.build_id,
+            'started_at': self.started_at,
+            'status': self.status,
+            'memory_source': 'tracemalloc' if TRACE_MEMORY else 'rss',
+            **self.info,
+            'stages': self.stage_totals(),
+            'spans': self.spans,
+        }
+
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):  # Not available on Windows
+    _PAGE_SIZE = None
+
+
+def _current_rss_bytes():
+    """Resident set size of this process now (not the high-water mark), or None."""
+    if _PAGE_SIZE is None:
+        return None
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _SpanState:
+    def __init__(self):
+        self.child_peak = 0
+        if TRACE_MEMORY and tracemalloc.is_tracing():
+            self.base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        else:
+            self.base = _current_rss_bytes()
+
+    def peak(self):
+        """Memory above the level at span start, including nested spans."""
+        if TRACE_MEMORY and tracemalloc.is_tracing():
+            own = tracemalloc.get_traced_memory()[1] - self.base
+        elif self.base is not None:
+            current = _current_rss_bytes()
+            if current is None:
+                return None
+            own = current - self.base
+        else:
+            return None
+        return max(own, self.child_peak)
+
+
+def current_build():
+    """Return the BuildRecord of the build running on this thread, if any."""
+    return getattr(_local, 'record', None)
+
+
+def record_span(stage, wall, cpu, peak_memory=None, **labels):
+    """Record a span measured elsewhere (e.g. in a worker process) on the current build."""
+    record = current_build()
+    if record is not None:
+        record.add_span(stage, wall, cpu, peak_memory, **labels)
+
+
+@contextmanager
+def span(stage, **labels):
+    """Time a pipeline stage. Extra keyword arguments are stored as span labels."""
+    stack = getattr(_local, 'spans', None)
+    if stack is None:
+        stack = _local.spans = []
+    state = _SpanState()
+    stack.append(state)
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.thread_time() - cpu_start
+        stack.pop()
+        peak = state.peak()
+        if stack and peak is not None:
+            # Carry this span's peak up to the parent, rebased on the parent's start level
+            # (with tracemalloc, reset_peak() here hid the peak from the parent)
+            stack[-1].child_peak = max(stack[-1].child_peak, peak + state.base - stack[-1].base)
+        record_span(stage, wall, cpu, peak, **labels)
+
+
+@contextmanager
+def build(output_dir=None, **info):
+    """
+    Collect spans for one build on this thread. On exit the record is added to the
+    stage histograms and, when output_dir is given, written to <output_dir>/<build_id>.json.
+    """
+    record = BuildRecord(**info)
+    _local.record = record
+    if TRACE_MEMORY:
+        _acquire_tracing()
+    try:
+        with span('build'):
+            yield record
+        if record.status == 'running':
+            record.status = 'ok'
+    except Exception:
+        record.status = 'error'
+        raise
+    finally:
+        _local.record = None
+        if TRACE_MEMORY:
+            _release_tracing()
+        _observe(record)
+        if output_dir:
+            _write_record(record, output_dir)
+
+
+def _acquire_tracing():
+    global _tracing_builds, _started_tracing
+    with _lock:
+        if _tracing_builds == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        _tracing_builds += 1
+
+
+def _release_tracing():
+    global _tracing_builds, _started_tracing
+    with _lock:
+        _tracing_builds -= 1
+        if _tracing_builds == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+
+def _observe(record):
+    with _lock:
+        _recent_builds.append(record.to_dict())
+        for s in record.spans:
+            h = _histograms.setdefault(s['stage'], {
+                'count': 0,
+                'wall_seconds_sum': 0.0,
+                'cpu_seconds_sum': 0.0,
+                'peak_memory_bytes_max': 0,
+                'wall_seconds_buckets': [0] * len(HISTOGRAM_BUCKETS),
+                'cpu_seconds_buckets': [0] * len(HISTOGRAM_BUCKETS),
+            })
+            h['count'] += 1
+            h['wall_seconds_sum'] += s['wall_seconds']
+            h['cpu_seconds_sum'] += s['cpu_seconds']
+            if s['peak_memory_bytes'] is not None:
+                h['peak_memory_bytes_max'] = max(h['peak_memory_bytes_max'], s['peak_memory_bytes'])
+            for key in ('wall_seconds', 'cpu_seconds'):
+                for i, bound in enumerate(HISTOGRAM_BUCKETS):
+                    if s[key] <= bound:
+                        h[f'{key}_buckets'][i] += 1
+                        break
+
+
+def _write_record(record, output_dir):
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, f'{record.build_id}.json')
+        with open(path, 'w') as f:
+            json.dump(record.to_dict(), f, indent=2)
+    except Exception as e:
+        logger.error(f"Could not write build metrics record: {e}")
+
+
+def get_build(build_id):
+    """Return the in-memory record of a recently finished build, or None."""
+    with _lock:
+        for record in reversed(_recent_builds):
+            if record['build_id'] == build_id:
+                return record
+    return None
+
+
+def snapshot():
+    """Aggregated per-stage histograms (cumulative bucket counts) for this process."""
+    bounds = ['+Inf' if b == float('inf') else b for b in HISTOGRAM_BUCKETS]
+    stages = {}
+    with _lock:
+        for stage, h in _histograms.items():
+            entry = {
+                'count': h['count'],
+                'wall_seconds_sum': round(h['wall_seconds_sum'], 6),
+                'cpu_seconds_sum': round(h['cpu_seconds_sum'], 6),
+                'peak_memory_bytes_max': h['peak_memory_bytes_max'],
+            }
+            for key in ('wall_seconds', 'cpu_seconds'):
+                cumulative, running = [], 0
+                for bound, n in zip(bounds, h[f'{key}_buckets']):
+                    running += n
+                    cumulative.append({'le': bound, 'count': running})
+                entry[f'{key}_histogram'] = cumulative
+            stages[stage] = entry
+        recent = [r['build_id'] for r in _recent_builds]
+    return {
+        'pid': os.getpid(),
+        'memory_source': 'tracemalloc' if TRACE_MEMORY else 'rss',
+        'stages': stages,
+        'recent_builds': recent,
+    }
@@ -1,16 +1,33 @@
 # utils/pdf_utils.py
+import io
+import json
 import tempfile
-import fitz  # PyMuPDF
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
 import os
-from PyPDF2 import PdfMerger, PdfReader
 import re
 import logging
+import threading
 import time  # Added for timestamp generation
+from concurrent.futures import ProcessPoolExecutor
+from utils import metrics
+from utils import doc_library
+from utils import shared_library
+from utils.housekeeping import SECTION_HEADER_PREFIX
+from utils.startup import lazy_module
+
+# Imported on first use (see utils/startup.py)
+fitz = lazy_module('fitz')  # PyMuPDF
+canvas = lazy_module('reportlab.pdfgen.canvas')
+pagesizes = lazy_module('reportlab.lib.pagesizes')
+PyPDF2 = lazy_module('PyPDF2')
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of worker processes used to fill templates in parallel (1 = serial)
+FILL_WORKERS = int(os.environ.get('OMGEN_FILL_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Flatten filled form fields into static page content by default (OMGEN_FLATTEN_FORMS=1)
+FLATTEN_FORMS = os.environ.get('OMGEN_FLATTEN_FORMS', '0') == '1'
+
 def extract_items_from_sales_order(pdf_path):
     doc = fitz.open(pdf_path)
     keywords = set()
@@ -347,7 +364,163 @@ def find_warranty_documents(keywords):
         logger.error(f"Error searching warranty documents: {e}")
         return []
 
-def match_templates(keywords, template_dir, flow_data=None, filters_data=None, template_mappings=None, gutter_data=None, use_only_selected=False):
+def _fill_template(template_path, filters_data, template_mappings, gutter_data, flatten=None):
+    """
+    Fill a single matched template with the filter/gutter data that applies to it.
+
+    Runs in a worker process when template filling is parallel, so it only takes
+    picklable arguments. Returns (path, failure) where path is the filled copy or the
+    original template, and failure is a reason string when a fill was attempted but
+    the original had to be used.
+    """
+    template_name = os.path.basename(template_path)
+    logger.info(f"Checking template: {template_name}")
+    has_flow_fields = check_template_for_flow_fields(template_path)
+    has_gutter_fields = check_template_for_gutter_fields(template_path)
+    logger.info(f"Template {template_name} has flow fields: {has_flow_fields}")
+    logger.info(f"Template {template_name} has gutter fields: {has_gutter_fields}")
+
+    if has_flow_fields:
+        # Check if we have a mapping for this template
+        mapped_filter_id = None
+        if template_mappings and template_name in template_mappings:
+            mapped_filter_id = template_mappings[template_name]
+            logger.info(f"Found mapping for template {template_name}: filter ID {mapped_filter_id}")
+
+        # If we have a mapping, use only that filter's data
+        if mapped_filter_id and filters_data:
+            # Find the filter with the matching ID
+            matched_filter = None
+            for filter_data in filters_data:
+                if filter_data.get('filter_id') == mapped_filter_id:
+                    matched_filter = filter_data
+                    break
+
+            if not matched_filter:
+                logger.warning(f"Mapped filter ID {mapped_filter_id} not found, using original template")
+                return template_path, f"Mapped filter ID {mapped_filter_id} not found"
+
+            filter_name = matched_filter.get('filter_name', f"Filter {mapped_filter_id}")
+            logger.info(f"Using mapped filter: {filter_name} for template {template_name}")
+
+            # Create a unique name for this filter's copy of the template
+            output_dir = os.path.join(os.path.dirname(template_path), 'filled')
+            os.makedirs(output_dir, exist_ok=True)
+            filter_name_safe = filter_name.replace(' ', '_').replace('/', '_').replace('\\', '_')
+
+            # Create a unique identifier
+            timestamp = int(time.time() * 1000)
+            unique_id = f'{filter_name_safe}_{timestamp}'
+
+            # Fill the template with this filter's data
+            filled_path = fill_pdf_form_fields(template_path, matched_filter, filter_name=unique_id, gutter_data=gutter_data, flatten=flatten)
+            if filled_path:
+                logger.info(f"Successfully filled template for {filter_name}, path: {filled_path}")
+                return filled_path, None
+            logger.warning(f"Could not fill fields for {filter_name}, using original template")
+            return template_path, f"Could not fill fields for {filter_name}"
+
+        # If no mapping or mapping failed, use the old approach (try each filter in turn)
+        if filters_data:
+            logger.info(f"No mapping for template {template_name}, creating copies for all filters")
+            for i, filter_data in enumerate(filters_data):
+                filter_name = filter_data.get('filter_name', f'Filter {i+1}')
+                logger.info(f"Processing filter {i+1}/{len(filters_data)}: {filter_name}")
+
+                # Create a unique name for this filter's copy of the template
+                output_dir = os.path.join(os.path.dirname(template_path), 'filled')
+                os.makedirs(output_dir, exist_ok=True)
+                filter_name_safe = filter_name.replace(' ', '_').replace('/', '_').replace('\\', '_')
+
+                # Create a unique identifier
+                timestamp = int(time.time() * 1000) + i
+                unique_id = f'{filter_name_safe}_{timestamp}'
+
+                # Try to fill the template with this filter's data
+                filled_path = fill_pdf_form_fields(template_path, filter_data, filter_name=unique_id, gutter_data=gutter_data, flatten=flatten)
+                if filled_path:
+                    logger.info(f"Successfully filled template for {filter_name}, path: {filled_path}")
+                    return filled_path, None  # Only use the first successful fill
+
+            # If no filter worked, add the original template
+            logger.warning(f"Could not fill template with any filter data, using original")
+            return template_path, "Could not fill template with any filter data"
+
+        # No filters data available
+        logger.info(f"No filter data available for template {template_name}")
+        return template_path, None
+
+    # If no flow fields, try gutter-only fill when gutter data is provided
+    if gutter_data and has_gutter_fields and any(gutter_data.get(k) for k in ['inlet_count', 'inlet_size', 'drawing_number']):
+        logger.info(f"Template {template_name} has gutter fields and gutter_data; attempting gutter fill")
+        filled_path = fill_pdf_form_fields(template_path, {}, filter_name=None, gutter_data=gutter_data, flatten=flatten)
+        if filled_path:
+            return filled_path, None
+        return template_path, "Could not fill gutter fields"
+
+    # For templates without applicable fields, just add the original once
+    logger.info(f"Template {template_name} has no applicable fields, adding as-is")
+    return template_path, None
+
+def _fill_template_safely(template_path, filters_data, template_mappings, gutter_data, flatten=None):
+    """
+    Wrapper around _fill_template that turns unexpected errors into a fallback to the
+    original. Returns (path, failure, wall_seconds, cpu_seconds) so timings measured in a
+    worker process can be recorded by the parent.
+    """
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        path, failure = _fill_template(template_path, filters_data, template_mappings, gutter_data, flatten)
+    except Exception as e:
+        logger.error(f"Error filling template {os.path.basename(template_path)}: {e}")
+        path, failure = template_path, f"Error: {e}"
+    return path, failure, time.perf_counter() - wall_start, time.thread_time() - cpu_start
+
+def _fill_templates(template_list, filters_data, template_mappings, gutter_data, fill_failures=None, flatten=None):
+    """
+    Fill every template in template_list, across a bounded process pool when there is
+    more than one template and FILL_WORKERS > 1.
+
+    The result has one path per template in the same order as template_list, so the
+    output is identical to filling them one after another. Templates that fail to fill
+    fall back to the original and are reported in fill_failures as (name, reason).
+    """
+    workers = min(FILL_WORKERS, len(template_list))
+    if workers <= 1:
+        results = [_fill_template_safely(t, filters_data, template_mappings, gutter_data, flatten) for t in template_list]
+    else:
+        logger.info(f"Filling {len(template_list)} templates across {workers} worker processes")
+        results = []
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(_fill_template_safely, t, filters_data, template_mappings, gutter_data, flatten)
+                    for t in template_list
+                ]
+                # Collect in submission order to keep the output deterministic
+                for template_path, future in zip(template_list, futures):
+                    try:
+                        results.append(future.result())
+                    except Exception as e:
+                        logger.error(f"Worker failed filling {os.path.basename(template_path)}: {e}")
+                        results.append((template_path, f"Worker error: {e}", 0.0, 0.0))
+        except Exception as e:
+            # The pool itself could not be used (e.g. process creation failed); fill serially
+            logger.error(f"Process pool unavailable ({e}); filling templates serially")
+            results = [_fill_template_safely(t, filters_data, template_mappings, gutter_data, flatten) for t in template_list]
+
+    filled_templates = []
+    for template_path, (path, failure, wall, cpu) in zip(template_list, results):
+        metrics.record_span('fill', wall, cpu, template=os.path.basename(template_path), filled=path != template_path)
+        filled_templates.append(path)
+        if failure:
+            logger.warning(f"Template {os.path.basename(template_path)} not filled: {failure}")
+            if fill_failures is not None:
+                fill_failures.append((os.path.basename(template_path), failure))
+    return filled_templates
+
+def match_templates(keywords, template_dir, flow_data=None, filters_data=None, template_mappings=None, gutter_data=None, use_only_selected=False, fill=True, fill_failures=None, flatten=None):
     """
     Match templates and include associated maintenance documents with improved matching algorithm.
     
@@ -356,6 +529,10 @@ def match_templates(keywords, template_dir, flow_data=None, filters_data=None, t
         template_dir: Directory containing templates
         flow_data: Optional dictionary containing flow rate information (for backward compatibility)
         filters_data: Optional list of dictionaries containing flow rate information for multiple filters
+        fill: If False, only select templates and maintenance docs; no form fields are filled
+        fill_failures: Optional list that receives (template_name, reason) for each template
+                       that could not be filled and fell back to the original
+        flatten: Flatten filled form fields into page content (see fill_pdf_form_fields)
         
     Returns:
         tuple (templates, maintenance_docs) where:
@@ -480,6 +657,11 @@ def match_templates(keywords, template_dir, flow_data=None, filters_data=None, t
             non_flow = [t for t in template_list if t not in flow_templates]
             template_list = sorted(list(flow_templates)) + non_flow
     
+    if not fill:
+        logger.info("Fill disabled; returning selected templates without filling")
+        logger.info(f"Found {len(template_list)} templates and {len(maintenance_list)} maintenance docs")
+        return template_list, maintenance_list
+
     # If we have flow data, fill it in the templates
     if filters_data:
         logger.info(f"Filling flow data from {len(filters_data)} filters in matched templates...")
@@ -489,122 +671,14 @@ def match_templates(keywords, template_dir, flow_data=None, filters_data=None, t
         logger.info(f"Processing {len(template_list)} templates for {len(filters_data)} filters")
         logger.info(f"Template paths: {[os.path.basename(t) for t in template_list]}")
         
-        # Clear the filled directory ONCE to avoid using old files
-        filled_dir = os.path.join(template_dir, 'filled')
-        if os.path.exists(filled_dir):
-            logger.info(f"Clearing filled directory: {filled_dir}")
-            try:
-                for file in os.listdir(filled_dir):
-                    if file.endswith('.pdf'):
-                        file_path = os.path.join(filled_dir, file)
-                        os.remove(file_path)
-                        logger.info(f"Removed old file: {file}")
-            except Exception as e:
-                logger.error(f"Error clearing filled directory: {str(e)}")
+        # Filled copies get unique names per build; old ones are evicted by utils.housekeeping
+        # rather than cleared here, which would pull files from under concurrent builds.
         
         # Log template mappings if provided
         if template_mappings:
             logger.info(f"Using template mappings: {template_mappings}")
         
-        for template_path in template_list:
-            template_name = os.path.basename(template_path)
-            logger.info(f"Checking template: {template_name}")
-            has_flow_fields = check_template_for_flow_fields(template_path)
-            has_gutter_fields = check_template_for_gutter_fields(template_path)
-            logger.info(f"Template {template_name} has flow fields: {has_flow_fields}")
-            logger.info(f"Template {template_name} has gutter fields: {has_gutter_fields}")
-            
-            if has_flow_fields:
-                # Check if we have a mapping for this template
-                mapped_filter_id = None
-                if template_mappings and template_name in template_mappings:
-                    mapped_filter_id = template_mappings[template_name]
-                    logger.info(f"Found mapping for template {template_name}: filter ID {mapped_filter_id}")
-                
-                # If we have a mapping, use only that filter's data
-                if mapped_filter_id and filters_data:
-                    # Find the filter with the matching ID
-                    matched_filter = None
-                    for filter_data in filters_data:
-                        if filter_data.get('filter_id') == mapped_filter_id:
-                            matched_filter = filter_data
-                            break
-                    
-                    if matched_filter:
-                        filter_name = matched_filter.get('filter_name', f"Filter {mapped_filter_id}")
-                        logger.info(f"Using mapped filter: {filter_name} for template {template_name}")
-                        
-                        # Create a unique name for this filter's copy of the template
-                        output_dir = os.path.join(os.path.dirname(template_path), 'filled')
-                        os.makedirs(output_dir, exist_ok=True)
-                        base_name = template_name
-                        filter_name_safe = filter_name.replace(' ', '_').replace('/', '_').replace('\\', '_')
-                        
-                        # Create a unique identifier
-                        timestamp = int(time.time() * 1000)
-                        unique_id = f'{filter_name_safe}_{timestamp}'
-                        
-                        # Fill the template with this filter's data
-                        filled_path = fill_pdf_form_fields(template_path, matched_filter, filter_name=unique_id, gutter_data=gutter_data)
-                        
-                        if filled_path:
-                            logger.info(f"Successfully filled template for {filter_name}, path: {filled_path}")
-                            filled_templates.append(filled_path)
-                        else:
-                            logger.warning(f"Could not fill fields for {filter_name}, using original template")
-                            filled_templates.append(template_path)
-                    else:
-                        logger.warning(f"Mapped filter ID {mapped_filter_id} not found, using original template")
-                        filled_templates.append(template_path)
-                
-                # If no mapping or mapping failed, use the old approach (create a copy for each filter)
-                elif filters_data and not mapped_filter_id:
-                    logger.info(f"No mapping for template {template_name}, creating copies for all filters")
-                    
-                    # For templates with flow fields, create a copy for each filter
-                    for i, filter_data in enumerate(filters_data):
-                        filter_name = filter_data.get('filter_name', f'Filter {i+1}')
-                        logger.info(f"Processing filter {i+1}/{len(filters_data)}: {filter_name}")
-                        
-                        # Create a unique name for this filter's copy of the template
-                        output_dir = os.path.join(os.path.dirname(template_path), 'filled')
-                        os.makedirs(output_dir, exist_ok=True)
-                        base_name = template_name
-                        filter_name_safe = filter_name.replace(' ', '_').replace('/', '_').replace('\\', '_')
-                        
-                        # Create a unique identifier
-                        timestamp = int(time.time() * 1000) + i
-                        unique_id = f'{filter_name_safe}_{timestamp}'
-                        
-                        # Try to fill the template with this filter's data
-                        filled_path = fill_pdf_form_fields(template_path, filter_data, filter_name=unique_id, gutter_data=gutter_data)
-                        
-                        if filled_path:
-                            logger.info(f"Successfully filled template for {filter_name}, path: {filled_path}")
-                            filled_templates.append(filled_path)
-                            break  # Only use the first successful fill
-                    
-                    # If no filter worked, add the original template
-                    if len(filled_templates) == 0 or filled_templates[-1] != filled_path:
-                        logger.warning(f"Could not fill template with any filter data, using original")
-                        filled_templates.append(template_path)
-                else:
-                    # No filters data available
-                    logger.info(f"No filter data available for template {template_name}")
-                    filled_templates.append(template_path)
-            else:
-                # If no flow fields, try gutter-only fill when gutter data is provided
-                if gutter_data and has_gutter_fields and any(gutter_data.get(k) for k in ['inlet_count', 'inlet_size', 'drawing_number']):
-                    logger.info(f"Template {os.path.basename(template_path)} has gutter fields and gutter_data; attempting gutter fill")
-                    filled_path = fill_pdf_form_fields(template_path, {}, filter_name=None, gutter_data=gutter_data)
-                    if filled_path:
-                        filled_templates.append(filled_path)
-                    else:
-                        filled_templates.append(template_path)
-                else:
-                    # For templates without applicable fields, just add the original once
-                    logger.info(f"Template {os.path.basename(template_path)} has no applicable fields, adding as-is")
-                    filled_templates.append(template_path)
+        filled_templates = _fill_templates(template_list, filters_data, template_mappings, gutter_data, fill_failures, flatten)
                 
         logger.info(f"Final template list contains {len(filled_templates)} templates: {[os.path.basename(t) for t in filled_templates]}")
         
@@ -627,7 +701,7 @@ def match_templates(keywords, template_dir, flow_data=None, filters_data=None, t
         logger.info("Filling flow data in matched templates using legacy flow_data...")
         filled_templates = []
         for template_path in template_list:
-            filled_path = fill_pdf_form_fields(template_path, flow_data)
+            filled_path = fill_pdf_form_fields(template_path, flow_data, flatten=flatten)
             if filled_path:
                 logger.info(f"Filled template {os.path.basename(template_path)} with flow data")
                 filled_templates.append(filled_path)
@@ -638,31 +712,57 @@ def match_templates(keywords, template_dir, flow_data=None, filters_data=None, t
     logger.info(f"Found {len(template_list)} templates and {len(maintenance_list)} maintenance docs")
     return template_list, maintenance_list
 
-def generate_cover_page(customer, job_name, phone, flow_data=None, filters_data=None):
-    """
-    Generate a simplified, centered cover page using the template.
-    Shows only customer, job name, and phone in larger, centered text.
-    """
-    import os
-
-    # Get the template path
-    template_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "Cover Sheet Template.pdf")
-    if not os.path.exists(template_path):
-        logger.error(f"Cover page template not found at: {template_path}")
-        raise FileNotFoundError("Cover page template not found")
+COVER_TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Cover Sheet Template.pdf")
+COVER_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "output")
 
-    # Create output path
-    cover_path = os.path.join("output", f"cover_{job_name}.pdf")
-    os.makedirs(os.path.dirname(cover_path), exist_ok=True)
+# Font of each cover line; a font PyMuPDF can't load falls back to COVER_FALLBACK_FONT
+COVER_FONTS = {'customer': 'Times-Bold', 'job_name': 'helv', 'phone': 'helv'}
+COVER_FALLBACK_FONT = 'Times-Roman'
 
-    logger.info(f"Generating centered cover page for job: {job_name}")
-    logger.info(f"Template path: {template_path}")
-    logger.info(f"Output path: {cover_path}")
+_cover_lock = threading.Lock()
+_cover_template = None  # (template bytes, {line: resolved font name})
 
+def _resolve_font(fontname):
     try:
-        # Open the template PDF
-        doc = fitz.open(template_path)
-        page = doc[0]  # Get first page
+        fitz.Font(fontname)
+        return fontname
+    except Exception as e:
+        logger.warning(f"Cover font '{fontname}' unavailable ({e}); using {COVER_FALLBACK_FONT}")
+        return COVER_FALLBACK_FONT
+
+def load_cover_template():
+    """
+    Read the cover template into memory and resolve the cover fonts. Done once per
+    process (call at startup so forked workers inherit it); later calls reuse the result.
+
+    Returns:
+        Tuple of (template bytes, {line: font name})
+    """
+    global _cover_template
+    with _cover_lock:
+        if _cover_template is None:
+            if not os.path.exists(COVER_TEMPLATE_PATH):
+                logger.error(f"Cover page template not found at: {COVER_TEMPLATE_PATH}")
+                raise FileNotFoundError("Cover page template not found")
+            with open(COVER_TEMPLATE_PATH, 'rb') as f:
+                template = f.read()
+            fonts = {line: _resolve_font(name) for line, name in COVER_FONTS.items()}
+            _cover_template = (template, fonts)
+            logger.info(f"Loaded cover template ({len(template)} bytes), fonts {fonts}")
+        return _cover_template
+
+def render_cover_page(customer, job_name, phone):
+    """
+    Render a simplified, centered cover page from the preloaded template.
+    Shows only customer, job name, and phone in larger, centered text.
+
+    Returns:
+        The cover page PDF as bytes
+    """
+    template, fonts = load_cover_template()
+    logger.info(f"Cover values => customer='{customer}', job_name='{job_name}', phone='{phone}'")
+    with fitz.open(stream=template, filetype='pdf') as doc:
+        page = doc[0]
 
         # Page geometry
         rect = page.rect
@@ -671,62 +771,59 @@ def generate_cover_page(customer, job_name, phone, flow_data=None, filters_data=
         margin_x = 72
         box_width = rect.width - 2 * margin_x
 
-        logger.info(f"Cover values => customer='{customer}', job_name='{job_name}', phone='{phone}'")
-
-        def insert_centered_box(text, fontsize, y_top, fontname="helv"):
+        def insert_centered_box(text, fontsize, y_top, fontname):
             if not text:
                 return y_top
-            text = str(text)
             height = fontsize * 1.8
             box = fitz.Rect(margin_x, y_top, margin_x + box_width, y_top + height)
-            logger.info(f"Cover text '{text}' at box {box}")
-            try:
-                page.insert_textbox(
-                    box,
-                    text,
-                    fontsize=fontsize,
-                    fontname=fontname,
-                    color=(0, 0, 0),
-                    align=1,
-                    overlay=True,
-                )
-            except Exception as e:
-                logger.warning(f"insert_textbox with font '{fontname}' failed: {e}; retrying with Times-Roman")
-                page.insert_textbox(
-                    box,
-                    text,
-                    fontsize=fontsize,
-                    fontname="Times-Roman",
-                    color=(0, 0, 0),
-                    align=1,
-                    overlay=True,
-                )
+            page.insert_textbox(
+                box,
+                str(text),
+                fontsize=fontsize,
+                fontname=fontname,
+                color=(0, 0, 0),
+                align=1,
+                overlay=True,
+            )
             return box.y1
 
         # Draw main lines (bigger and centered) using text boxes for reliable alignment
         y = start_y
-        y = insert_centered_box(customer, 30, y, fontname="Times-Bold")
+        y = insert_centered_box(customer, 30, y, fonts['customer'])
         y += 10
-        y = insert_centered_box(job_name, 26, y)
+        y = insert_centered_box(job_name, 26, y, fonts['job_name'])
         y += 6
-        y = insert_centered_box(phone, 18, y)
-
-        # Save the modified PDF
-        doc.save(cover_path)
-        doc.close()
+        insert_centered_box(phone, 18, y, fonts['phone'])
 
-        logger.info(f"Successfully generated cover page at: {cover_path}")
-        return cover_path
+        return doc.tobytes()
 
+def generate_cover_page(customer, job_name, phone, flow_data=None, filters_data=None):
+    """
+    Render the cover page (see render_cover_page) and write it to output/cover_<job>.pdf
+    for merging. Returns the path of the cover page.
+    """
+    cover_path = os.path.join(COVER_OUTPUT_DIR, f"cover_{job_name}.pdf")
+    logger.info(f"Generating centered cover page for job: {job_name}")
+    try:
+        data = render_cover_page(customer, job_name, phone)
+        os.makedirs(COVER_OUTPUT_DIR, exist_ok=True)
+        # Concurrent builds of the same job must not see a half-written cover
+        tmp_path = f'{cover_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, cover_path)
     except Exception as e:
         logger.error(f"Error generating cover page: {str(e)}")
         raise
 
+    logger.info(f"Successfully generated cover page at: {cover_path}")
+    return cover_path
+
 def validate_pdf(pdf_path):
     """Validate if a PDF file can be opened and read properly."""
     try:
         with open(pdf_path, 'rb') as file:
-            reader = PdfReader(file)
+            reader = PyPDF2.PdfReader(file)
             # Try to read the number of pages to verify the PDF is readable
             num_pages = len(reader.pages)
             return True
@@ -804,7 +901,7 @@ def add_gutter_form_fields_in_pdf(pdf_path):
         logger.error(f"Error processing {pdf_path} for adding gutter form fields: {e}")
         return False
 
-def fill_gutter_maintenance_doc(pdf_path, gutter_data):
+def fill_gutter_maintenance_doc(pdf_path, gutter_data, flatten=None):
     """
     Ensure a gutter maintenance PDF has fields, then fill with gutter_data.
     Returns the filled path if filled, otherwise original path.
@@ -814,7 +911,7 @@ def fill_gutter_maintenance_doc(pdf_path, gutter_data):
         if not has_fields:
             logger.info(f"No gutter fields found in {os.path.basename(pdf_path)}, attempting to add.")
             add_gutter_form_fields_in_pdf(pdf_path)
-        filled = fill_pdf_form_fields(pdf_path, flow_data={}, filter_name=None, gutter_data=gutter_data)
+        filled = fill_pdf_form_fields(pdf_path, flow_data={}, filter_name=None, gutter_data=gutter_data, flatten=flatten)
         return filled or pdf_path
     except Exception as e:
         logger.error(f"Error filling gutter maintenance doc {pdf_path}: {e}")
@@ -906,7 +1003,70 @@ def check_template_for_flow_fields(pdf_path):
         logger.error(f"Error checking template for flow fields: {str(e)}")
         return False
 
-def fill_pdf_form_fields(pdf_path, flow_data, filter_name=None, gutter_data=None):
+# Smallest font size tried when fitting a field value into its widget rectangle
+MIN_FLATTEN_FONTSIZE = 4
+
+def _draw_field_value(page, rect, text, fontsize, color, align=0):
+    """
+    Draw text into rect as static content. Auto-size fields (fontsize 0) start from a
+    size that fits the rect's height; the size shrinks until insert_textbox can fit the
+    text, and a single line is written at the rect's baseline as a last resort.
+    Returns True if the text was drawn.
+    """
+    size = fontsize or max(MIN_FLATTEN_FONTSIZE, min(12, rect.height * 0.7))
+    while size >= MIN_FLATTEN_FONTSIZE:
+        if page.insert_textbox(rect, text, fontsize=size, fontname="helv", color=color,
+                               align=align, overlay=True) >= 0:
+            return True
+        size -= 1
+    if '\n' not in text:
+        # Text wider than the field; it runs past the right edge instead of vanishing
+        baseline = fitz.Point(rect.x0 + 1, rect.y1 - rect.height * 0.25)
+        return page.insert_text(baseline, text, fontsize=MIN_FLATTEN_FONTSIZE, fontname="helv",
+                                color=color, overlay=True) > 0
+    return False
+
+def _flatten_widgets(doc):
+    """
+    Flatten without Document.bake (PyMuPDF < 1.24): draw each widget's value as text,
+    then delete the widget. A widget whose value couldn't be drawn is kept.
+    Returns the number of widgets kept.
+    """
+    kept = 0
+    for page in doc:
+        for widget in list(page.widgets() or []):
+            value = widget.field_value
+            drawn = True
+            if widget.field_type_string in ('Text', 'Choice', 'ComboBox') and value:
+                drawn = _draw_field_value(page, widget.rect, str(value), widget.text_fontsize,
+                                          widget.text_color or (0, 0, 0))
+            elif widget.field_type_string in ('CheckBox', 'RadioButton', 'Button') and value not in (None, '', 'Off', False):
+                drawn = _draw_field_value(page, widget.rect, "X", widget.text_fontsize, (0, 0, 0), align=1)
+            if drawn:
+                page.delete_widget(widget)
+            else:
+                kept += 1
+                logger.warning(f"Could not draw the value of field {widget.field_name} on page {page.number + 1}; leaving it as a form field")
+    return kept
+
+def _flatten_form_fields(doc):
+    """
+    Turn every form field of doc into static page content and remove the AcroForm
+    dictionary, so the document no longer carries interactive widgets.
+    """
+    if hasattr(doc, 'bake'):
+        # PyMuPDF >= 1.24 renders widget appearances into the page content itself
+        doc.bake(annots=False, widgets=True)
+    elif _flatten_widgets(doc):
+        # The fields left behind still need the AcroForm to show their values
+        logger.info("Flattened form fields into page content, except those that could not be drawn")
+        return
+    catalog = doc.pdf_catalog()
+    if doc.xref_get_key(catalog, "AcroForm")[0] != 'null':
+        doc.xref_set_key(catalog, "AcroForm", "null")
+    logger.info("Flattened form fields into page content")
+
+def fill_pdf_form_fields(pdf_path, flow_data, filter_name=None, gutter_data=None, flatten=None):
     """
     Fill PDF form fields with flow rate data.
     
@@ -914,6 +1074,8 @@ def fill_pdf_form_fields(pdf_path, flow_data, filter_name=None, gutter_data=None
         pdf_path: Path to the PDF template
         flow_data: Dictionary containing flow rate information
         filter_name: Optional name of the filter for naming the output file
+        flatten: If True, bake the filled fields into the page content and drop the
+                 AcroForm, so merged manuals carry no live form fields. Defaults to FLATTEN_FORMS.
     
     Returns:
         Path to the filled PDF or None if no fields were filled
@@ -921,6 +1083,8 @@ def fill_pdf_form_fields(pdf_path, flow_data, filter_name=None, gutter_data=None
     logger.info(f"Attempting to fill fields in {os.path.basename(pdf_path)} for filter: {filter_name}")
     logger.info(f"Flow data: {flow_data}")
     logger.info(f"Gutter data: {gutter_data}")
+    if flatten is None:
+        flatten = FLATTEN_FORMS
     try:
         # Open the PDF
         doc = fitz.open(pdf_path)
@@ -1025,16 +1189,18 @@ def fill_pdf_form_fields(pdf_path, flow_data, filter_name=None, gutter_data=None
                     try:
                         # Handle different field types
                         if widget.field_type_string == 'Text':
-                            # Regular text field; rename to a template-specific name first
-                            try:
-                                original_name = widget.field_name or ''
-                                new_name = _make_unique_field_name(original_name, data_key)
-                                widget.field_name = new_name
-                                logger.info(
-                                    f"Renamed flow field '{original_name}' to '{new_name}' in filled PDF"
-                                )
-                            except Exception as rn_err:
-                                logger.warning(f"Could not rename flow field '{field_name}': {rn_err}")
+                            # Regular text field; rename to a template-specific name first.
+                            # Flattened output keeps no fields, so there is nothing to collide.
+                            if not flatten:
+                                try:
+                                    original_name = widget.field_name or ''
+                                    new_name = _make_unique_field_name(original_name, data_key)
+                                    widget.field_name = new_name
+                                    logger.info(
+                                        f"Renamed flow field '{original_name}' to '{new_name}' in filled PDF"
+                                    )
+                                except Exception as rn_err:
+                                    logger.warning(f"Could not rename flow field '{field_name}': {rn_err}")
 
                             widget.field_value = value
                             widget.update()
@@ -1108,15 +1274,16 @@ def fill_pdf_form_fields(pdf_path, flow_data, filter_name=None, gutter_data=None
                         try:
                             if widget.field_type_string == 'Text':
                                 # Rename all gutter text fields to template-specific names
-                                try:
-                                    original_name = widget.field_name or ''
-                                    new_name = _make_unique_field_name(original_name, data_key)
-                                    widget.field_name = new_name
-                                    logger.info(
-                                        f"Renamed gutter field '{original_name}' to '{new_name}' in filled PDF"
-                                    )
-                                except Exception as rn_err:
-                                    logger.warning(f"Could not rename gutter field '{field_name}': {rn_err}")
+                                if not flatten:
+                                    try:
+                                        original_name = widget.field_name or ''
+                                        new_name = _make_unique_field_name(original_name, data_key)
+                                        widget.field_name = new_name
+                                        logger.info(
+                                            f"Renamed gutter field '{original_name}' to '{new_name}' in filled PDF"
+                                        )
+                                    except Exception as rn_err:
+                                        logger.warning(f"Could not rename gutter field '{field_name}': {rn_err}")
 
                                 widget.field_value = value
                                 widget.update()
@@ -1228,9 +1395,15 @@ def fill_pdf_form_fields(pdf_path, flow_data, filter_name=None, gutter_data=None
 
             logger.info(f"Generated filled path: {filled_path}")
 
+            save_options = {}
+            if flatten:
+                _flatten_form_fields(doc)
+                # Drop the now-unreferenced widget objects from the output
+                save_options = {'garbage': 3, 'deflate': True}
+
             # Save the changes, handling Windows permission issues when overwriting
             try:
-                doc.save(filled_path)
+                doc.save(filled_path, **save_options)
                 logger.info(f"Saved filled PDF to: {filled_path} with {fields_modified} fields modified")
                 final_path = filled_path
             except Exception as e:
@@ -1241,7 +1414,7 @@ def fill_pdf_form_fields(pdf_path, flow_data, filter_name=None, gutter_data=None
                     # For gutter_care.pdf this yields filled_gutter_care_<ts>.pdf
                     alt_name = f"filled_{os.path.splitext(base_name)[0]}_{ts}.pdf"
                     alt_path = os.path.join(output_dir, alt_name)
-                    doc.save(alt_path)
+                    doc.save(alt_path, **save_options)
                     logger.info(f"Saved filled PDF to alternate path: {alt_path}")
                     final_path = alt_path
                 except Exception as e2:
@@ -1270,12 +1443,12 @@ def create_section_header(title):
         Path to the generated section header PDF
     """
     # Create a temporary file for the section header
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
+    with tempfile.NamedTemporaryFile(delete=False, prefix=SECTION_HEADER_PREFIX, suffix='.pdf') as tmp:
         header_path = tmp.name
         
     # Create the PDF
-    c = canvas.Canvas(header_path, pagesize=letter)
-    width, height = letter
+    c = canvas.Canvas(header_path, pagesize=pagesizes.letter)
+    width, height = pagesizes.letter
     
     # Add the title
     c.setFont("Helvetica-Bold", 24)
@@ -1288,49 +1461,183 @@ def create_section_header(title):
     c.save()
     return header_path
 
-def organize_files_by_section(cover_page, templates, maintenance_docs, job_files, warranty_docs=None):
+# Generate a page-numbered table of contents instead of including the static
+# maintenance_docs/table_of_contents.pdf (OMGEN_GENERATED_TOC=0 restores the static page)
+GENERATED_TOC = os.environ.get('OMGEN_GENERATED_TOC', '1') == '1'
+
+TOC_TITLE = "Table of Contents"
+TOC_LINES_PER_PAGE = 36
+
+def toc_page_count(line_count):
+    """Pages the generated table of contents takes for the given number of lines."""
+    return max(1, -(-line_count // TOC_LINES_PER_PAGE))
+
+def _document_title(entry):
+    """Reader-facing name of a layout entry for the outline and table of contents."""
+    if entry['kind'] != 'document':
+        return entry['title']
+    if entry['section'] == 'cover':
+        return "Cover Page"
+    name = os.path.splitext(os.path.basename(entry['path']))[0]
+    if name.startswith('filled_'):
+        name = name[len('filled_'):]
+    return name.replace('_', ' ')
+
+def _toc_lines(layout):
+    """(level, title, entry) for each merged entry listed in the table of contents."""
+    lines = []
+    headers = {}
+    current = None
+    for entry in layout:
+        if 'start_page' not in entry or entry['kind'] == 'toc' or entry['section'] == 'cover':
+            continue
+        section = entry['section']
+        if entry['kind'] == 'header':
+            headers[section] = entry['title']
+            current = section
+            lines.append((0, entry['title'], entry))
+        elif section in headers:
+            # A section resumes after a nested one (maintenance docs after the templates)
+            if section != current:
+                current = section
+                lines.append((0, f"{headers[section]} (continued)", entry))
+            lines.append((1, _document_title(entry), entry))
+        else:
+            current = None
+            lines.append((0, _document_title(entry), entry))
+    return lines
+
+def _render_table_of_contents(lines):
     """
-    Organize files into sections with headers.
-    
+    Render the table of contents as an in-memory PDF. lines is a list of
+    (level, title, page number); the result has toc_page_count(len(lines)) pages.
+    """
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=pagesizes.letter)
+    width, height = pagesizes.letter
+    right = width - 72
+    for page_start in range(0, max(len(lines), 1), TOC_LINES_PER_PAGE):
+        c.setFont("Helvetica-Bold", 20)
+        c.drawString(72, height - 72, TOC_TITLE if page_start == 0 else f"{TOC_TITLE} (continued)")
+        c.setStrokeColorRGB(0, 0, 0)
+        c.line(72, height - 84, right, height - 84)
+        y = height - 120
+        for level, title, page_number in lines[page_start:page_start + TOC_LINES_PER_PAGE]:
+            font, size = ("Helvetica-Bold", 12) if level == 0 else ("Helvetica", 11)
+            x = 72 + 18 * level
+            number = str(page_number)
+            number_width = c.stringWidth(number, font, size)
+            # Leave room for the page number and a few leader dots
+            max_width = right - number_width - 24 - x
+            if c.stringWidth(title, font, size) > max_width:
+                while title and c.stringWidth(title + '...', font, size) > max_width:
+                    title = title[:-1]
+                title += '...'
+            c.setFont(font, size)
+            c.drawString(x, y, title)
+            c.drawRightString(right, y, number)
+            dots_start = x + c.stringWidth(title, font, size) + 6
+            dots_end = right - number_width - 6
+            dot_width = c.stringWidth('.', font, size)
+            if dots_end > dots_start:
+                c.drawRightString(dots_end, y, '.' * int((dots_end - dots_start) / dot_width))
+            y -= 16
+        c.showPage()
+    c.save()
+    buffer.seek(0)
+    return buffer
+
+def _insert_table_of_contents(merger, layout, toc_entry):
+    """
+    Insert the generated table of contents where the layout's 'toc' entry was reached,
+    shifting the recorded start pages of everything after it. The number of TOC pages
+    depends only on the number of lines, so the page numbers are final before it is
+    rendered.
+    """
+    position = toc_entry['position']
+    lines = _toc_lines(layout)
+    toc_pages = toc_page_count(len(lines))
+    for entry in layout:
+        if entry.get('start_page', 0) > position:
+            entry['start_page'] += toc_pages
+    toc_entry.update(start_page=position + 1, pages=toc_pages)
+    stream = _render_table_of_contents([(level, title, entry['start_page']) for level, title, entry in lines])
+    merger.merge(position, stream, import_outline=False)
+
+def _add_outline(merger, layout):
+    """
+    Bookmark every merged entry: section headers at the top level with their documents
+    nested beneath, other documents (cover, front matter) at the top level. The source
+    documents' own bookmarks are not imported, so this is the whole outline.
+    """
+    parents = {}
+    for entry in layout:
+        if 'start_page' not in entry:
+            continue
+        page_number = entry['start_page'] - 1
+        if entry['kind'] == 'header':
+            parents[entry['section']] = merger.add_outline_item(entry['title'], page_number, bold=True)
+        else:
+            merger.add_outline_item(_document_title(entry), page_number, parent=parents.get(entry['section']))
+
+SECTION_HEADER_TITLES = {
+    'maintenance': "Maintenance & Operation Guides",
+    'templates': "Equipment Templates",
+    'job_files': "Project Documentation",
+    'warranty': "Warranty Documents",
+}
+
+def plan_section_layout(cover_page, templates, maintenance_docs, job_files, warranty_docs=None):
+    """
+    Compute the ordered layout of the manual without creating any files.
+
     Args:
         cover_page: Path to cover page
         templates: List of template file paths
         maintenance_docs: List of maintenance document paths
         job_files: List of job folder file paths
+        warranty_docs: Optional list of warranty document paths
     Returns:
-        List of organized file paths including section headers
+        List of dicts in merge order. Each entry has 'section' and 'kind'; document
+        entries carry a 'path', header entries carry the 'title' of the header page.
+        With GENERATED_TOC a 'toc' entry marks where merge_pdfs inserts the table of
+        contents.
     """
-    organized_files = []
-    
+    layout = []
+
+    def _doc(section, path):
+        layout.append({'section': section, 'kind': 'document', 'path': path})
+
+    def _header(section):
+        layout.append({'section': section, 'kind': 'header', 'title': SECTION_HEADER_TITLES[section]})
+
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    maint_dir = os.path.join(project_dir, "maintenance_docs")
+
     # Add cover page
     if cover_page:
-        organized_files.append(cover_page)
-        logger.info(f"Added cover page to organized files: {os.path.basename(cover_page)}")
+        _doc('cover', cover_page)
         # Immediately after cover, include Table of Contents and Special Instructions if present
-        try:
-            project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            maint_dir = os.path.join(project_dir, "maintenance_docs")
-            toc_path = os.path.join(maint_dir, "table_of_contents.pdf")
-            spec_path = os.path.join(maint_dir, "special_instructions.pdf")
-            # Append in defined order if they exist and are valid PDFs
-            for p in [toc_path, spec_path]:
-                if os.path.exists(p) and p.lower().endswith('.pdf'):
-                    organized_files.append(p)
-                    logger.info(f"Inserted always-include doc after cover: {os.path.basename(p)}")
-                else:
-                    logger.warning(f"Always-include doc missing or invalid: {p}")
-        except Exception as e:
-            logger.error(f"Error inserting always-include docs after cover: {e}")
-    
+        toc_path = os.path.join(maint_dir, "table_of_contents.pdf")
+        spec_path = os.path.join(maint_dir, "special_instructions.pdf")
+        front_matter = [toc_path, spec_path]
+        if GENERATED_TOC:
+            # Rendered by merge_pdfs once the page numbers are known
+            layout.append({'section': 'front_matter', 'kind': 'toc', 'title': TOC_TITLE})
+            front_matter = [spec_path]
+        # Append in defined order if they exist and are valid PDFs
+        for p in front_matter:
+            if os.path.exists(p) and p.lower().endswith('.pdf'):
+                _doc('front_matter', p)
+            else:
+                logger.warning(f"Always-include doc missing or invalid: {p}")
+
     # Prepare Maintenance & Operation section and separate gutter care from other docs
     primary_gutter_doc = None
     remaining_maintenance = []
     if maintenance_docs:
-        try:
-            always_include_basenames = {"table_of_contents.pdf", "special_instructions.pdf", "additional_info.pdf"}
-            filtered = [p for p in maintenance_docs if os.path.basename(p).lower() not in always_include_basenames]
-        except Exception:
-            filtered = maintenance_docs
+        always_include_basenames = {"table_of_contents.pdf", "special_instructions.pdf", "additional_info.pdf"}
+        filtered = [p for p in maintenance_docs if os.path.basename(p).lower() not in always_include_basenames]
 
         # Identify filled gutter care doc (e.g., filled_gutter_care*.pdf)
         for p in filtered:
@@ -1340,61 +1647,105 @@ def organize_files_by_section(cover_page, templates, maintenance_docs, job_files
             else:
                 remaining_maintenance.append(p)
 
-        maintenance_header = create_section_header("Maintenance & Operation Guides")
-        organized_files.append(maintenance_header)
-        logger.info("Added maintenance header to organized files")
+        _header('maintenance')
 
         # Place filled gutter care doc first in Maintenance & Operation, if present
         if primary_gutter_doc:
-            organized_files.append(primary_gutter_doc)
-            logger.info(f"Placed primary gutter maintenance doc first: {os.path.basename(primary_gutter_doc)}")
+            _doc('maintenance', primary_gutter_doc)
 
     # Add Equipment Templates section immediately after the primary gutter doc
     if templates:
-        template_header = create_section_header("Equipment Templates")
-        organized_files.append(template_header)
-        logger.info("Added template header to organized files")
-        logger.info(f"Adding {len(templates)} templates to organized files:")
-        for i, template in enumerate(templates):
-            organized_files.append(template)
-            logger.info(f"  {i+1}. Added template: {os.path.basename(template)}")
+        _header('templates')
+        for template in templates:
+            _doc('templates', template)
 
     # After templates, append the remaining Maintenance & Operation docs
-    if remaining_maintenance:
-        organized_files.extend(remaining_maintenance)
-        logger.info(f"Added {len(remaining_maintenance)} remaining maintenance docs after templates")
+    for p in remaining_maintenance:
+        _doc('maintenance', p)
 
     # Always include additional_info.pdf after Maintenance section and before Project Documentation
-    try:
-        project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        maint_dir = os.path.join(project_dir, "maintenance_docs")
-        additional_info_path = os.path.join(maint_dir, "additional_info.pdf")
-        if os.path.exists(additional_info_path) and additional_info_path.lower().endswith('.pdf'):
-            organized_files.append(additional_info_path)
-            logger.info("Inserted always-include doc before project docs: additional_info.pdf")
-        else:
-            logger.warning(f"Always-include doc missing or invalid: {additional_info_path}")
-    except Exception as e:
-        logger.error(f"Error inserting additional_info.pdf: {e}")
-    
+    additional_info_path = os.path.join(maint_dir, "additional_info.pdf")
+    if os.path.exists(additional_info_path) and additional_info_path.lower().endswith('.pdf'):
+        _doc('additional_info', additional_info_path)
+    else:
+        logger.warning(f"Always-include doc missing or invalid: {additional_info_path}")
+
     # Add Project Documentation section
     if job_files:
-        project_header = create_section_header("Project Documentation")
-        organized_files.append(project_header)
-        logger.info(f"Added project header to organized files")
-        organized_files.extend(job_files)
-        logger.info(f"Added {len(job_files)} job files to organized files")
-    
+        _header('job_files')
+        for p in job_files:
+            _doc('job_files', p)
+
     # Add Warranty Documents section LAST
     if warranty_docs:
-        warranty_header = create_section_header("Warranty Documents")
-        organized_files.append(warranty_header)
-        logger.info("Added warranty header to organized files")
-        organized_files.extend(warranty_docs)
-        logger.info(f"Added {len(warranty_docs)} warranty docs to organized files")
-    
-    logger.info(f"Total organized files: {len(organized_files)}")
-    return organized_files
+        _header('warranty')
+        for p in warranty_docs:
+            _doc('warranty', p)
+
+    return layout
+
+_pdf_metadata_cache = {}
+
+def get_pdf_metadata(pdf_path):
+    """
+    Return {'pages': int, 'size': int} for a PDF, cached by path and invalidated when
+    the file's size or modification time changes. Returns None if the file can't be read.
+    Library documents are answered from the document catalog (size of the normalized copy).
+    """
+    entry = doc_library.lookup(pdf_path)
+    if entry is not None:
+        return {'pages': entry['pages'], 'size': entry['size']} if entry['valid'] else None
+    try:
+        stat = os.stat(pdf_path)
+    except OSError:
+        return None
+    key = os.path.abspath(pdf_path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = _pdf_metadata_cache.get(key)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    try:
+        with fitz.open(pdf_path) as doc:
+            metadata = {'pages': doc.page_count, 'size': stat.st_size}
+    except Exception as e:
+        logger.warning(f"Could not read PDF metadata for {pdf_path}: {e}")
+        return None
+    _pdf_metadata_cache[key] = (stamp, metadata)
+    return metadata
+
+def section_index_path(pdf_path):
+    """Path of the section index written next to a merged manual."""
+    return os.path.splitext(pdf_path)[0] + '.sections.json'
+
+def _write_section_index(output_path, layout, total_pages):
+    """
+    Record where each merged document starts in the output PDF, so previews can show
+    the section structure without re-reading the manual. Page numbers are 1-based.
+    """
+    record = metrics.current_build()
+    index = {
+        'build_id': record.build_id if record is not None else None,
+        'output': os.path.basename(output_path),
+        'pages': total_pages,
+        'documents': [
+            {
+                'section': entry['section'],
+                'kind': entry['kind'],
+                'name': os.path.basename(entry['path']) if entry['kind'] == 'document' else entry['title'],
+                'start_page': entry['start_page'],
+                'pages': entry['pages'],
+            }
+            for entry in layout if 'start_page' in entry
+        ],
+    }
+    index_path = section_index_path(output_path)
+    tmp_path = f'{index_path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, index_path)
+    except OSError as e:
+        logger.warning(f"Could not write section index {index_path}: {e}")
 
 def merge_pdfs(input_paths, output_path, organized=False, sections=None):
     """
@@ -1418,14 +1769,23 @@ def merge_pdfs(input_paths, output_path, organized=False, sections=None):
         logger.info(f"Templates before organization: {len(sections.get('templates', []))}")
         logger.info(f"Template filenames: {[os.path.basename(t) for t in sections.get('templates', [])]}")
         
-        input_paths = organize_files_by_section(
-            sections.get('cover'),
-            sections.get('templates', []),
-            sections.get('maintenance', []),
-            sections.get('job_files', []),
-            sections.get('warranty', [])
-        )
+        with metrics.span('section_organisation'):
+            layout = plan_section_layout(
+                sections.get('cover'),
+                sections.get('templates', []),
+                sections.get('maintenance', []),
+                sections.get('job_files', []),
+                sections.get('warranty', [])
+            )
+            for entry in layout:
+                if entry['kind'] == 'header':
+                    entry['path'] = create_section_header(entry['title'])
+        input_paths = [entry['path'] for entry in layout if entry['kind'] != 'toc']
         logger.info(f"Organized files into sections with headers, total files: {len(input_paths)}")
+        temp_files = [entry['path'] for entry in layout if entry['kind'] == 'header']
+    else:
+        layout = [{'section': None, 'kind': 'document', 'path': p} for p in input_paths]
+        temp_files = []
     
     logger.info("Files to merge:")
     for i, path in enumerate(input_paths, 1):
@@ -1434,54 +1794,83 @@ def merge_pdfs(input_paths, output_path, organized=False, sections=None):
         else:
             logger.error(f"{i}. {path} (exists: False)")
 
-    merger = PdfMerger()
+    merger = PyPDF2.PdfMerger()
     skipped_files = []
     merged_count = 0
-    temp_files = []
+    toc_entry = None
 
     try:
-        for path in input_paths:
-            if not path.lower().endswith(".pdf"):
-                logger.warning(f"Skipping non-PDF file: {path}")
-                skipped_files.append((path, "Not a PDF file"))
-                continue
+        with metrics.span('merge', files=len(input_paths)):
+            for layout_entry in layout:
+                if layout_entry['kind'] == 'toc':
+                    # Inserted here after the rest is merged, once page numbers are known
+                    layout_entry['position'] = len(merger.pages)
+                    toc_entry = layout_entry
+                    continue
+                path = layout_entry['path']
+                if not path.lower().endswith(".pdf"):
+                    logger.warning(f"Skipping non-PDF file: {path}")
+                    skipped_files.append((path, "Not a PDF file"))
+                    continue
                 
-            if not os.path.exists(path):
-                logger.error(f"File does not exist: {path}")
-                skipped_files.append((path, "File not found"))
-                continue
+                if not os.path.exists(path):
+                    logger.error(f"File does not exist: {path}")
+                    skipped_files.append((path, "File not found"))
+                    continue
                 
-            if not validate_pdf(path):
-                logger.error(f"Invalid or corrupted PDF file: {path}")
-                skipped_files.append((path, "Invalid or corrupted PDF"))
-                continue
+                # Catalogued library documents were validated at ingestion; merge
+                # their normalized copy instead of re-validating the original.
+                entry = doc_library.lookup(path)
+                if entry is not None:
+                    if not entry['valid']:
+                        logger.error(f"Invalid or corrupted PDF file (catalogued): {path}")
+                        skipped_files.append((path, "Invalid or corrupted PDF"))
+                        continue
+                    source = shared_library.open_stream(entry['normalized_path']) or entry['normalized_path']
+                elif not validate_pdf(path):
+                    logger.error(f"Invalid or corrupted PDF file: {path}")
+                    skipped_files.append((path, "Invalid or corrupted PDF"))
+                    continue
+                else:
+                    source = path
                 
-            try:
-                logger.info(f"Appending file: {path}")
-                merger.append(path)
-                logger.info(f"Successfully appended: {path}")
-                merged_count += 1
-            except Exception as e:
-                error_msg = str(e)
-                logger.error(f"Error processing {path}: {error_msg}")
-                skipped_files.append((path, f"Error: {error_msg}"))
-                continue
+                try:
+                    logger.info(f"Appending file: {getattr(source, 'name', source)}")
+                    start_page = len(merger.pages)
+                    if isinstance(source, shared_library.MappedDocument):
+                        # PdfMerger reads the stream into its own buffer, so the
+                        # reader over the shared mapping can be released right away
+                        with source:
+                            merger.append(source, import_outline=False)
+                    else:
+                        merger.append(source, import_outline=False)
+                    logger.info(f"Successfully appended: {path}")
+                    merged_count += 1
+                    layout_entry['start_page'] = start_page + 1
+                    layout_entry['pages'] = len(merger.pages) - start_page
+                except Exception as e:
+                    error_msg = str(e)
+                    logger.error(f"Error processing {path}: {error_msg}")
+                    skipped_files.append((path, f"Error: {error_msg}"))
+                    continue
         
         if merged_count == 0:
             logger.error("No valid PDFs to merge")
             return False, "No valid PDFs found to merge", skipped_files
+
+        # Bookmarks and the table of contents come from the page offsets recorded while
+        # appending, so the output is written once and never read back
+        with metrics.span('outline'):
+            if toc_entry is not None:
+                _insert_table_of_contents(merger, layout, toc_entry)
+            _add_outline(merger, layout)
             
         logger.info(f"Writing merged PDF to: {output_path}")
-        merger.write(output_path)
+        with metrics.span('write'):
+            merger.write(output_path)
+        _write_section_index(output_path, layout, len(merger.pages))
         logger.info(f"PDF merge completed successfully. Merged {merged_count} files, skipped {len(skipped_files)} files")
         
-        # Clean up temporary section header files
-        for temp_file in temp_files:
-            try:
-                os.unlink(temp_file)
-            except Exception as e:
-                logger.warning(f"Could not delete temporary file {temp_file}: {e}")
-        
         if skipped_files:
             logger.warning("Skipped files during merge:")
             for file, reason in skipped_files:
@@ -1494,6 +1883,12 @@ def merge_pdfs(input_paths, output_path, organized=False, sections=None):
         return False, f"Error during PDF merge: {error_msg}", skipped_files
     finally:
         merger.close()
+        # Clean up temporary section header files (after close, so none are still open)
+        for temp_file in temp_files:
+            try:
+                os.unlink(temp_file)
+            except Exception as e:
+                logger.warning(f"Could not delete temporary file {temp_file}: {e}")
 
 def _line_contains_placeholder(words_in_line):
     """Return index of the underscore placeholder word in a line if present, else -1."""
@@ -0,0 +1,120 @@
+# utils/previews.py
+"""
+Low-resolution page previews of finished manuals.
+
+Pages are rendered with PyMuPDF pixmaps into a flat tile cache under output/previews,
+one PNG per (build, page, dpi). A request for many pages splits them into contiguous
+runs rendered across a process pool, so each worker opens the manual once for its
+whole run. The section structure comes from the index merge_pdfs writes next to the
+manual (see pdf_utils.section_index_path).
+"""
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.pdf_utils import section_index_path
+from utils.startup import lazy_module
+
+fitz = lazy_module('fitz')  # PyMuPDF, imported on first use
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PREVIEW_FOLDER = os.path.join(PROJECT_DIR, 'output', 'previews')
+
+# Resolution of preview tiles; requests may ask for more, up to MAX_PREVIEW_DPI
+PREVIEW_DPI = int(os.environ.get('OMGEN_PREVIEW_DPI', 40))
+MAX_PREVIEW_DPI = int(os.environ.get('OMGEN_MAX_PREVIEW_DPI', 150))
+
+PREVIEW_WORKERS = int(os.environ.get('OMGEN_PREVIEW_WORKERS', min(4, os.cpu_count() or 1)))
+
+
+def clamp_dpi(dpi):
+    """Bound a requested resolution to 18..MAX_PREVIEW_DPI (PREVIEW_DPI if not given)."""
+    if dpi is None:
+        return PREVIEW_DPI
+    return max(18, min(int(dpi), MAX_PREVIEW_DPI))
+
+
+def tile_path(build_id, page, dpi):
+    """Cache path of the tile for a 1-based page of a build's manual."""
+    return os.path.join(PREVIEW_FOLDER, f'{build_id}_p{page:05d}_{dpi}.png')
+
+
+def load_section_index(pdf_path):
+    """Return the section index written for a merged manual, or None if there is none."""
+    try:
+        with open(section_index_path(pdf_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def group_sections(index):
+    """
+    Fold the per-document index into sections in manual order. Each section has its
+    first page, page count and its documents (header pages included).
+    """
+    grouped = []
+    for doc in index['documents']:
+        if not grouped or grouped[-1]['section'] != doc['section']:
+            grouped.append({'section': doc['section'], 'start_page': doc['start_page'], 'pages': 0, 'documents': []})
+        grouped[-1]['pages'] += doc['pages']
+        grouped[-1]['documents'].append(doc)
+    return grouped
+
+
+def _render_pages(pdf_path, jobs, dpi):
+    """Render (page, out_path) pairs of one manual; runs in a pool worker."""
+    rendered = 0
+    with fitz.open(pdf_path) as doc:
+        for page, out_path in jobs:
+            pix = doc[page - 1].get_pixmap(dpi=dpi, alpha=False)
+            tmp_path = f'{out_path}.{os.getpid()}.tmp'
+            pix.save(tmp_path, output='png')
+            os.replace(tmp_path, out_path)
+            rendered += 1
+    return rendered
+
+
+def _is_fresh(out_path, pdf_mtime):
+    try:
+        return os.path.getmtime(out_path) >= pdf_mtime
+    except OSError:
+        return False
+
+
+def ensure_tiles(build_id, pdf_path, pages, dpi=None):
+    """
+    Render any of the given 1-based pages that aren't cached (or are older than the
+    manual) and return {page: tile path}.
+
+    Args:
+        build_id: Build the manual belongs to (names the tiles)
+        pdf_path: Path of the merged manual
+        pages: Iterable of 1-based page numbers, all within the manual
+        dpi: Tile resolution (clamped with clamp_dpi)
+    Returns:
+        Dict mapping each page to its tile path
+    """
+    dpi = clamp_dpi(dpi)
+    pdf_mtime = os.path.getmtime(pdf_path)
+    tiles = {page: tile_path(build_id, page, dpi) for page in sorted(set(pages))}
+    missing = [(page, path) for page, path in tiles.items() if not _is_fresh(path, pdf_mtime)]
+    if not missing:
+        return tiles
+
+    os.makedirs(PREVIEW_FOLDER, exist_ok=True)
+    workers = min(PREVIEW_WORKERS, len(missing))
+    if workers <= 1:
+        _render_pages(pdf_path, missing, dpi)
+    else:
+        # Contiguous runs keep each worker's reads close together in the file
+        size = -(-len(missing) // workers)
+        runs = [missing[i:i + size] for i in range(0, len(missing), size)]
+        with ProcessPoolExecutor(max_workers=len(runs)) as executor:
+            for future in [executor.submit(_render_pages, pdf_path, run, dpi) for run in runs]:
+                future.result()
+    logger.info(f"Rendered {len(missing)} preview tiles of build {build_id} at {dpi} dpi")
+    return tiles
@@ -0,0 +1,132 @@
+# utils/shared_library.py
+"""
+Memory-mapped, read-only view of the normalized document library shared by workers.
+
+With OMGEN_PRELOAD_LIBRARY=1 the app maps every valid normalized library document
+(see doc_library) when it is imported. Under gunicorn with preload_app the import
+happens once in the master, and the forked workers inherit the mappings. The
+mappings are file-backed and read-only, so every worker shares the same
+page-cache pages. Adding workers does not multiply library memory, and warm builds
+read the documents from memory instead of from disk.
+
+open_stream() hands out an independent file-like reader over a mapping, so
+concurrent merges never share a file position.
+"""
+import io
+import logging
+import mmap
+import os
+import threading
+
+from utils import doc_library
+
+logger = logging.getLogger(__name__)
+
+PRELOAD_LIBRARY = os.environ.get('OMGEN_PRELOAD_LIBRARY', '0') == '1'
+
+_lock = threading.Lock()
+# normalized path -> (mmap, (st_mtime_ns, st_size) of the file when it was mapped)
+_mappings = {}
+
+
+class MappedDocument(io.RawIOBase):
+    """Seekable read-only stream over a shared buffer with its own position."""
+
+    def __init__(self, buffer, name=None):
+        super().__init__()
+        self._view = memoryview(buffer)
+        self._pos = 0
+        self.name = name
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = len(self._view) + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if pos < 0:
+            raise ValueError("Negative seek position")
+        self._pos = pos
+        return pos
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else min(self._pos + size, len(self._view))
+        data = self._view[self._pos:end].tobytes() if end > self._pos else b''
+        self._pos = max(self._pos, end)
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        # Only drop this reader's view; the shared mapping stays open
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+
+def preload():
+    """
+    Map every valid normalized library document. Returns the number of documents mapped.
+    Call after doc_library.ingest() so the catalog is current.
+    """
+    mapped = 0
+    for key, entry in doc_library.documents():
+        path = entry['normalized_path']
+        try:
+            with open(path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not map library document {key}: {e}")
+            continue
+        if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_WILLNEED'):
+            mm.madvise(mmap.MADV_WILLNEED)
+        # A replaced mapping is unmapped once the last reader over it is gone
+        with _lock:
+            _mappings[path] = (mm, (stat.st_mtime_ns, stat.st_size))
+        mapped += 1
+    logger.info(f"Mapped {mapped} library documents ({stats()['bytes'] / 1024 / 1024:.1f} MB)")
+    return mapped
+
+
+def open_stream(path):
+    """
+    Return a MappedDocument over the mapping of a normalized library file, or None if
+    it isn't mapped or the file on disk was replaced after it was mapped.
+    """
+    with _lock:
+        mapping = _mappings.get(path)
+    if mapping is None:
+        return None
+    mm, stamp = mapping
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if (stat.st_mtime_ns, stat.st_size) != stamp:
+        return None
+    return MappedDocument(mm, name=path)
+
+
+def stats():
+    with _lock:
+        return {
+            'enabled': PRELOAD_LIBRARY,
+            'documents': len(_mappings),
+            'bytes': sum(len(mm) for mm, _ in _mappings.values()),
+        }
@@ -0,0 +1,98 @@
+# utils/startup.py
+"""
+Cold-start helpers: lazily imported modules, a run-once warm-up, and a startup report.
+
+Heavy dependencies (PyMuPDF, reportlab, PyPDF2) are bound with lazy_module(), so
+importing the app only creates placeholders. The real import happens on first
+attribute access. A warm-up (see app.warm_up) resolves them on purpose, together
+with the caches a build needs. Under gunicorn the warm-up runs in the master before
+workers fork (gunicorn.conf.py), otherwise on the first request. Recycled workers
+start already warm, and nothing heavy happens at import time.
+
+Each import and warm-up step is timed, and report() returns the timings (served at
+/metrics/startup).
+"""
+import importlib
+import importlib.util
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_steps = {}
+_imports = {}
+_warmed_up_at = None
+_warm_up_seconds = None
+
+
+def lazy_module(name):
+    """
+    Return the module `name`, deferring its import until an attribute is first used.
+    Already imported modules are returned as they are. LazyLoader isn't thread-safe
+    on Python 3.11, so resolve lazy modules (import_modules) before serving threads
+    start using them.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def import_modules(names):
+    """Fully import the given modules, recording how long each took."""
+    for name in names:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        # Touching an attribute runs a pending lazy import
+        getattr(module, '__file__', None)
+        _imports[name] = round(time.perf_counter() - start, 4)
+
+
+@contextmanager
+def step(name):
+    """Time one warm-up step."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _steps[name] = round(time.perf_counter() - start, 4)
+
+
+def run_once(warm_up):
+    """Run warm_up() unless it has already run in this process. Returns True if it ran."""
+    global _warmed_up_at, _warm_up_seconds
+    if _warmed_up_at is not None:
+        return False
+    with _lock:
+        if _warmed_up_at is not None:
+            return False
+        start = time.perf_counter()
+        warm_up()
+        _warm_up_seconds = round(time.perf_counter() - start, 4)
+        _warmed_up_at = time.time()
+    logger.info(f"Warm-up finished in {_warm_up_seconds:.2f}s "
+                f"(imports: {', '.join(f'{n} {s:.2f}s' for n, s in _imports.items())})")
+    return True
+
+
+def report(app_import_seconds=None):
+    """Import and warm-up timings of this process."""
+    return {
+        'app_import_seconds': app_import_seconds,
+        'warmed_up': _warmed_up_at is not None,
+        'warmed_up_at': _warmed_up_at,
+        'warm_up_seconds': _warm_up_seconds,
+        'imports': dict(_imports),
+        'steps': dict(_steps),
+    }
@@ -12,12 +12,12 @@ a = Analysis(['server.py'],
                     ('flask_app/models', 'flask_app/models')],
              hiddenimports=['flask', 'werkzeug', 'jinja2', 'sqlalchemy', 
                            'flask_sqlalchemy', 'flask_bcrypt', 'flask_login',
-                           'sqlite3', 'fitz', 'pdfminer',
-                           'pdfminer.high_level'],
+                           'sqlite3', 'fitz', 'pdf_text',
+                           'multiprocessing', 'concurrent.futures'],
              hookspath=[],
              hooksconfig={},
              runtime_hooks=[],
-             excludes=[],
+             excludes=['pdfminer'],
              win_no_prefer_redirects=False,
              win_private_assemblies=False,
              cipher=block_cipher,
@@ -1,42 +1,37 @@
-from server import app, db
+from server import db, migrate
 from sqlalchemy import text
 
+def add_group_foreign_key():
+    """
+    MySQL-only part of the schema: the searches.group_id foreign key, which tables
+    created before keyword groups don't get from create_all().
+    """
+    # Check if group_id already references keyword_groups (create_all() declares it on new tables)
+    result = db.session.execute(text("""
+        SELECT COUNT(*) as count
+        FROM information_schema.key_column_usage
+        WHERE table_schema = DATABASE()
+        AND table_name = 'searches'
+        AND column_name = 'group_id'
+        AND referenced_table_name = 'keyword_groups'
+    """))
+    constraint_exists = result.fetchone()[0] > 0
+
+    # Add the constraint if it doesn't exist
+    if not constraint_exists:
+        db.session.execute(text("""
+            ALTER TABLE searches
+            ADD CONSTRAINT fk_group
+            FOREIGN KEY (group_id) REFERENCES keyword_groups(id)
+        """))
+
 def init_db():
-    with app.app_context():
-        try:
-            # Create the keyword_groups table first
-            db.session.execute(text("""
-                CREATE TABLE IF NOT EXISTS keyword_groups (
-                    id INT PRIMARY KEY AUTO_INCREMENT,
-                    name VARCHAR(255) NOT NULL,
-                    keywords TEXT NOT NULL
-                )
-            """))
-            
-            # Check if group_id column exists
-            result = db.session.execute(text("""
-                SELECT COUNT(*) as count 
-                FROM information_schema.columns 
-                WHERE table_name = 'searches' 
-                AND column_name = 'group_id'
-            """))
-            column_exists = result.fetchone()[0] > 0
-            
-            # Add group_id column if it doesn't exist
-            if not column_exists:
-                db.session.execute(text("""
-                    ALTER TABLE searches
-                    ADD COLUMN group_id INT,
-                    ADD CONSTRAINT fk_group
-                    FOREIGN KEY (group_id) REFERENCES keyword_groups(id)
-                """))
-            
-            db.session.commit()
-            print("Database updated successfully!")
-            
-        except Exception as e:
-            print(f"Error updating database: {e}")
-            db.session.rollback()
+    # Tables, indexes and search keys for every model (see server.migrate), then the
+    # MySQL-specific parts; the schema version is recorded only if all of it succeeds
+    if migrate(extra_steps=add_group_foreign_key):
+        print("Database updated successfully!")
+    else:
+        print("Error updating database; see the messages above")
 
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    init_db()
@@ -0,0 +1,269 @@
+"""
+Page text extraction and keyword search for the PDF reader.
+
+Large PDFs are split into page ranges that are extracted and searched across a
+process pool. Each worker opens the document itself, and results are merged back in
+page order, either all at once or range by range for streamed searches. This module
+imports only the standard library and PyMuPDF (on first use), so pool workers never
+load server.py's Flask app or database. In the PyInstaller-frozen build, workers are
+started by re-running the executable; server.py calls multiprocessing.freeze_support()
+before anything else to hand them over to the pool.
+"""
+import os
+import re
+import threading
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+
+# Worker processes for extraction and search; 1 keeps all work on the request thread
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', min(4, os.cpu_count() or 1)))
+# Documents with fewer pages than this are handled serially; the pool isn't worth it
+PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', 64))
+# Smallest page range handed to one worker
+MIN_RANGE_PAGES = 16
+# Page ranges per worker: a few for a whole-document call, more when streaming so
+# results and progress arrive in smaller steps
+RANGES_PER_WORKER = 4
+STREAM_RANGES_PER_WORKER = 16
+
+SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s')
+
+def split_sentences(text):
+    """
+    Splits text into sentences once (same rule as re.split(SENTENCE_BREAK)).
+    Returns the sentences and the (start, end) offset of each in text.
+    """
+    spans = []
+    start = 0
+    for match in SENTENCE_BREAK.finditer(text):
+        spans.append((start, match.start()))
+        start = match.end()
+    spans.append((start, len(text)))
+    return [text[a:b] for a, b in spans], spans
+
+def _trie_pattern(node):
+    """Regex source for a keyword trie; optional tails are greedy, so the longest keyword wins."""
+    branches = [re.escape(ch) + _trie_pattern(child) for ch, child in sorted(node.items()) if ch]
+    if not branches:
+        return ''
+    body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    if '' in node:
+        return f'(?:{body})?' if len(branches) == 1 else body + '?'
+    return body
+
+@lru_cache(maxsize=256)
+def compile_keyword_matcher(keywords):
+    """
+    Compiles a tuple of lowercased keywords into one case-insensitive pattern matching
+    the longest keyword at a position. The pattern is built from a trie of the
+    keywords, so each position only tries the branches for its first character.
+    Shorter keywords that are prefixes of a matched one are listed in `implied`, so
+    they're credited without a second scan.
+    Returns (pattern, implied) with implied mapping keyword -> prefix keywords.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for ch in keyword:
+            node = node.setdefault(ch, {})
+        node[''] = True
+    pattern = re.compile(_trie_pattern(trie), re.IGNORECASE)
+    implied = {
+        longer: [shorter for shorter in keywords if shorter != longer and longer.startswith(shorter)]
+        for longer in keywords
+    }
+    return pattern, implied
+
+def search_keywords_in_text(text, keywords):
+    """
+    Returns (keyword, sentence) for every sentence of text containing each keyword
+    (case-insensitive), grouped by keyword in the given order. The text is split
+    into sentences once and scanned once for all keywords together.
+    """
+    lowered = [keyword.lower() for keyword in keywords]
+    sentences, spans = split_sentences(text)
+    starts = [a for a, _ in spans]
+    found = {keyword: set() for keyword in lowered}
+    searchable = tuple(sorted({keyword for keyword in lowered if keyword}))
+    if searchable:
+        pattern, implied = compile_keyword_matcher(searchable)
+        search = pattern.search
+        match = search(text)
+        while match is not None:
+            a, b = match.span()
+            index = bisect_right(starts, a) - 1
+            sentence_end = spans[index][1]
+            keyword = match.group().lower()
+            if keyword not in found:
+                # Case folding that changes the length of the match
+                keyword = next(k for k in searchable if re.fullmatch(re.escape(k), match.group(), re.IGNORECASE))
+            # A match running over a sentence break isn't inside either sentence,
+            # but a shorter keyword it starts with may still be
+            if b <= sentence_end:
+                found[keyword].add(index)
+            for shorter in implied[keyword]:
+                if a + len(shorter) <= sentence_end:
+                    found[shorter].add(index)
+            # Next match may start inside this one (overlapping keywords)
+            match = search(text, a + 1)
+    if '' in found:
+        found[''] = set(range(len(sentences)))
+
+    results = []
+    for keyword, key in zip(keywords, lowered):
+        results.extend((keyword, sentences[i].strip()) for i in sorted(found[key]))
+    return results
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """
+    Returns the shared worker pool, starting it on first use.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+        return _pool
+
+def _discard_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def use_pool(page_count):
+    return PDF_WORKERS > 1 and page_count >= PARALLEL_MIN_PAGES
+
+def page_ranges(page_count, ranges_per_worker=RANGES_PER_WORKER):
+    """
+    Splits pages 0..page_count-1 into contiguous (start, stop) ranges, several per
+    worker so one slow range doesn't hold up the rest.
+    """
+    size = max(MIN_RANGE_PAGES, -(-page_count // (PDF_WORKERS * ranges_per_worker)))
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+def run_in_pool(func, calls):
+    """
+    Runs func(*args) for each args tuple in calls across the pool and returns the
+    results in call order. Runs them here instead if the pool has broken.
+    """
+    try:
+        pool = get_pool()
+        futures = [pool.submit(func, *args) for args in calls]
+        return [future.result() for future in futures]
+    except BrokenProcessPool as e:
+        print(f"PDF worker pool failed, continuing without it: {e}")
+        _discard_pool()
+        return [func(*args) for args in calls]
+
+def iter_in_pool(func, calls, parallel=True):
+    """
+    Like run_in_pool, but yields each result (in call order) as soon as it and the
+    ones before it are done. Closing the generator cancels calls not yet started.
+    With parallel=False the calls run here, one per step.
+    """
+    if not parallel:
+        for args in calls:
+            yield func(*args)
+        return
+    futures = []
+    done = 0
+    try:
+        pool = get_pool()
+        futures = [pool.submit(func, *args) for args in calls]
+        for future in futures:
+            result = future.result()
+            done += 1
+            yield result
+    except BrokenProcessPool as e:
+        print(f"PDF worker pool failed, continuing without it: {e}")
+        _discard_pool()
+        for args in calls[done:]:
+            yield func(*args)
+    finally:
+        for future in futures:
+            future.cancel()
+
+def page_count_of(file_path):
+    import fitz # PyMuPDF, imported on first use to keep it out of startup
+    with fitz.open(file_path) as pdf:
+        return pdf.page_count
+
+def extract_page_range(file_path, start, stop):
+    """
+    Returns the text of pages start..stop-1 (0-based); runs in a pool worker.
+    """
+    import fitz # PyMuPDF
+    with fitz.open(file_path) as pdf:
+        return [pdf[page_num].get_text() for page_num in range(start, stop)]
+
+def search_page_range(pages_text, start, keywords):
+    """
+    Returns [(page_number, results)] for the pages with hits, where pages_text
+    starts at 0-based page start and page_number is 1-based.
+    """
+    hits = []
+    for page_num, page_text in enumerate(pages_text, start=start + 1):
+        page_results = search_keywords_in_text(page_text, keywords)
+        if page_results:
+            hits.append((page_num, page_results))
+    return hits
+
+def extract_pages(file_path):
+    """
+    Returns the text of each page of a PDF, in page order.
+    """
+    page_count = page_count_of(file_path)
+    if not use_pool(page_count):
+        return extract_page_range(file_path, 0, page_count)
+    chunks = run_in_pool(extract_page_range, [(file_path, a, b) for a, b in page_ranges(page_count)])
+    return [page_text for chunk in chunks for page_text in chunk]
+
+def search_pages(pages_text, keywords):
+    """
+    Searches extracted page text. Returns {"Page N": [(keyword, sentence)]} in page order.
+    """
+    keywords = list(keywords)
+    if not use_pool(len(pages_text)):
+        hits = search_page_range(pages_text, 0, keywords)
+    else:
+        # Each worker is sent only its own pages
+        calls = [(pages_text[a:b], a, keywords) for a, b in page_ranges(len(pages_text))]
+        hits = [hit for chunk in run_in_pool(search_page_range, calls) for hit in chunk]
+    return {f"Page {page_num}": page_results for page_num, page_results in hits}
+
+def extract_and_search_page_range(file_path, start, stop, keywords):
+    """
+    Returns the text of pages start..stop-1 and their hits; runs in a pool worker.
+    """
+    pages_text = extract_page_range(file_path, start, stop)
+    return pages_text, search_page_range(pages_text, start, keywords)
+
+def iter_search_pages(pages_text, keywords):
+    """
+    Searches extracted page text one page range at a time, in page order.
+    Yields (pages_done, hits) with hits as [(page_number, results)].
+    """
+    keywords = list(keywords)
+    ranges = page_ranges(len(pages_text), STREAM_RANGES_PER_WORKER)
+    calls = [(pages_text[a:b], a, keywords) for a, b in ranges]
+    for (a, b), hits in zip(ranges, iter_in_pool(search_page_range, calls, use_pool(len(pages_text)))):
+        yield b, hits
+
+def iter_extract_and_search(file_path, keywords):
+    """
+    Extracts and searches a PDF one page range at a time, in page order.
+    Yields (pages_done, page_count, pages_text, hits), where pages_text is the text of
+    the range just finished and hits is [(page_number, results)] for it.
+    """
+    keywords = list(keywords)
+    page_count = page_count_of(file_path)
+    ranges = page_ranges(page_count, STREAM_RANGES_PER_WORKER)
+    calls = [(file_path, a, b, keywords) for a, b in ranges]
+    for (a, b), (pages_text, hits) in zip(ranges, iter_in_pool(extract_and_search_page_range, calls, use_pool(page_count))):
+        yield b, page_count, pages_text, hits
@@ -1,22 +1,42 @@
-from flask import Flask, render_template, request, redirect, send_from_directory, url_for, flash, jsonify
+import multiprocessing
+if __name__ == "__main__":
+    # In the frozen build, pool workers start by re-running this executable; hand
+    # them to multiprocessing before the app and database are set up
+    multiprocessing.freeze_support()
+
+import time
+# Startup phases are timed from here (see startup_report)
+_STARTED = time.perf_counter()
+
+from flask import Flask, render_template, request, redirect, send_file, url_for, flash, jsonify, Response, stream_with_context
 from werkzeug.utils import secure_filename
-from pdfminer.high_level import extract_text
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user, login_required
-import fitz # PyMuPDF
 import re
 import os
 import sys
+import hashlib
+import zlib
+import json
+import shutil
+import tempfile
+import threading
 import webbrowser
+import socket
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import pymysql
-from sqlalchemy import text, func
+from sqlalchemy import text, func, insert, update, inspect, or_
+from sqlalchemy.exc import IntegrityError
 from dotenv import load_dotenv
+import pdf_text
+from pdf_text import search_keywords_in_text
 
 load_dotenv()
 
 pymysql.install_as_MySQLdb()
+_IMPORTED = time.perf_counter()
 
 def get_base_path():
     if getattr(sys, 'frozen', False):
@@ -79,8 +99,42 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+# Startup profile: seconds from the start of this module to each phase (imports,
+# app, schema, listening, first_page), against a time-to-first-page target. Served
+# at /startup; with STARTUP_PROFILE=1 it's also written to startup_profile.json next
+# to the database once the first page has been served.
+STARTUP_TARGET_SECONDS = float(os.getenv('STARTUP_TARGET_SECONDS', 2.0))
+STARTUP_PROFILE = os.getenv('STARTUP_PROFILE') == '1'
+_startup_phases = {'imports': round(_IMPORTED - _STARTED, 3)}
+
+def mark_startup(phase):
+    _startup_phases.setdefault(phase, round(time.perf_counter() - _STARTED, 3))
+
+def startup_report():
+    first_page = _startup_phases.get('first_page')
+    return {
+        'frozen': bool(getattr(sys, 'frozen', False)),
+        'phases': dict(_startup_phases),
+        'time_to_first_page': first_page,
+        'target_seconds': STARTUP_TARGET_SECONDS,
+        'within_target': first_page <= STARTUP_TARGET_SECONDS if first_page is not None else None,
+    }
+
+def write_startup_report():
+    path = os.path.join(os.path.dirname(get_db_path()), 'startup_profile.json')
+    try:
+        with open(path, 'w') as f:
+            json.dump(startup_report(), f, indent=2)
+    except OSError as e:
+        print(f"Could not write startup profile to {path}: {e}")
+
 # Create tables for all models
 def init_db():
+    """
+    Creates the tables, the full-text index and the saved-search keys.
+    Returns True if every step succeeded.
+    """
+    ok = True
     with app.app_context():
         try:
             # Create tables
@@ -98,9 +152,19 @@ def init_db():
             except Exception as e2:
                 print(f"Error creating database at fallback location: {e2}")
                 raise
-
-# Initialize the database
-init_db()
+        try:
+            init_search_index()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error creating full-text search index: {e}")
+            ok = False
+        try:
+            init_search_keys()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error adding search keys to saved searches: {e}")
+            ok = False
+    return ok
 
 class User(db.Model, UserMixin):
     __tablename__ = 'users'
@@ -117,6 +181,13 @@ class Search(db.Model):
     page_number = db.Column(db.Integer, nullable=False)
     snippet = db.Column(db.Text, nullable=False)
     group_id = db.Column(db.Integer, db.ForeignKey('keyword_groups.id'), nullable=True)
+    # search_key() of the row; the unique index is what keeps saved results from repeating
+    search_key = db.Column(db.String(64), nullable=True)
+    __table_args__ = (
+        db.Index('ux_searches_search_key', 'search_key', unique=True),
+        # Serves the history's per-project/per-keyword counts and snippet lookups
+        db.Index('ix_searches_file_keyword', 'file_name', 'keyword'),
+    )
 
 class KeywordGroup(db.Model):
     __tablename__ = 'keyword_groups'
@@ -124,6 +195,216 @@ class KeywordGroup(db.Model):
     name = db.Column(db.String(255), nullable=False)
     keywords = db.Column(db.Text, nullable=False)
 
+class UploadedDocument(db.Model):
+    __tablename__ = 'uploaded_documents'
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), unique=True, nullable=False)
+    file_name = db.Column(db.String(255), nullable=False)
+    page_count = db.Column(db.Integer, nullable=False)
+    file_size = db.Column(db.BigInteger, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, server_default=func.now())
+
+class UploadedFile(db.Model):
+    """
+    An upload's name and the content it refers to; several names can share one content.
+    """
+    __tablename__ = 'uploaded_files'
+    id = db.Column(db.Integer, primary_key=True)
+    file_name = db.Column(db.String(255), unique=True, nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False, index=True)
+    uploaded_at = db.Column(db.DateTime, nullable=False, server_default=func.now())
+
+class PageText(db.Model):
+    __tablename__ = 'page_texts'
+    content_hash = db.Column(db.String(64), db.ForeignKey('uploaded_documents.content_hash'), primary_key=True)
+    page_number = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    # zlib-compressed UTF-8 page text (MEDIUMBLOB on MySQL)
+    text_zlib = db.Column(db.LargeBinary(length=2**24 - 1), nullable=False)
+
+# Full-text index over the stored page text: an FTS5 table on SQLite, a FULLTEXT-indexed
+# table on MySQL. Rows are added with the page text and removed with the document.
+SEARCH_INDEX_TABLES = {'sqlite': 'page_text_fts', 'mysql': 'page_text_index'}
+
+# Most pages returned by a search across all documents
+SEARCH_ALL_LIMIT = 100
+
+def search_index_table():
+    return SEARCH_INDEX_TABLES.get(db.engine.dialect.name)
+
+def init_search_index():
+    """
+    Creates the full-text index table for the configured database if it doesn't exist.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        db.session.execute(text("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS page_text_fts
+            USING fts5(content_hash UNINDEXED, page_number UNINDEXED, text)
+        """))
+    elif dialect == 'mysql':
+        db.session.execute(text("""
+            CREATE TABLE IF NOT EXISTS page_text_index (
+                content_hash CHAR(64) NOT NULL,
+                page_number INT NOT NULL,
+                text MEDIUMTEXT NOT NULL,
+                PRIMARY KEY (content_hash, page_number),
+                FULLTEXT KEY ft_page_text (text)
+            ) ENGINE=InnoDB
+        """))
+    else:
+        print(f"Full-text search is not supported on {dialect}")
+    db.session.commit()
+
+def search_key(file_name, keyword, page_number, snippet, group_id=None):
+    """
+    SHA-256 of a saved search result's trimmed, lowercased fields, so results differing
+    only in case or surrounding whitespace get the same key. Results saved for a
+    keyword group include its id, so each group keeps its own complete set of hits.
+    """
+    fields = [
+        (file_name or "").strip().lower(),
+        (keyword or "").strip().lower(),
+        str(page_number),
+        (snippet or "").strip().lower(),
+    ]
+    if group_id is not None:
+        fields.append(f"group:{group_id}")
+    return hashlib.sha256("\x1f".join(fields).encode('utf-8')).hexdigest()
+
+def init_search_keys():
+    """
+    Brings searches tables created before search_key existed up to date: adds the
+    column, fills it in (deleting rows that repeat an earlier one) and adds the
+    unique index and the (file_name, keyword) index used by the history. Keyword
+    group results saved before their key included the group id are re-keyed.
+    """
+    inspector = inspect(db.engine)
+    columns = {column['name'] for column in inspector.get_columns('searches')}
+    if 'group_id' not in columns:
+        # Tables from before keyword groups; create_db.py adds the foreign key on MySQL
+        db.session.execute(text("ALTER TABLE searches ADD COLUMN group_id INTEGER"))
+    if 'search_key' not in columns:
+        db.session.execute(text("ALTER TABLE searches ADD COLUMN search_key VARCHAR(64)"))
+
+    rows = (
+        db.session.query(Search.id, Search.file_name, Search.keyword, Search.page_number, Search.snippet,
+                         Search.group_id, Search.search_key)
+        .filter(or_(Search.search_key.is_(None), Search.group_id.isnot(None)))
+        .order_by(Search.id)
+        .all()
+    )
+    if rows:
+        seen = {key for (key,) in db.session.query(Search.search_key)
+                .filter(Search.search_key.isnot(None), Search.group_id.is_(None))}
+        keys, duplicates = [], []
+        for row in rows:
+            key = search_key(row.file_name, row.keyword, row.page_number, row.snippet, row.group_id)
+            if key in seen:
+                duplicates.append(row.id)
+            else:
+                seen.add(key)
+                if key != row.search_key:
+                    keys.append({'id': row.id, 'search_key': key})
+        for i in range(0, len(duplicates), 1000):
+            db.session.query(Search).filter(Search.id.in_(duplicates[i:i + 1000])).delete(synchronize_session=False)
+        for i in range(0, len(keys), 1000):
+            db.session.execute(update(Search), keys[i:i + 1000])
+        if keys or duplicates:
+            print(f"Updated search keys of {len(keys)} saved searches, removed {len(duplicates)} duplicates")
+
+    indexes = {index['name'] for index in inspector.get_indexes('searches')}
+    if 'ux_searches_search_key' not in indexes:
+        db.session.execute(text("CREATE UNIQUE INDEX ux_searches_search_key ON searches (search_key)"))
+    if 'ix_searches_file_keyword' not in indexes:
+        db.session.execute(text("CREATE INDEX ix_searches_file_keyword ON searches (file_name, keyword)"))
+    db.session.commit()
+
+# Bump when init_db() has something new to create or migrate; databases already at
+# this version skip it on startup
+SCHEMA_VERSION = 3
+
+class SchemaVersion(db.Model):
+    __tablename__ = 'schema_version'
+    version = db.Column(db.Integer, primary_key=True)
+    applied_at = db.Column(db.DateTime, nullable=False, server_default=func.now())
+
+def migrate(extra_steps=None):
+    """
+    Creates and migrates the schema (init_db), reconciles the full-text index, runs
+    extra_steps() if given, and then records SCHEMA_VERSION. The version is only
+    recorded if every step succeeded, so a failed migration is retried on the next start.
+    Run once per release with `server.py --migrate` (or create_db.py on MySQL).
+    Returns True if the schema is now at SCHEMA_VERSION.
+    """
+    if not init_db():
+        print("Database migration incomplete; it will be retried on the next start")
+        return False
+    with app.app_context():
+        try:
+            reconcile_search_index()
+            if extra_steps is not None:
+                extra_steps()
+            if db.session.get(SchemaVersion, SCHEMA_VERSION) is None:
+                db.session.add(SchemaVersion(version=SCHEMA_VERSION))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Database migration failed; it will be retried on the next start: {e}")
+            return False
+    return True
+
+_schema_lock = threading.Lock()
+_schema_checked = False
+
+def ensure_schema():
+    """
+    Runs migrate() unless the database is already at SCHEMA_VERSION, which costs a
+    single query instead of create_all() and the migration checks on every start.
+    Then queues ingestion of any upload whose page text isn't stored yet.
+    """
+    global _schema_checked
+    if _schema_checked:
+        return
+    with _schema_lock:
+        if _schema_checked:
+            return
+        with app.app_context():
+            try:
+                current = db.session.query(func.max(SchemaVersion.version)).scalar()
+            except Exception:
+                # No schema_version table yet
+                db.session.rollback()
+                current = None
+        if current is None or current < SCHEMA_VERSION:
+            migrate()
+        with app.app_context():
+            try:
+                queue_unstored_uploads()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error queueing uploads for ingestion: {e}")
+        _schema_checked = True
+        mark_startup('schema')
+
+mark_startup('app')
+
+@app.before_request
+def before_first_request():
+    # Normally done before the server starts (see __main__); this covers other ways of running the app
+    ensure_schema()
+
+@app.after_request
+def after_first_page(response):
+    if 'first_page' not in _startup_phases and response.mimetype == 'text/html':
+        mark_startup('first_page')
+        if STARTUP_PROFILE:
+            write_startup_report()
+    return response
+
+@app.route('/startup')
+def startup():
+    return jsonify(startup_report())
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
@@ -132,18 +413,10 @@ def extract_text_from_pdf_file(file_path):
 
     # text = extract_text(file_path)
     # return text.split("\x0c")
-    text_pages = []
-    with fitz.open(file_path) as pdf:
-        for page_num in range(pdf.page_count):
-            page = pdf[page_num]
-            text_pages.append(page.get_text())
-    return text_pages
+    return pdf_text.extract_pages(file_path)
     
 def find_sentence_in_pdf(text, keywords):
-        # Compile regex for efficiency
-        keyword_pattern = re.compile(re.escape(keywords.lower()), re.IGNORECASE)
-        sentences = re.split(r'(?<=[.!?])\s', text)
-        return [sentence.strip() for sentence in sentences if keyword_pattern.search(sentence)]
+        return [sentence for _, sentence in search_keywords_in_text(text, [keywords])]
 # def find_sentence_in_pdf(text, keywords):
 #     sentences = re.split(r'(?<=[.!?])\s', text)
 #     results = []
@@ -151,12 +424,6 @@ def find_sentence_in_pdf(text, keywords):
 #         if keywords.lower() in sentence.lower():
 #             results.append(sentence.strip())
 #     return results    
-def search_keywords_in_text(text, keywords):
-        results = []
-        for keyword in keywords:
-            sentences_with_keyword = find_sentence_in_pdf(text, keyword)
-            results.extend([(keyword, sentence) for sentence in sentences_with_keyword])
-        return results
 # def search_keywords_in_text(text, keywords):
 #     results = []
 #     for keyword in keywords:
@@ -165,13 +432,8 @@ def search_keywords_in_text(text, keywords):
 #             results.append((keyword, sentence))
 #         return results    
 def search_keywords_in_pdf(file_path, keywords):
-        pages_text = extract_text_from_pdf_file(file_path)
-        all_results = {}
-        for page_num, page_text in enumerate(pages_text, start=1):
-            page_results = search_keywords_in_text(page_text, keywords)
-            if page_results:
-                all_results[f"Page {page_num}"] = page_results
-        return all_results
+        pages_text = get_page_texts(file_path)
+        return pdf_text.search_pages(pages_text, keywords)
 
 # def search_keywords_in_pdf(file_path, keywords):
 #     pages_text = extract_text_from_pdf_file(file_path)
@@ -182,75 +444,693 @@ def search_keywords_in_pdf(file_path, keywords):
 #             all_results[f"Page {page_num}"] = page_results
 #     return all_results
 
-def save_search_to_database(file_name, keyword, page_number, snippet):
+# (path, mtime_ns, size) -> content hash, so unchanged uploads aren't re-hashed per search
+_content_hash_cache = {}
+
+def file_content_hash(file_path):
+    """
+    Returns the SHA-256 hex digest of a file's contents.
+    """
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    if key not in _content_hash_cache:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        _content_hash_cache[key] = digest.hexdigest()
+    return _content_hash_cache[key]
+
+def store_page_text(file_path, file_name=None, pages_text=None):
     """
-    Saves search results to the SQLite database using SQLAlchemy session.
+    Extracts the text of every page once and stores it compressed, keyed by the
+    file's content hash. Does nothing if that content is already stored.
+    pages_text can be passed when the caller has already extracted it.
+    Returns the content hash.
     """
+    content_hash = file_content_hash(file_path)
+    if db.session.query(UploadedDocument.id).filter_by(content_hash=content_hash).first() is not None:
+        return content_hash
+
+    if pages_text is None:
+        pages_text = extract_text_from_pdf_file(file_path)
     try:
-        new_search = Search(
-            file_name=file_name,
-            keyword=keyword,
-            page_number=page_number,
-            snippet=snippet
-        )
-        db.session.add(new_search)
+        db.session.add(UploadedDocument(
+            content_hash=content_hash,
+            file_name=file_name or os.path.basename(file_path),
+            page_count=len(pages_text),
+            file_size=os.path.getsize(file_path),
+        ))
+        db.session.flush()
+        db.session.add_all([
+            PageText(content_hash=content_hash, page_number=page_num,
+                     text_zlib=zlib.compress(page_text.encode('utf-8'), 6))
+            for page_num, page_text in enumerate(pages_text, start=1)
+        ])
+        index_page_text(content_hash, pages_text)
         db.session.commit()
+    except IntegrityError:
+        # Stored concurrently by another request
+        db.session.rollback()
+    return content_hash
+
+def load_page_text(content_hash):
+    """
+    Returns the stored text of each page of a document, in page order.
+    """
+    rows = (
+        db.session.query(PageText.text_zlib)
+        .filter(PageText.content_hash == content_hash)
+        .order_by(PageText.page_number)
+        .all()
+    )
+    return [zlib.decompress(row.text_zlib).decode('utf-8') for row in rows]
+
+def stored_page_text(file_path):
+    """
+    Returns the stored text of each page of a PDF, or None if its content hasn't been stored.
+    """
+    content_hash = file_content_hash(file_path)
+    if db.session.query(UploadedDocument.id).filter_by(content_hash=content_hash).first() is None:
+        return None
+    return load_page_text(content_hash)
+
+def get_page_texts(file_path):
+    """
+    Returns the text of each page of an uploaded PDF from the page-text store,
+    extracting and storing it first if this content hasn't been seen before.
+    """
+    try:
+        content_hash = store_page_text(file_path)
+        return load_page_text(content_hash)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Page text store unavailable, extracting directly: {e}")
+        return extract_text_from_pdf_file(file_path)
+
+def index_page_text(content_hash, pages_text):
+    """
+    Adds a document's pages to the full-text index (in the caller's transaction).
+    """
+    table = search_index_table()
+    if table is None or not pages_text:
+        return
+    db.session.execute(
+        text(f"INSERT INTO {table} (content_hash, page_number, text) VALUES (:content_hash, :page_number, :text)"),
+        [{'content_hash': content_hash, 'page_number': page_num, 'text': page_text}
+         for page_num, page_text in enumerate(pages_text, start=1)],
+    )
+
+def unindex_page_text(content_hash):
+    table = search_index_table()
+    if table is not None:
+        db.session.execute(text(f"DELETE FROM {table} WHERE content_hash = :content_hash"),
+                           {'content_hash': content_hash})
+
+def delete_page_text(content_hash):
+    """
+    Removes a document, its stored page text and its full-text index entries.
+    """
+    unindex_page_text(content_hash)
+    db.session.query(PageText).filter_by(content_hash=content_hash).delete()
+    db.session.query(UploadedDocument).filter_by(content_hash=content_hash).delete()
+    db.session.commit()
+
+def reconcile_search_index():
+    """
+    One-off repair of the page-text store and full-text index, run by migrate():
+    removes stored documents no upload refers to any more and indexes documents
+    stored before the index existed. From then on store_page_text and
+    delete_page_text keep the index in step with the stored text.
+    """
+    adopt_loose_uploads()
+    uploads = {content_hash for (content_hash,) in db.session.query(UploadedFile.content_hash)}
+    stored = {content_hash for (content_hash,) in db.session.query(UploadedDocument.content_hash)}
+    for content_hash in stored - uploads:
+        delete_page_text(content_hash)
+
+    table = search_index_table()
+    if table is not None:
+        indexed = {row[0] for row in db.session.execute(text(f"SELECT DISTINCT content_hash FROM {table}"))}
+        for content_hash in (stored & uploads) - indexed:
+            index_page_text(content_hash, load_page_text(content_hash))
+        db.session.commit()
+
+def _full_text_query(keywords, dialect):
+    """
+    Builds an OR query matching any keyword: single words match as a prefix
+    ("filter" finds "filters"), multi-word keywords as a phrase.
+    """
+    terms = []
+    for keyword in keywords:
+        words = re.findall(r'\w+', keyword)
+        if not words:
+            continue
+        if len(words) == 1:
+            terms.append(f'{words[0]}*' if dialect == 'mysql' else f'"{words[0]}"*')
+        else:
+            terms.append('"' + ' '.join(words) + '"')
+    return (' ' if dialect == 'mysql' else ' OR ').join(terms)
+
+def search_all_documents(keywords, limit=SEARCH_ALL_LIMIT):
+    """
+    Searches every uploaded PDF through the full-text index.
+    Returns up to `limit` page hits, best first, as dicts with 'file_name',
+    'page_number', 'score' and the matching 'snippets' [(keyword, sentence)].
+    """
+    table = search_index_table()
+    query = _full_text_query(keywords, db.engine.dialect.name)
+    if table is None or not query:
+        return []
+
+    if table == 'page_text_fts':
+        rows = db.session.execute(text(
+            "SELECT content_hash, page_number, text, -bm25(page_text_fts) AS score "
+            "FROM page_text_fts WHERE page_text_fts MATCH :query "
+            "ORDER BY bm25(page_text_fts) LIMIT :limit"
+        ), {'query': query, 'limit': limit})
+    else:
+        rows = db.session.execute(text(
+            "SELECT content_hash, page_number, text, "
+            "MATCH (text) AGAINST (:query IN BOOLEAN MODE) AS score "
+            "FROM page_text_index WHERE MATCH (text) AGAINST (:query IN BOOLEAN MODE) "
+            "ORDER BY score DESC LIMIT :limit"
+        ), {'query': query, 'limit': limit})
+    rows = rows.all()
+
+    # Each hit is shown under the first name its content was uploaded as
+    uploads = {}
+    hashes = {row[0] for row in rows}
+    if hashes:
+        for content_hash, file_name in (db.session.query(UploadedFile.content_hash, UploadedFile.file_name)
+                                        .filter(UploadedFile.content_hash.in_(hashes))
+                                        .order_by(UploadedFile.id)):
+            uploads.setdefault(content_hash, file_name)
+
+    hits = []
+    for content_hash, page_number, page_text, score in rows:
+        if content_hash not in uploads:
+            continue
+        snippets = search_keywords_in_text(page_text, keywords)
+        if snippets:
+            hits.append({
+                'file_name': uploads[content_hash],
+                'page_number': int(page_number),
+                'score': round(float(score), 3),
+                'snippets': snippets,
+            })
+    return hits
+
+# "Insert, skipping rows whose search_key is already saved" per database
+INSERT_IGNORE_PREFIXES = {'mysql': 'IGNORE', 'sqlite': 'OR IGNORE'}
+
+def save_searches_to_database(file_name, rows, group_id=None):
+    """
+    Saves (keyword, page_number, snippet) search results of a file with one bulk
+    insert in a single transaction. Results already saved, or repeated in rows, are
+    skipped through the unique search_key. group_id records the keyword group the
+    results came from; it is part of the key, so a result already saved by hand or
+    by another group is still saved for this one.
+    Returns the number of results saved.
+    """
+    values = {}
+    for keyword, page_number, snippet in rows:
+        key = search_key(file_name, keyword, page_number, snippet, group_id)
+        values.setdefault(key, {
+            'file_name': file_name,
+            'keyword': keyword,
+            'page_number': page_number,
+            'snippet': snippet,
+            'group_id': group_id,
+            'search_key': key,
+        })
+    if not values:
+        return 0
+
+    try:
+        prefix = INSERT_IGNORE_PREFIXES.get(db.engine.dialect.name)
+        if prefix is None:
+            # No insert-ignore here: leave out the keys that are already saved
+            saved = {key for (key,) in db.session.query(Search.search_key).filter(Search.search_key.in_(list(values)))}
+            values = {key: row for key, row in values.items() if key not in saved}
+            if not values:
+                return 0
+            statement = insert(Search.__table__)
+        else:
+            statement = insert(Search.__table__).prefix_with(prefix)
+        result = db.session.execute(statement, list(values.values()))
+        db.session.commit()
+        return result.rowcount
     except Exception as e:
         db.session.rollback()
         print("Error while saving to database:", e)
+        return 0
+
+# Uploaded PDFs are stored once per content, as by_hash/<content hash>.pdf under the
+# upload folder, and uploaded_files maps each upload's name to its content. PDFs left
+# directly in the upload folder (from before) are moved into the store when listed.
+BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, 'by_hash')
+
+# New uploads are ingested (page text stored and indexed, keyword groups run against
+# them) by this many background threads; large PDFs also use the pdf_text pool
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', 2))
+# Run every saved keyword group against each upload and save the hits with their group_id
+PERCOLATE_ON_UPLOAD = os.getenv('PERCOLATE_ON_UPLOAD', '1') == '1'
+
+_ingest_pool = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix='ingest')
+_ingest_lock = threading.Lock()
+# file_name -> {'content_hash', 'state' (queued/running/done/failed), 'error', 'future', ...}
+_ingestion = {}
+
+def blob_path(content_hash):
+    return os.path.join(BLOB_FOLDER, f"{content_hash}.pdf")
+
+def upload_path(file_name):
+    """
+    Returns the stored PDF for an upload name, or None if there's no such upload.
+    """
+    upload = UploadedFile.query.filter_by(file_name=file_name).first()
+    if upload is not None and os.path.isfile(blob_path(upload.content_hash)):
+        return blob_path(upload.content_hash)
+    return None
+
+def _store_blob(source_path, content_hash, move=False):
+    """
+    Puts a PDF in the store under its content hash. Returns False if that content was
+    already stored (the source is left as it was, or removed if move is set).
+    """
+    os.makedirs(BLOB_FOLDER, exist_ok=True)
+    target = blob_path(content_hash)
+    if os.path.exists(target):
+        if move:
+            os.remove(source_path)
+        return False
+    if move:
+        os.replace(source_path, target)
+    else:
+        shutil.copyfile(source_path, target)
+    return True
+
+def unique_upload_name(file_name):
+    """
+    Returns file_name, or file_name with _2, _3... added if that name is already taken.
+    """
+    stem, ext = os.path.splitext(file_name)
+    taken = {row.file_name for row in db.session.query(UploadedFile.file_name).filter(UploadedFile.file_name.like(f"{stem}%"))}
+    candidate, n = file_name, 1
+    while candidate in taken:
+        n += 1
+        candidate = f"{stem}_{n}{ext}"
+    return candidate
+
+def _add_upload(file_name, content_hash):
+    """
+    Maps file_name to content_hash. A name already used for other content is not
+    overwritten; the upload gets the next free name instead. Returns the name used.
+    """
+    existing = UploadedFile.query.filter_by(file_name=file_name).first()
+    if existing is not None and existing.content_hash == content_hash:
+        return file_name
+    for _ in range(5):
+        name = unique_upload_name(file_name)
+        try:
+            db.session.add(UploadedFile(file_name=name, content_hash=content_hash))
+            db.session.commit()
+            return name
+        except IntegrityError:
+            # Name taken by a concurrent upload
+            db.session.rollback()
+    raise RuntimeError(f"Could not find a free name for {file_name}")
+
+def save_upload(pdf_file):
+    """
+    Stores an uploaded PDF by content and records its name.
+    Returns (file_name, content_hash, duplicate_of), where file_name may differ from
+    the uploaded name if that was taken by other content, and duplicate_of names an
+    earlier upload with the same content (None if the content is new).
+    """
+    os.makedirs(BLOB_FOLDER, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(suffix='.pdf', dir=BLOB_FOLDER)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter(lambda: pdf_file.stream.read(1024 * 1024), b''):
+                digest.update(chunk)
+                f.write(chunk)
+        content_hash = digest.hexdigest()
+        _store_blob(tmp_path, content_hash, move=True)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    earlier = UploadedFile.query.filter_by(content_hash=content_hash).order_by(UploadedFile.id).first()
+    file_name = _add_upload(secure_filename(pdf_file.filename), content_hash)
+    duplicate_of = earlier.file_name if earlier is not None and earlier.file_name != file_name else None
+    return file_name, content_hash, duplicate_of
+
+def adopt_loose_uploads():
+    """
+    Moves PDFs saved directly in the upload folder into the store, keeping their names.
+    """
+    for name in sorted(os.listdir(UPLOAD_FOLDER)):
+        path = os.path.join(UPLOAD_FOLDER, name)
+        if not (name.lower().endswith('.pdf') and os.path.isfile(path)):
+            continue
+        try:
+            content_hash = file_content_hash(path)
+            if UploadedFile.query.filter_by(file_name=name).first() is None:
+                db.session.add(UploadedFile(file_name=name, content_hash=content_hash))
+                db.session.commit()
+            _store_blob(path, content_hash, move=True)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error moving {name} into the upload store: {e}")
+
+def list_uploads():
+    """
+    Returns {file_name: content_hash} of every upload, by name.
+    """
+    adopt_loose_uploads()
+    return {row.file_name: row.content_hash for row in
+            db.session.query(UploadedFile.file_name, UploadedFile.content_hash).order_by(UploadedFile.file_name)}
+
+def processing_uploads(uploads):
+    """
+    Returns the names among uploads whose ingestion is queued or running.
+    """
+    return {file_name for file_name in uploads
+            if _ingestion.get(file_name, {}).get('state') in ('queued', 'running')}
+
+def group_keywords(group):
+    """
+    Returns a keyword group's keywords, stripped, without duplicates or empty strings.
+    """
+    return list(dict.fromkeys(filter(None, [k.strip() for k in group.keywords.split(",")])))
+
+def percolate_document(file_path, file_name):
+    """
+    Runs every saved keyword group against an uploaded PDF's stored page text and
+    saves the hits with the group's id. Returns the number of results saved.
+    """
+    groups = KeywordGroup.query.all()
+    if not groups:
+        return 0
+    pages_text = get_page_texts(file_path)
+    saved = 0
+    for group in groups:
+        keywords = group_keywords(group)
+        if not keywords:
+            continue
+        results = pdf_text.search_pages(pages_text, keywords)
+        rows = [
+            (keyword, int(page.split(' ')[1]), snippet)
+            for page, page_results in results.items()
+            for keyword, snippet in page_results
+        ]
+        saved += save_searches_to_database(file_name, rows, group_id=group.id)
+    return saved
+
+def first_upload_of(file_name, content_hash):
+    """
+    Returns the name under which the content of file_name was first uploaded, or None
+    if file_name is the first upload of that content.
+    """
+    upload = UploadedFile.query.filter_by(file_name=file_name).first()
+    if upload is None:
+        return None
+    earlier = (UploadedFile.query
+               .filter(UploadedFile.content_hash == content_hash, UploadedFile.id < upload.id)
+               .order_by(UploadedFile.id).first())
+    return earlier.file_name if earlier is not None else None
+
+def _ingest(job, file_name, content_hash, wait_for):
+    if wait_for is not None:
+        # Same content queued under another name: let that job extract it
+        try:
+            wait_for.result()
+        except Exception:
+            pass
+    job['state'] = 'running'
+    started = time.perf_counter()
+    with app.app_context():
+        try:
+            path = blob_path(content_hash)
+            store_page_text(path, file_name)
+            if PERCOLATE_ON_UPLOAD:
+                # Duplicate content is linked to its first upload, whose group
+                # results already cover it
+                job['group_results_file'] = first_upload_of(file_name, content_hash) or file_name
+                if job['group_results_file'] == file_name:
+                    job['group_results'] = percolate_document(path, file_name)
+            job['state'] = 'done'
+        except Exception as e:
+            db.session.rollback()
+            job.update(state='failed', error=str(e))
+            print(f"Error ingesting {file_name}: {e}")
+    job['seconds'] = round(time.perf_counter() - started, 3)
+
+def queue_ingestion(file_name, content_hash):
+    """
+    Queues an upload to have its page text stored and indexed (unless that content
+    already is) and the keyword groups run against it, in the background.
+    """
+    with _ingest_lock:
+        job = _ingestion.get(file_name)
+        if job is not None and job['content_hash'] == content_hash and job['state'] in ('queued', 'running'):
+            return job['future']
+        wait_for = next((other['future'] for other in _ingestion.values()
+                         if other['content_hash'] == content_hash and other['state'] in ('queued', 'running')), None)
+        job = {'content_hash': content_hash, 'state': 'queued', 'error': None, 'queued_at': time.time()}
+        _ingestion[file_name] = job
+        job['future'] = _ingest_pool.submit(_ingest, job, file_name, content_hash, wait_for)
+        return job['future']
+
+def queue_unstored_uploads():
+    """
+    Queues ingestion of uploads whose content isn't stored yet (uploaded before the
+    page-text store, or cut off by a restart), so searches never have to extract.
+    """
+    adopt_loose_uploads()
+    stored = {content_hash for (content_hash,) in db.session.query(UploadedDocument.content_hash)}
+    uploads = {}
+    for content_hash, file_name in db.session.query(UploadedFile.content_hash, UploadedFile.file_name).order_by(UploadedFile.id):
+        uploads.setdefault(content_hash, file_name)
+    for content_hash, file_name in uploads.items():
+        if content_hash not in stored and file_name not in _ingestion and os.path.isfile(blob_path(content_hash)):
+            queue_ingestion(file_name, content_hash)
+
+def ingestion_status(file_name):
+    """
+    Returns the ingestion state of an upload as a dict, or None if there's no such upload.
+    """
+    upload = UploadedFile.query.filter_by(file_name=file_name).first()
+    if upload is None:
+        return None
+    document = UploadedDocument.query.filter_by(content_hash=upload.content_hash).first()
+    job = _ingestion.get(file_name)
+    if job is not None and job['content_hash'] == upload.content_hash:
+        state = job['state']
+    else:
+        state = 'done' if document is not None else 'pending'
+    other_names = [row.file_name for row in db.session.query(UploadedFile.file_name)
+                   .filter(UploadedFile.content_hash == upload.content_hash, UploadedFile.file_name != file_name)
+                   .order_by(UploadedFile.id)]
+    return {
+        'file_name': file_name,
+        'content_hash': upload.content_hash,
+        'state': state,
+        'error': job['error'] if job is not None and state == 'failed' else None,
+        'page_count': document.page_count if document is not None else None,
+        'same_content_as': other_names,
+        'group_results': job.get('group_results') if job is not None else None,
+        'group_results_file': job.get('group_results_file') if job is not None else None,
+    }
 
 @app.route('/', methods=["GET", "POST"])
 @login_required
 def home():
     results = {}
     file_name = None
+    all_results = None
+    searched_keywords = None
     groups = KeywordGroup.query.all()
     
     # Get list of uploaded documents
-    uploaded_files = []
-    if os.path.exists(app.config['UPLOAD_FOLDER']):
-        uploaded_files = [f for f in os.listdir(app.config['UPLOAD_FOLDER']) if f.endswith('.pdf')]
+    uploads = list_uploads()
     
     if request.method == "POST":
-        group_id = request.form.get("keyword_group")
-        keywords = request.form.get("keywords", "").split(",")
-        
-        if group_id:
-            group = KeywordGroup.query.get(group_id)
-            if group:
-                keywords.extend(group.keywords.split(","))
+        keywords = search_form_keywords()
         
-        # Check if we're using a selected file or a new upload
+        # Check if we're searching every upload, a selected file or a new upload
         selected_file = request.form.get("selected_file")
-        if selected_file and keywords:
+        if request.form.get("search_all"):
+            if keywords:
+                all_results = search_all_documents(keywords)
+                searched_keywords = ", ".join(sorted(keywords))
+        elif selected_file and keywords:
             # Use the selected file from the uploaded documents
             file_name = selected_file
-            pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], selected_file)
-            
-            # Remove duplicates and empty strings from keywords
-            keywords = list(set(filter(None, [k.strip() for k in keywords])))
-            results = search_keywords_in_pdf(pdf_path, keywords)
+            pdf_path = upload_path(selected_file)
+            if pdf_path is None:
+                flash(f'{selected_file} is not an uploaded document', 'danger')
+            else:
+                results = search_keywords_in_pdf(pdf_path, keywords)
         
         else:
             # Handle new file upload
             pdf_file = request.files.get("pdf_file")
-            if pdf_file and keywords:
-                original_filename = pdf_file.filename
-                safe_filename = secure_filename(original_filename)
-                pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], safe_filename)
-                pdf_file.save(pdf_path)
-                file_name = safe_filename
-                
-                # Remove duplicates and empty strings
-                keywords = list(set(filter(None, [k.strip() for k in keywords])))
-                results = search_keywords_in_pdf(pdf_path, keywords)
+            if pdf_file and pdf_file.filename:
+                file_name, content_hash, duplicate_of = save_upload(pdf_file)
+                pdf_path = blob_path(content_hash)
+                uploads = list_uploads()
+                if duplicate_of:
+                    flash(f'{file_name} has the same content as {duplicate_of}; the stored copy is reused', 'info')
+                elif file_name != secure_filename(pdf_file.filename):
+                    flash(f'A different {secure_filename(pdf_file.filename)} is already uploaded; this one was saved as {file_name}', 'warning')
+                if keywords:
+                    # Extract the page text once, at upload time
+                    try:
+                        store_page_text(pdf_path, file_name)
+                    except Exception as e:
+                        db.session.rollback()
+                        print(f"Error storing page text for {file_name}: {e}")
+                    results = search_keywords_in_pdf(pdf_path, keywords)
+                else:
+                    flash(f'{file_name} uploaded; it is being processed in the background', 'success')
+                # Indexing and keyword groups; the text is already stored if it was searched
+                queue_ingestion(file_name, content_hash)
     
     return render_template('index.html', 
                          results=results, 
                          file_name=file_name, 
+                         all_results=all_results,
+                         searched_keywords=searched_keywords,
                          groups=groups,
                          username=current_user.username,
-                         uploaded_files=uploaded_files)
+                         uploaded_files=list(uploads),
+                         processing_files=processing_uploads(uploads))
+
+def search_form_keywords():
+    """
+    Returns the keywords of a search form: the typed ones plus the selected keyword
+    group's, stripped, without duplicates or empty strings.
+    """
+    keywords = request.form.get("keywords", "").split(",")
+    group_id = request.form.get("keyword_group")
+    if group_id:
+        group = KeywordGroup.query.get(group_id)
+        if group:
+            keywords.extend(group.keywords.split(","))
+    return list(set(filter(None, [k.strip() for k in keywords])))
+
+def search_stream_events(pdf_path, file_name, keywords):
+    """
+    Yields the events of a streaming search as dicts: "start", then "page" for each
+    page with hits and "progress" after each page range, in page order, then "done".
+    Text that wasn't stored yet is extracted as it's searched and stored at the end.
+    If the client goes away the generator is closed, which cancels the ranges still queued.
+    """
+    started = time.perf_counter()
+    try:
+        pages_text = stored_page_text(pdf_path)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Page text store unavailable, extracting directly: {e}")
+        pages_text = None
+
+    pages_with_hits = 0
+    if pages_text is not None:
+        yield {'type': 'start', 'file_name': file_name, 'keywords': keywords, 'pages': len(pages_text)}
+        for pages_done, hits in pdf_text.iter_search_pages(pages_text, keywords):
+            for page_num, page_results in hits:
+                yield {'type': 'page', 'page': page_num, 'results': page_results}
+            pages_with_hits += len(hits)
+            yield {'type': 'progress', 'pages_done': pages_done, 'pages': len(pages_text)}
+    else:
+        extracted = []
+        page_count = pdf_text.page_count_of(pdf_path)
+        yield {'type': 'start', 'file_name': file_name, 'keywords': keywords, 'pages': page_count}
+        for pages_done, page_count, range_text, hits in pdf_text.iter_extract_and_search(pdf_path, keywords):
+            extracted.extend(range_text)
+            for page_num, page_results in hits:
+                yield {'type': 'page', 'page': page_num, 'results': page_results}
+            pages_with_hits += len(hits)
+            yield {'type': 'progress', 'pages_done': pages_done, 'pages': page_count}
+        try:
+            store_page_text(pdf_path, file_name, pages_text=extracted)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error storing page text for {file_name}: {e}")
+
+    yield {'type': 'done', 'pages_with_hits': pages_with_hits,
+           'seconds': round(time.perf_counter() - started, 3)}
+
+@app.route('/search/stream', methods=['POST'])
+@login_required
+def search_stream():
+    """
+    Streaming version of the single-document search on the home page. Takes the same
+    form and answers with newline-delimited JSON events (see search_stream_events)
+    as pages are searched, so results can be shown before the whole PDF is done.
+    """
+    keywords = search_form_keywords()
+    selected_file = request.form.get("selected_file")
+    if selected_file:
+        file_name = selected_file
+        pdf_path = upload_path(file_name)
+        if pdf_path is None:
+            return jsonify({'error': f'{selected_file} is not an uploaded document'}), 404
+    else:
+        pdf_file = request.files.get("pdf_file")
+        if not pdf_file or not pdf_file.filename:
+            return jsonify({'error': 'No PDF selected'}), 400
+        file_name, content_hash, _ = save_upload(pdf_file)
+        pdf_path = blob_path(content_hash)
+    uploaded = not selected_file
+    if not keywords:
+        if uploaded:
+            queue_ingestion(file_name, content_hash)
+        return jsonify({'error': 'No keywords given'}), 400
+
+    def generate():
+        try:
+            for event in search_stream_events(pdf_path, file_name, keywords):
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            print(f"Error searching {file_name}: {e}")
+            yield json.dumps({'type': 'error', 'message': str(e)}) + "\n"
+        finally:
+            # After the stream has stored the page text (or was cancelled), so
+            # ingestion doesn't extract the same PDF alongside it
+            if uploaded:
+                queue_ingestion(file_name, content_hash)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/uploads', methods=['POST'])
+@login_required
+def api_upload():
+    """
+    Stores an uploaded PDF and queues its ingestion. Answers 202 with the upload's
+    status (see ingestion_status); poll /api/uploads/<file_name> until it's done.
+    """
+    pdf_file = request.files.get("pdf_file")
+    if not pdf_file or not pdf_file.filename:
+        return jsonify({'error': 'No PDF selected'}), 400
+    file_name, content_hash, duplicate_of = save_upload(pdf_file)
+    queue_ingestion(file_name, content_hash)
+    status = ingestion_status(file_name)
+    status['duplicate_of'] = duplicate_of
+    return jsonify(status), 202
+
+@app.route('/api/uploads/<path:file_name>')
+@login_required
+def api_upload_status(file_name):
+    status = ingestion_status(file_name)
+    if status is None:
+        return jsonify({'error': f'{file_name} is not an uploaded document'}), 404
+    return jsonify(status)
 
 @app.route('/keyword_groups', methods=['GET'])
 @login_required
@@ -297,7 +1177,7 @@ def edit_keyword_group(id):
     return render_template('keyword_groups.html', edit_group=group, groups=KeywordGroup.query.all())
 
 def get_uploaded_documents():
-    return os.listdir(UPLOAD_FOLDER)
+    return list(list_uploads())
 
 @app.route ('/save', methods = ["POST"])
 def save():
@@ -306,84 +1186,120 @@ def save():
     page_number = request.form.getlist("page_number")
     snippet = request.form.getlist("snippet")
 
-    seen = set()
-    for i in range(len(keyword)):
+    rows = []
+    for kw, page, snip in zip(keyword, page_number, snippet):
         try:
-            page_num = int(page_number[i])
-        except Exception:
-            page_num = None
-        dedupe_key = (
-            (file_name or "").strip().lower(),
-            (keyword[i] or "").strip().lower(),
-            page_num,
-            (snippet[i] or "").strip().lower(),
-        )
-        if dedupe_key in seen:
+            rows.append((kw, int(page), snip))
+        except (TypeError, ValueError):
             continue
-        seen.add(dedupe_key)
+    save_searches_to_database(file_name, rows)
+    return redirect('/history')
 
-        if page_num is None:
-            continue
+# Projects per page of the history, and snippets fetched per request when one is expanded
+HISTORY_PROJECTS_PER_PAGE = 20
+HISTORY_SNIPPETS_PER_PAGE = 50
 
-        # Prevent saving duplicates that already exist in the database
-        norm_file = (file_name or "").strip().lower()
-        norm_kw = (keyword[i] or "").strip().lower()
-        norm_snip = (snippet[i] or "").strip().lower()
-        existing = (
-            db.session.query(Search.id)
-            .filter(
-                func.lower(Search.file_name) == norm_file,
-                func.lower(Search.keyword) == norm_kw,
-                Search.page_number == page_num,
-                func.lower(Search.snippet) == norm_snip,
-            )
-            .first()
+def request_int(name, default, minimum=1, maximum=None):
+    """
+    Returns an integer query parameter clamped to [minimum, maximum], or default.
+    """
+    try:
+        value = int(request.args.get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    value = max(minimum, value)
+    return min(value, maximum) if maximum is not None else value
+
+def history_page(page, per_page):
+    """
+    Returns one page of saved-search projects (file names, in order) with their
+    result counts and per-keyword counts, all counted by the database.
+    """
+    total = db.session.query(func.count(func.distinct(Search.file_name))).scalar() or 0
+    projects = (
+        db.session.query(Search.file_name, func.count(Search.id))
+        .group_by(Search.file_name)
+        .order_by(Search.file_name)
+        .limit(per_page)
+        .offset((page - 1) * per_page)
+        .all()
+    )
+    keywords = {}
+    if projects:
+        rows = (
+            db.session.query(Search.file_name, Search.keyword, func.count(Search.id))
+            .filter(Search.file_name.in_([file_name for file_name, _ in projects]))
+            .group_by(Search.file_name, Search.keyword)
+            .order_by(Search.file_name, Search.keyword)
         )
-        if existing is not None:
-            continue
-        save_search_to_database(file_name, keyword[i], page_num, snippet[i])
-    return redirect('/history')
+        for file_name, keyword, count in rows:
+            keywords.setdefault(file_name, []).append({'keyword': keyword, 'count': count})
+    return {
+        'page': page,
+        'per_page': per_page,
+        'pages': max(1, -(-total // per_page)),
+        'total_projects': total,
+        'projects': [
+            {'file_name': file_name, 'count': count, 'keywords': keywords.get(file_name, [])}
+            for file_name, count in projects
+        ],
+    }
+
+def history_snippets(file_name, keyword, offset, limit):
+    """
+    Returns saved results of one project's keyword in page order, limit at a time.
+    """
+    rows = (
+        db.session.query(Search.id, Search.page_number, Search.snippet)
+        .filter(Search.file_name == file_name, Search.keyword == keyword)
+        .order_by(Search.page_number, Search.id)
+        .offset(offset)
+        .limit(limit + 1)
+        .all()
+    )
+    return {
+        'file_name': file_name,
+        'keyword': keyword,
+        'offset': offset,
+        'results': [{'id': row.id, 'page_number': row.page_number, 'snippet': row.snippet} for row in rows[:limit]],
+        'has_more': len(rows) > limit,
+    }
 
 @app.route ('/history')
 @login_required
 def history():
-    # Get all search results ordered by file name and keyword
-    all_results = db.session.query(Search).order_by(Search.file_name, Search.keyword).all()
-    
-    # Group results by project name first, then by keyword
-    grouped_results = {}
-    seen = set()
-    for result in all_results:
-        project_name = result.file_name
-        if project_name not in grouped_results:
-            grouped_results[project_name] = {
-                'count': 0,
-                'keywords': {}
-            }
-        
-        keyword = result.keyword
-        if keyword not in grouped_results[project_name]['keywords']:
-            grouped_results[project_name]['keywords'][keyword] = []
-
-        dedupe_key = (
-            (result.file_name or "").strip().lower(),
-            (result.keyword or "").strip().lower(),
-            int(result.page_number) if result.page_number is not None else None,
-            (result.snippet or "").strip().lower(),
-        )
-        if dedupe_key in seen:
-            continue
-        seen.add(dedupe_key)
+    # Projects and counts only; each keyword's snippets are fetched from
+    # /api/history/snippets when it's expanded
+    page = request_int('page', 1)
+    per_page = request_int('per_page', HISTORY_PROJECTS_PER_PAGE, maximum=100)
+    return render_template("history.html", history=history_page(page, per_page),
+                           snippets_per_page=HISTORY_SNIPPETS_PER_PAGE)
 
-        grouped_results[project_name]['keywords'][keyword].append(result.__dict__)
-        grouped_results[project_name]['count'] += 1
+@app.route('/api/history')
+@login_required
+def api_history():
+    page = request_int('page', 1)
+    per_page = request_int('per_page', HISTORY_PROJECTS_PER_PAGE, maximum=100)
+    return jsonify(history_page(page, per_page))
 
-    return render_template("history.html", grouped_results=grouped_results)
+@app.route('/api/history/snippets')
+@login_required
+def api_history_snippets():
+    file_name = request.args.get('file_name')
+    keyword = request.args.get('keyword')
+    if file_name is None or keyword is None:
+        return jsonify({'error': 'file_name and keyword are required'}), 400
+    offset = request_int('offset', 0, minimum=0)
+    limit = request_int('limit', HISTORY_SNIPPETS_PER_PAGE, maximum=500)
+    return jsonify(history_snippets(file_name, keyword, offset, limit))
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
     try:
-        return send_from_directory(UPLOAD_FOLDER, filename, as_attachment=False)
+        pdf_path = upload_path(filename)
+        if pdf_path is None:
+            return "File not found", 404
+        return send_file(pdf_path, mimetype='application/pdf', download_name=filename, as_attachment=False)
     except Exception as e:
         print(f"Error serving file: {e}")
         return "File not found", 404
@@ -407,14 +1323,27 @@ def delete_save(id):
 @app.route('/delete/<filename>', methods=["POST"])
 @login_required
 def delete_file(filename):
-    file_path = os.path.join(UPLOAD_FOLDER, filename)
     try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        upload = UploadedFile.query.filter_by(file_name=filename).first()
+        if upload is not None:
+            content_hash = upload.content_hash
+            db.session.delete(upload)
+            db.session.commit()
+            # The content stays while another name still refers to it
+            if UploadedFile.query.filter_by(content_hash=content_hash).first() is None:
+                if os.path.exists(blob_path(content_hash)):
+                    os.remove(blob_path(content_hash))
+                try:
+                    delete_page_text(content_hash)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Error deleting stored page text for {filename}: {e}")
+            _ingestion.pop(filename, None)
             flash('File deleted successfully', 'success')
         else:
-            flash(f'File not found at path: {file_path}', 'error')
+            flash(f'File not found: {filename}', 'error')
     except Exception as e:
+        db.session.rollback()
         flash(f'Error deleting file: {str(e)}', 'error')
     return redirect(url_for('home'))
 
@@ -498,8 +1427,32 @@ def logout():
     flash('Logged out successfully.', 'success')
     return redirect(url_for('login'))
 
+APP_HOST = os.getenv('APP_HOST', '0.0.0.0')
+APP_PORT = int(os.getenv('APP_PORT', 8000))
+
+def open_browser_when_listening(timeout=30):
+    """
+    Opens the default web browser on the app once the server accepts connections.
+    """
+    url = f"http://127.0.0.1:{APP_PORT}/"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', APP_PORT), timeout=0.2):
+                break
+        except OSError:
+            time.sleep(0.05)
+    mark_startup('listening')
+    webbrowser.open(url)
+
 if __name__ == "__main__":
+    if '--migrate' in sys.argv:
+        if not migrate():
+            sys.exit(1)
+        print(f"Database schema is at version {SCHEMA_VERSION}")
+        sys.exit(0)
+    ensure_schema()
     # Open the default web browser
-    webbrowser.open('http://APP_HOST:APP_PORT/')
+    threading.Thread(target=open_browser_when_listening, daemon=True).start()
     # Run the Flask app
-    app.run(host="0.0.0.0", port=8000, debug=False)
\ No newline at end of file
+    app.run(host=APP_HOST, port=APP_PORT, debug=False)
\ No newline at end of file